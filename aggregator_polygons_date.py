@@ -5,6 +5,25 @@
 Name                 : Aggregator polygon date
 Description          : Union neighbour polygon from SISCOM 'ibama.alerta' and create/update 'agregado.alert_aggregated'
 Arguments            : Optional parameter -c (create) otherwise update
+                       Optional parameter -e (engine): chain (default) or components
+                       Optional parameter -w (workers): total of processes, create (only components engine, groups not the same of chain) and update
+                       Optional parameter -s (server): update searching the groups for merge in DB
+                       Optional parameter -b (batch): total of features by transaction in DB (create, update is one transaction)
+                       Optional parameter --snapshot: directory for save the alerts loaded
+                       Optional parameter --from-snapshot: directory with alerts, without the datasource of alerts (only --sink)
+                       Optional parameter --checkpoint: file with the state of create, saved periodically
+                       Optional parameter -r (resume): create continuing from the checkpoint
+                       Optional parameter --validity-cache: SQLite file, cache of ST_IsValid and in country of alerts
+                       Optional parameter --metrics: JSON file with counters and times by stage
+                       Optional parameter --metrics-metadata: write the metrics in metadata (line 'Metrics:' of DESCRIPTION) of aggregated table
+                       Optional parameter --source: alerts from 'PG: ...', GeoPackage or FlatGeobuf (default PostGIS)
+                       Optional parameter --sink: aggregated table in 'PG: ...' or GeoPackage (default source or PostGIS)
+                       Optional parameter --host, --db: PostGIS (USERPG and PWDPG in OS enviroment)
+                       Optional parameter --table-alert, --table-aggregated, --table-country: names of tables (layers)
+                       Optional parameter --grid: precision grid (meters) of geometry of groups
+                       Optional parameter --simplify: tolerance (meters) of simplification of geometry of groups
+                       Optional parameter --pipeline: depth of queues, read of alerts and write of groups in threads
+                       Optional parameter --page-size: total of alerts by page (SQL by keyset of objectid), 0 for one SQL
 
                        -------------------
 Begin                : 2018-08-24
@@ -26,14 +45,26 @@ Update: 2020-03-13
 
 Implementation: Generator and memory
 
+Membership table '<aggregated table>_member' ( id_group, objectid, date ): one row by alert of group,
+indexes of 'id_group' and 'objectid'. Create writes it with the aggregated table (same swap),
+update moves the rows of merged groups and adds the rows of new groups (same transaction of aggregated table).
 """
 
-import os, sys
+import os, sys, json, uuid
 from datetime import datetime
 import argparse
 from enum import Enum
 
-from aggregatorgroup import ItemInvalidUnion, AggregatorParams, ChainPolygons, AggregatorGroup
+from aggregatorgroup import ItemInvalidUnion, AggregatorParams, ChainPolygons, EngineGroup, AggregatorGroup
+from aggregatorparallel import AggregatorParallel
+from aggregatorwriter import LayerWriter, MemberWriter
+from alertstore import AlertStore
+from aggregatorcheckpoint import Checkpoint
+from alertvalidity import AlertValidity
+from aggregatormetrics import Metrics
+from aggregatorsource import AggregatorSource
+from aggregatorupdate import AggregatorUpdate
+from aggregatorpipeline import Pipeline
 
 try:
     from osgeo import ogr, osr
@@ -45,52 +76,99 @@ class StatusProcess(Enum):
     SUCCESS = 'Success'
 
 class AggregatorGroupPG():
-    # setPostgres
-    dsPG = None
-    str_conn = None
+    # setDataSources
+    dsPG = None # Datasource of aggregated table (sink)
+    source = None # AggregatorSource of alerts
+    sink = None # AggregatorSource of aggregated table, can be the same of source
 
     tableAlert = 'ibama.alerta'
     tableAgregated = 'agregado.alert_aggregated'
+    tableCountry = 'cb.lim_pais_a'
+    tableStaging = 'alert_aggregated_new' # Prefix of temporary table (pg_temp, name by run), update in server
     meta_item_description = 'DESCRIPTION'
+    labelMetrics = 'Metrics:' # Line of DESCRIPTION
     field_carga = 'dt_carga'
     labelDatetime = 'Started processing:'
         
     dtInit = None
 
     @staticmethod
-    def setPostgres(user, password, host, db):
-        AggregatorGroupPG.str_conn = f"PG: host={host} dbname={db} user={user} password={password}"
-        AggregatorGroupPG.dsPG = ogr.Open( AggregatorGroupPG.str_conn, update=1 )
+    def setDataSources(connectionSource, connectionSink):
+        """
+        Open the datasources (AggregatorSource) of alerts and of aggregated table,
+        with the same connection, one datasource
+        connectionSource: None, alerts from snapshot (the source is not opened)
+        """
+        sink = AggregatorSource( connectionSink )
+        r = sink.open( update=True )
+        if not r['isOk']:
+            return r
+        source = sink
+        if connectionSource is None:
+            source = None
+        elif not connectionSource == connectionSink:
+            source = AggregatorSource( connectionSource )
+            r = source.open()
+            if not r['isOk']:
+                return r
+        AggregatorGroupPG.source, AggregatorGroupPG.sink = source, sink
+        AggregatorGroupPG.dsPG = sink.ds
+        return { 'isOk': True }
 
     @staticmethod
-    def openPostgres():
-        AggregatorGroupPG.dsPG = ogr.Open( AggregatorGroupPG.str_conn, update=1 )
+    def openSink():
+        AggregatorGroupPG.sink.open( update=True )
+        AggregatorGroupPG.dsPG = AggregatorGroupPG.sink.ds
+
+    @staticmethod
+    def getLastUpdate():
+        def getItemStarted(values):
+            for item in values:
+                if not item.find( AggregatorGroupPG.labelDatetime ) == -1:
+                    return item
+            return None
+
+        layer = AggregatorGroupPG.dsPG.GetLayerByName( AggregatorGroupPG.tableAgregated )
+        if layer is None:
+            return { 'isOk': False, 'message': f"Missing '{AggregatorGroupPG.tableAgregated}'" }
+        metadata = layer.GetMetadata()
+        description = metadata[ AggregatorGroupPG.meta_item_description ]
+        values = description.split('\n')
+        item = getItemStarted( values )
+        if item is None:
+            return { 'isOk': False, 'message': "Missing '{}' in comment from {}".format( AggregatorGroupPG.labelDatetime, AggregatorGroupPG.tableAgregated ) }
+        idx = item.find( AggregatorGroupPG.labelDatetime ) + len( AggregatorGroupPG.labelDatetime ) + 1
+        date_time = item[idx:]
+        layer = None
+        return { 'isOk': True, 'date_time': date_time }
 
     @staticmethod
-    def setProcessParams(printStatus, useFilterDatetime=False):
-        def getSqlLayerAlert():
-            def getLastUpdate():
-                def getItemStarted(values):
-                    for item in values:
-                        if not item.find( AggregatorGroupPG.labelDatetime ) == -1:
-                            return item
-                    return None
-
-                layer = AggregatorGroupPG.dsPG.GetLayerByName( AggregatorGroupPG.tableAgregated )
-                if layer is None:
-                    return { 'isOk': False, 'message': f"Missing '{AggregatorGroupPG.tableAgregated}'" }
-                metadata = layer.GetMetadata()
-                description = metadata[ AggregatorGroupPG.meta_item_description ]
-                values = description.split('\n')
-                item = getItemStarted( values )
-                if item is None:
-                    return { 'isOk': False, 'message': "Missing '{}' in comment from {}".format( AggregatorGroupPG.labelDatetime, AggregatorGroupPG.tableAgregated ) }
-                idx = item.find( AggregatorGroupPG.labelDatetime ) + len( AggregatorGroupPG.labelDatetime ) + 1
-                date_time = item[idx:]
-                layer = None
-                return { 'isOk': True, 'date_time': date_time }
-
-            def getSql(date_time=None):
+    def setProcessParams(printStatus, useFilterDatetime=False, pathSnapshot=None, pathValidity=None):
+        """
+        pathValidity: cache (AlertValidity) of ST_IsValid and ST_Intersects with country, the SQL of alerts is without them
+        Source without PostGIS: the validity and the test with country are always by AlertValidity (cache in memory if not pathValidity)
+        The alerts are loaded by pages (AggregatorSource.getPagesAlert)
+        """
+        def getQueryAlert():
+            def getFilter(date_time=None):
+                """
+                Return ( SQL for PostGIS, attribute filter for others )
+                """
+                a = 'a.' if source.isPostgres() else ''
+                where_att = [
+                    f"NOT {a}{AggregatorParams.field_date} IS NULL",
+                    f"NOT {a}{AggregatorParams.field_stage} IN ('FF+', 'CICATRIZ_DE_QUEIMADA', 'FF')"
+                ]
+                if not date_time is None:
+                    if source.isPostgres():
+                        v = "a.{} > TO_TIMESTAMP('{}', 'YYYY-MM-DD HH24:MI:SS.US')".format( AggregatorGroupPG.field_carga, date_time )
+                    else:
+                        v = "{} > '{}'".format( AggregatorGroupPG.field_carga, date_time.replace( ' ', 'T' ) ) # ISO 8601
+                    where_att.append( v )
+                attributeFilter = ' AND '.join( where_att )
+                if not source.isPostgres():
+                    return ( None, attributeFilter )
+
                 args = (
                     AggregatorParams.field_fid,
                     AggregatorParams.field_type,
@@ -98,65 +176,110 @@ class AggregatorGroupPG():
                     AggregatorParams.field_date,
                 )
                 s_select = "a.{}, a.{}, a.{}, a.{}, a.geom\n".format( *args )
-                s_from = "{} AS a, cb.lim_pais_a AS l\n".format( AggregatorGroupPG.tableAlert )
-                where_att = ["NOT a.data_imagem IS NULL", "NOT a.estagio IN ('FF+', 'CICATRIZ_DE_QUEIMADA', 'FF')" ]
+                s_from = "{} AS a, {} AS l\n".format( AggregatorGroupPG.tableAlert, AggregatorGroupPG.tableCountry )
                 where_geom = ["ST_IsValid( a.geom )", "ST_Intersects( a.geom, l.geom )" ]
-                if not date_time is None:
-                    v = "a.{} > TO_TIMESTAMP('{}', 'YYYY-MM-DD HH24:MI:SS.US')".format( AggregatorGroupPG.field_carga, date_time )
-                    where_att.append( v )
-                s_where = "{} AND {}".format( ' AND '.join( where_att ), ' AND '.join( where_geom ) )
-                return "SELECT {} FROM {} WHERE {}".format( s_select, s_from, s_where )
+                if not validity is None: # AlertValidity
+                    s_from = "{} AS a\n".format( AggregatorGroupPG.tableAlert )
+                    where_geom = []
+                s_where = ' AND '.join( where_att + where_geom )
+                return ( "SELECT {} FROM {} WHERE {}".format( s_select, s_from, s_where ), attributeFilter )
 
+            date_time = None
             if useFilterDatetime:
-                r = getLastUpdate()
+                r = AggregatorGroupPG.getLastUpdate()
                 if not r['isOk']:
                     return { 'isOk': False, 'message': r['message'] }
-                sqlAlert = getSql( r['date_time'] )
-            else:
-                sqlAlert = getSql()
-            try:
-                layer = AggregatorGroupPG.dsPG.ExecuteSQL( sqlAlert )
-            except Exception as error:
-                return { 'isOk': False, 'message': error }
-            if layer is None:
-                msg = f"Fail get SQL for Alert: {sqlAlert}"
-                return { 'isOk': False, 'message': msg }
-            return { 'isOk': True, 'layer': layer }
-
-        def createDsLayerMemoryAlert(layer):
-            def createDS():
-                memDS = 'memData'
-                driver = ogr.GetDriverByName('MEMORY')
-                ds = driver.CreateDataSource( memDS )
-                driver.Open(memDS, 1 ) # Write access
-                return ds
-
-            memLayerName = 'alert'
-            ds = createDS()
-            layer = ds.CopyLayer( layer, memLayerName, ['OVERWRITE=YES'] )
-            layer.ResetReading()
+                date_time = r['date_time']
+            sqlAlert, attributeFilter = getFilter( date_time )
+            return { 'isOk': True, 'sql': sqlAlert, 'attributeFilter': attributeFilter, 'date_time': date_time }
 
-            return { 'ds': ds, 'layer': layer }
+        def getFeaturesAlert(query):
+            args = ( AggregatorGroupPG.tableAlert, query['sql'], query['attributeFilter'], AggregatorParams.field_fid )
+            total = 0
+            for id, page in enumerate( source.getPagesAlert( *args ), 1 ):
+                total += len( page )
+                msg = f"Loading alerts in memory: page {id} ({total} alerts) - {datetime.now()}..."
+                printStatus( msg )
+                yield from page
 
+        source = AggregatorGroupPG.source
         # AggregatorParams: srs, ctArea and ctOrigin
-        layer = AggregatorGroupPG.dsPG.GetLayerByName( AggregatorGroupPG.tableAlert )
+        layer = source.getLayer( AggregatorGroupPG.tableAlert )
         if layer is None:
-            msg = f"Missing table '{AggregatorGroupPG.tableAlert}' in DB "
+            msg = f"Missing table '{AggregatorGroupPG.tableAlert}' in '{source.getLabel()}'"
             return { 'isOk': False, 'message': msg }
         AggregatorParams.setParams( layer )
         layer = None
 
-        # Get Layer from SQL alert
-        r = getSqlLayerAlert()
+        validity = None
+        if not pathValidity is None or not source.isPostgres():
+            r = source.getCountry( AggregatorGroupPG.tableCountry )
+            if not r['isOk']:
+                return r
+            if r['geometry'] is None:
+                msg = f"Missing '{AggregatorGroupPG.tableCountry}' in '{source.getLabel()}', alerts without test of country"
+                printStatus( msg, True )
+            validity = AlertValidity( ':memory:' if pathValidity is None else pathValidity, r['geometry'] )
+
+        # Get SQL (PostGIS) or filter of alerts
+        r = getQueryAlert()
         if not r['isOk']:
             return r
-        msg = f"Copying alerts in memory... - {datetime.now()}"
+        msg = f"Loading alerts in memory... - {datetime.now()}"
         printStatus( msg)
         
-        r = createDsLayerMemoryAlert( r['layer'] )
-        AggregatorParams.setAlert( r['ds'], r['layer'] )
+        try:
+            AggregatorParams.setAlertFeatures( getFeaturesAlert( r ), None if validity is None else validity.isAlertOk )
+        except Exception as error:
+            return { 'isOk': False, 'message': f"Fail load alerts of '{AggregatorGroupPG.tableAlert}': {error}" }
+        if not validity is None:
+            printStatus( validity.close()['message'], True )
+
+        msg = f"Loaded { len( AggregatorParams.alertStore ) } alerts in memory - {datetime.now()}"
+        printStatus( msg, True )
 
-        msg = f"Copied { r['layer'].GetFeatureCount()} alerts in memory - {datetime.now()}"
+        if not pathSnapshot is None:
+            metadata = {
+                'table': AggregatorGroupPG.tableAlert,
+                'srs': AggregatorParams.srs.ExportToWkt(),
+                'date_time': r['date_time'], # Filter of update, None for create
+                'created': str( datetime.now() )
+            }
+            t = Metrics.start()
+            AggregatorParams.alertStore.save( pathSnapshot, metadata )
+            Metrics.stop( 'snapshot_save', t, len( AggregatorParams.alertStore ) )
+            msg = f"Saved snapshot '{pathSnapshot}' - {datetime.now()}"
+            printStatus( msg, True )
+
+        return { 'isOk': True }
+
+    @staticmethod
+    def setProcessParamsSnapshot(printStatus, pathSnapshot, useFilterDatetime=False):
+        """
+        Alerts from snapshot (AlertStore.save), without the SQL of alerts.
+        For update, the snapshot must have the filter of last update of aggregated table.
+        """
+        t = Metrics.start()
+        r = AlertStore.open( pathSnapshot )
+        if not r['isOk']:
+            return r
+        Metrics.stop( 'snapshot_open', t, len( r['store'] ) )
+        metadata = r['metadata']
+        if not metadata['table'] == AggregatorGroupPG.tableAlert:
+            return { 'isOk': False, 'message': f"Snapshot '{pathSnapshot}' is from '{metadata['table']}'" }
+        if useFilterDatetime:
+            rLast = AggregatorGroupPG.getLastUpdate()
+            if not rLast['isOk']:
+                return rLast
+            if not metadata['date_time'] == rLast['date_time']:
+                args = ( pathSnapshot, metadata['date_time'], rLast['date_time'] )
+                msg = "Snapshot '{}' (update after {}) is not from last update ({})".format( *args )
+                return { 'isOk': False, 'message': msg }
+        elif not metadata['date_time'] is None:
+            return { 'isOk': False, 'message': f"Snapshot '{pathSnapshot}' is from update, expected create" }
+        AggregatorParams.setParamsWkt( metadata['srs'] )
+        AggregatorParams.setAlertStore( r['store'] )
+        msg = f"Opened snapshot '{pathSnapshot}' ({metadata['created']}): { len( r['store'] ) } alerts - {datetime.now()}"
         printStatus( msg, True )
 
         return { 'isOk': True }
@@ -171,13 +294,58 @@ class AggregatorGroupPG():
             statusProcess.value
         )
         metadata = "Author: Luiz Motta\nCopyright: IBAMA\nScript: {}\nCreated/Updated: {}\n{} {}\nStatus: {}".format(*args)
+        if AggregatorParams.hasPrecision():
+            args = ( AggregatorParams.grid_meter, AggregatorParams.simplify_meter )
+            metadata += "\nPrecision of geometry (meters): grid {}, simplify {}".format( *args )
         return metadata
 
     @staticmethod
-    def createLayerPostgres(geom_type, name, fields):
+    def setMetadataMetrics(report):
+        """
+        Line 'labelMetrics' (JSON) in DESCRIPTION, the metadata item of all drivers (PostgreSQL: COMMENT of table),
+        the others items are kept by PostgreSQL driver only from GDAL 3.9
+        """
+        layer = AggregatorGroupPG.dsPG.GetLayerByName( AggregatorGroupPG.tableAgregated )
+        if layer is None:
+            return { 'isOk': False, 'message': f"Missing '{AggregatorGroupPG.tableAgregated}'" }
+        description = layer.GetMetadataItem( AggregatorGroupPG.meta_item_description )
+        values = [] if description is None else description.split('\n')
+        values = [ v for v in values if not v.startswith( AggregatorGroupPG.labelMetrics ) ] # Previous run
+        values.append( "{} {}".format( AggregatorGroupPG.labelMetrics, json.dumps( report ) ) )
+        layer.StartTransaction()
+        layer.SetMetadataItem( AggregatorGroupPG.meta_item_description, '\n'.join( values ) )
+        layer.CommitTransaction()
+        return { 'isOk': True }
+
+    @staticmethod
+    def getFieldsAggregated():
+        return [
+            { 'name': 'id_group', 'type': ogr.OFTInteger },
+            { 'name': 'n_events', 'type': ogr.OFTInteger },
+            { 'name': 'ini_date', 'type': ogr.OFTString, 'width': 10 },
+            { 'name': 'end_date', 'type': ogr.OFTString, 'width': 10 },
+            { 'name': 'ini_ha', 'type': ogr.OFTReal },
+            { 'name': 'end_ha', 'type': ogr.OFTReal },
+            { 'name': 'n_fids', 'type': ogr.OFTInteger },
+            { 'name': 'fids', 'type': ogr.OFTString },
+            { 'name': 'dates_ev', 'type': ogr.OFTString, 'width': 200 },
+            { 'name': 'tipos', 'type': ogr.OFTString, 'width': 200 },
+            { 'name': 'estagios', 'type': ogr.OFTString, 'width': 200 }
+        ]
+
+    @staticmethod
+    def createLayerPostgres(geom_type, name, fields, options=None):
+        """
+        Replace the table 'name' if exists
+        """
         if not AggregatorGroupPG.dsPG.GetLayerByName( name ) is None:
             AggregatorGroupPG.dsPG.DeleteLayer( name )
-        layer = AggregatorGroupPG.dsPG.CreateLayer( name, srs=AggregatorParams.srs, geom_type=geom_type, options=['OVERWRITE=YES'] )
+        options = ['OVERWRITE=YES'] + ( [] if options is None else options )
+        return AggregatorGroupPG.createLayer( geom_type, name, fields, options )
+
+    @staticmethod
+    def createLayer(geom_type, name, fields, options=None):
+        layer = AggregatorGroupPG.dsPG.CreateLayer( name, srs=AggregatorParams.srs, geom_type=geom_type, options=[] if options is None else options )
         if layer is None:
             return { 'isOk': False, 'message': f"The table '{name}' not be created" }
         for item in fields:
@@ -188,7 +356,7 @@ class AggregatorGroupPG():
         return { 'isOk': True, 'layer': layer }
 
     @staticmethod
-    def createLayerInvalidUnion(errors):
+    def createLayerInvalidUnion(errors, printStatus):
         fields = ItemInvalidUnion.getFields()
         name = "{}_invalid_union".format( AggregatorGroupPG.tableAgregated )
         args = ( ogr.wkbUnknown, name, fields )
@@ -196,18 +364,15 @@ class AggregatorGroupPG():
         if not r['isOk']:
             return r
         layer = r['layer']
-        defn = layer.GetLayerDefn()
         keys = [ f['name'] for f in fields ]
         nameGeom = ItemInvalidUnion.getNameGeometry()
+        writer = LayerWriter( layer, printStatus, useCopy=True )
         for item in errors:
-            feat = ogr.Feature( defn )
-            for k in keys:
-                feat.SetField( k, item[ k ] )
-            feat.SetGeometry( item[ nameGeom ] )
-            layer.StartTransaction()
-            layer.CreateFeature( feat )
-            layer.CommitTransaction()
-            feat = None
+            value = { k: item[ k ] for k in keys }
+            value['geometry'] = item[ nameGeom ]
+            writer.add( value )
+        r = writer.close()
+        printStatus( r['message'], True )
         layer.StartTransaction()
         layer.SetMetadataItem( AggregatorGroupPG.meta_item_description, AggregatorGroupPG.getMetadata( StatusProcess.SUCCESS ) )
         layer.CommitTransaction()
@@ -215,181 +380,474 @@ class AggregatorGroupPG():
         return { 'isOk': True, 'table': name }
        
     @staticmethod
-    def saveGroups(aggGroups, printStatus):
-        def createMemoryLayerAggregator():
-            # Data Source
-            memDS = 'memDataAggregator'
-            driver = ogr.GetDriverByName('MEMORY')
-            ds = driver.CreateDataSource( memDS )
-            driver.Open( memDS, 1 ) # Write access
-            # Layer
-            layer = ds.CreateLayer( AggregatorGroupPG.tableAgregated, srs=AggregatorParams.srs, geom_type=ogr.wkbMultiPolygon )
-            fields = [
-                { 'name': 'id_group', 'type': ogr.OFTInteger },
-                { 'name': 'n_events', 'type': ogr.OFTInteger },
-                { 'name': 'ini_date', 'type': ogr.OFTString, 'width': 10 },
-                { 'name': 'end_date', 'type': ogr.OFTString, 'width': 10 },
-                { 'name': 'ini_ha', 'type': ogr.OFTReal },
-                { 'name': 'end_ha', 'type': ogr.OFTReal },
-                { 'name': 'n_fids', 'type': ogr.OFTInteger },
-                { 'name': 'fids', 'type': ogr.OFTString },
-                { 'name': 'dates_ev', 'type': ogr.OFTString, 'width': 200 },
-                { 'name': 'tipos', 'type': ogr.OFTString, 'width': 200 },
-                { 'name': 'estagios', 'type': ogr.OFTString, 'width': 200 }
+    def getNameMember():
+        """
+        Membership table of aggregated table: ( id_group, objectid, date ) by alert of group
+        """
+        return f"{AggregatorGroupPG.tableAgregated}_member"
+
+    @staticmethod
+    def isPostgres():
+        """
+        Datasource of aggregated table is PostgreSQL
+        """
+        return AggregatorGroupPG.dsPG.GetDriver().GetName() == 'PostgreSQL'
+
+    @staticmethod
+    def getNameSql(name):
+        """
+        Name of table quoted for SQL of datasource: PostgreSQL "schema"."table",
+        others (SQLite of GeoPackage) the name of layer, with the dot
+        """
+        if AggregatorGroupPG.isPostgres():
+            return '.'.join( f'"{part}"' for part in name.split('.') )
+        return f'"{name}"'
+
+    @staticmethod
+    def createIndexMember(name):
+        """
+        Index of 'id_group' (merge and delete of groups) and 'objectid' (group of alert).
+        The name of index starts with the name of table (renamed by swapTables, only PostgreSQL).
+        """
+        table = name.split('.')[-1]
+        for column in ( 'id_group', 'objectid' ):
+            sql = f'CREATE INDEX "{table}_{column}_idx" ON {AggregatorGroupPG.getNameSql( name )} ( {column} )'
+            AggregatorGroupPG.dsPG.ExecuteSQL( sql )
+
+    @staticmethod
+    def getLastIdGroup():
+        """
+        Greatest 'id_group' of aggregated table, the new groups of update continue from it
+        (the total of groups is less after merges)
+        """
+        ds = AggregatorGroupPG.dsPG
+        layer = ds.ExecuteSQL( f"SELECT MAX( id_group ) AS id_group FROM {AggregatorGroupPG.getNameSql( AggregatorGroupPG.tableAgregated )}" )
+        feat = layer.GetNextFeature()
+        value = None if feat is None else feat.GetField( 0 )
+        ds.ReleaseResultSet( layer )
+        return 0 if value is None else int( value )
+
+    @staticmethod
+    def updateMembers(layerMember, members, merges, idGroupLast, printStatus):
+        """
+        Keep the membership table consistent with the update of aggregated table:
+        the rows of merged groups of table move to the group that remains (UPDATE by index of 'id_group'),
+        the rows of new groups are added with the 'id_group' of group that remains.
+        Inside the transaction of updateGroups (same of aggregated table).
+        members: { id_group: ( objectids, days ) } of new groups
+        merges: [ ( id_group, [ id_group merged ] ) ], in order of merge
+        """
+        def getIdGroup(idGroup):
+            while idGroup in mergedBy:
+                idGroup = mergedBy[ idGroup ]
+            return idGroup
+
+        mergedBy = {} # id_group merged -> id_group
+        for idGroup, idsMerged in merges:
+            for idMerged in idsMerged:
+                mergedBy[ idMerged ] = idGroup
+        moves = {} # id_group -> id_group merged of table
+        for idMerged in mergedBy:
+            if idMerged <= idGroupLast:
+                moves.setdefault( getIdGroup( idMerged ), [] ).append( idMerged )
+
+        name = AggregatorGroupPG.getNameMember()
+        t = Metrics.start()
+        for idGroup, idsMerged in moves.items():
+            ids = ', '.join( str( id ) for id in sorted( idsMerged ) )
+            AggregatorGroupPG.dsPG.ExecuteSQL( f"UPDATE {AggregatorGroupPG.getNameSql( name )} SET id_group = {idGroup} WHERE id_group IN ( {ids} )" )
+        Metrics.stop( 'update_members', t, len( moves ) )
+
+        writer = MemberWriter( layerMember, printStatus, useTransaction=False )
+        for idGroup, value in members.items():
+            writer.add( getIdGroup( idGroup ), value )
+        r = writer.close()
+        printStatus( r['message'], True )
+
+    @staticmethod
+    def swapTables(names):
+        """
+        Replace each table 'name' by 'nameShadow' (rename, also indexes and sequence) in one transaction,
+        the readers never see a missing table. The indexes and sequence are the relations of schema
+        with the prefix 'nameShadow' (exact prefix, not LIKE: '_' is a wildcard).
+        names: [ ( nameShadow, name ) ]
+        """
+        def getSqls(nameShadow, name):
+            ( schema, table ) = name.split('.') if '.' in name else ( 'public', name )
+            tableShadow = nameShadow.split('.')[-1]
+            return [
+                f"DROP TABLE IF EXISTS {AggregatorGroupPG.getNameSql( name )}",
+                f'ALTER TABLE {AggregatorGroupPG.getNameSql( nameShadow )} RENAME TO "{table}"',
+                f"""
+                DO $$ DECLARE r record; BEGIN
+                    FOR r IN SELECT c.relname, c.relkind FROM pg_class AS c JOIN pg_namespace AS n ON n.oid = c.relnamespace
+                        WHERE n.nspname = '{schema}' AND c.relkind IN ('i', 'S')
+                            AND left( c.relname, length( '{tableShadow}' ) ) = '{tableShadow}'
+                    LOOP
+                        EXECUTE format( 'ALTER %s %I.%I RENAME TO %I',
+                            CASE r.relkind WHEN 'i' THEN 'INDEX' ELSE 'SEQUENCE' END,
+                            '{schema}', r.relname, '{table}' || substr( r.relname, length( '{tableShadow}' ) + 1 ) );
+                    END LOOP;
+                END $$
+                """
             ]
-            for item in fields:
-                f = ogr.FieldDefn( item['name'], item['type'] )
-                if 'width' in item:
-                    f.SetWidth( item[ 'width' ] )
-                layer.CreateField( f )
-
-            return { 'ds': ds, 'layer': layer }
-
-        def copyLayer2PG(layer):
-            try:
-                if not AggregatorGroupPG.dsPG.GetLayerByName( AggregatorGroupPG.tableAgregated ) is None:
-                    AggregatorGroupPG.dsPG.DeleteLayer( AggregatorGroupPG.tableAgregated )
-            except Exception as error:
-                msg = "\n*Open again DB, error: {}".format( error )
-                printStatus( msg, True)
-                AggregatorGroupPG.dsPG = None
-                AggregatorGroupPG.openPostgres()
-            args = ( layer, AggregatorGroupPG.tableAgregated, ['OVERWRITE=YES'] )
-            return AggregatorGroupPG.dsPG.CopyLayer( *args )
-
-        # MemoryLayerAggregator
-        r =  createMemoryLayerAggregator()
-        totalNewGroup = 0
-        for item in aggGroups:
-            totalNewGroup += 1
-            if totalNewGroup % 1000 == 0:
-                args = ( totalNewGroup, item['n_fids'], datetime.now() )
-                msg = "Group {} ({} features)- {}...".format( *args )
-                printStatus( msg )
-            AggregatorParams.saveGroupItem( r['layer'], item )
-        AggregatorParams.dsAlert = None # Use by aggGroups
-        args = ( totalNewGroup, AggregatorGroupPG.tableAgregated, datetime.now() )
-        msg = "Copying {} groups to DB '{}' - {}...".format( *args )
-        printStatus( msg )
-        layerGroup = copyLayer2PG( r['layer'] )
-        r['layer'] = None
-        r['ds'] = None
+
+        t = Metrics.start()
+        ds = AggregatorGroupPG.dsPG
+        if not AggregatorGroupPG.isPostgres():
+            for nameShadow, name in names:
+                r = AggregatorGroupPG.swapLayer( nameShadow, name )
+                if not r['isOk']:
+                    return r
+            Metrics.stop( 'swap_table', t )
+            return { 'isOk': True }
+        ds.StartTransaction()
+        try:
+            for nameShadow, name in names:
+                for sql in getSqls( nameShadow, name ):
+                    ds.ExecuteSQL( sql )
+        except Exception as error:
+            ds.RollbackTransaction()
+            return { 'isOk': False, 'message': f"Fail rename '{nameShadow}' to '{name}': {error}" }
+        ds.CommitTransaction()
+        Metrics.stop( 'swap_table', t )
+        AggregatorGroupPG.dsPG = None
+        AggregatorGroupPG.openSink() # Tables changed
+        return { 'isOk': True }
+
+    @staticmethod
+    def swapLayer(nameShadow, name):
+        """
+        Replace the layer 'name' by 'nameShadow' in datasource without PostgreSQL (ex.: GeoPackage of benchmark)
+        """
+        ds = AggregatorGroupPG.dsPG
+        if not ds.GetLayerByName( name ) is None:
+            ds.DeleteLayer( name )
+        layer = ds.GetLayerByName( nameShadow )
+        try:
+            if hasattr( layer, 'Rename' ): # GDAL >= 3.5
+                layer.Rename( name )
+            else:
+                ds.ExecuteSQL( f'ALTER TABLE "{nameShadow}" RENAME TO "{name}"' )
+        except Exception as error:
+            return { 'isOk': False, 'message': f"Fail rename '{nameShadow}' to '{name}': {error}" }
+        return { 'isOk': True }
+
+    @staticmethod
+    def saveGroups(aggGroups, printStatus, pathCheckpoint=None, totalNewGroup=0):
+        """
+        Stream the groups to shadow table (batches of COPY) and swap with the aggregated table,
+        also the membership table (getNameMember).
+        pathCheckpoint: save the state (Checkpoint) after each Checkpoint.totalGroups groups
+        totalNewGroup: resume, the groups in shadow table after it are removed
+        With Pipeline, the groups are written by a thread (queue 'groups') while the next groups are created,
+        the state of checkpoint is copied when the last group of it is created.
+        """
+        def write(item):
+            ( name, value ) = item
+            if name == 'checkpoint':
+                writer.flush()
+                writerMember.flush()
+                Checkpoint.save( pathCheckpoint, value )
+                return
+            members = value.pop('members')
+            writer.add( value )
+            writerMember.add( value['id_group'], members ) # Batch of groups committed before the members
+
+        nameShadow = f"{AggregatorGroupPG.tableAgregated}_shadow"
+        nameMember = AggregatorGroupPG.getNameMember()
+        nameMemberShadow = f"{nameMember}_shadow"
+        if totalNewGroup == 0:
+            args = ( ogr.wkbMultiPolygon, nameShadow, AggregatorGroupPG.getFieldsAggregated() )
+            r = AggregatorGroupPG.createLayerPostgres( *args )
+            if not r['isOk']:
+                return r
+            layerShadow = r['layer']
+            r = AggregatorGroupPG.createLayerPostgres( ogr.wkbNone, nameMemberShadow, MemberWriter.getFields() )
+            if not r['isOk']:
+                return r
+            layerMember = r['layer']
+        else:
+            layerShadow = AggregatorGroupPG.dsPG.GetLayerByName( nameShadow )
+            layerMember = AggregatorGroupPG.dsPG.GetLayerByName( nameMemberShadow )
+            if layerShadow is None or layerMember is None:
+                return { 'isOk': False, 'message': f"Missing '{nameShadow}' or '{nameMemberShadow}' for resume" }
+            for name in ( nameShadow, nameMemberShadow ):
+                AggregatorGroupPG.dsPG.ExecuteSQL( f"DELETE FROM {AggregatorGroupPG.getNameSql( name )} WHERE id_group > {totalNewGroup}" )
+            totalShadow = layerShadow.GetFeatureCount()
+            if not totalShadow == totalNewGroup:
+                msg = f"Resume: '{nameShadow}' has {totalShadow} groups, expected {totalNewGroup}"
+                return { 'isOk': False, 'message': msg }
+            printStatus( f"Resume: {totalNewGroup} groups in '{nameShadow}' - {datetime.now()}", True )
+        writer = LayerWriter( layerShadow, printStatus, useCopy=True )
+        writerMember = MemberWriter( layerMember, printStatus, writer )
+        consumer = Pipeline.getConsumer( 'groups', write )
+        try:
+            for item in aggGroups:
+                totalNewGroup += 1
+                if totalNewGroup % 1000 == 0:
+                    args = ( totalNewGroup, item['n_fids'], datetime.now() )
+                    msg = "Group {} ({} features)- {}...".format( *args )
+                    printStatus( msg )
+                consumer.put( ( 'group', item ) )
+                if not pathCheckpoint is None and totalNewGroup % Checkpoint.totalGroups == 0:
+                    consumer.put( ( 'checkpoint', AggregatorGroupPG.getCheckpointState( totalNewGroup ) ) )
+        finally:
+            consumer.close() # Writer thread ends also if the create of groups fails
+        r = writer.close()
+        printStatus( r['message'], True )
+        r = writerMember.close()
+        printStatus( r['message'], True )
+        layerMember = None
+        isPostgres = AggregatorGroupPG.isPostgres()
+        if isPostgres: # Indexes renamed with table
+            AggregatorGroupPG.createIndexMember( nameMemberShadow )
+        AggregatorParams.clearAlert() # Use by aggGroups
         status = StatusProcess.SUCCESS
         metadata = AggregatorGroupPG.getMetadata( status )
         value = f"{metadata}\nAdded {totalNewGroup} groups"
-        try:
-            layerGroup.SetMetadataItem( AggregatorGroupPG.meta_item_description, value )
-        except Exception:
-            AggregatorGroupPG.dsPG = None
-            AggregatorGroupPG.openPostgres()
-            layerGroup.SetMetadataItem( AggregatorGroupPG.meta_item_description, value )
-        
+        layerShadow.SetMetadataItem( AggregatorGroupPG.meta_item_description, value )
+        layerShadow = None
+
+        args = ( nameShadow, AggregatorGroupPG.tableAgregated, datetime.now() )
+        msg = "Renaming '{}' to '{}' - {}...".format( *args )
+        printStatus( msg )
+        names = [ ( nameShadow, AggregatorGroupPG.tableAgregated ), ( nameMemberShadow, nameMember ) ]
+        r = AggregatorGroupPG.swapTables( names )
+        if not r['isOk']:
+            return r
+        if not isPostgres: # SQLite, the previous indexes are dropped with previous table
+            AggregatorGroupPG.createIndexMember( nameMember )
+        if not pathCheckpoint is None:
+            Checkpoint.remove( pathCheckpoint )
+        args = ( totalNewGroup, AggregatorGroupPG.tableAgregated, datetime.now() )
         msg = "Copied {} groups to DB '{}' - {}...".format( *args )
         printStatus( msg )
 
         return { 'isOk': True, 'totalNewGroup': totalNewGroup }
 
     @staticmethod
-    def updateGroups(printStatus):
+    def getCheckpointState(totalNewGroup):
+        """
+        State of Checkpoint after 'totalNewGroup' groups created (restored by setResume)
+        """
+        return {
+            'totalNewGroup': totalNewGroup,
+            'fingerprint': AggregatorParams.alertStore.getFingerprint(),
+            'engine': AggregatorGroup.engine.value,
+            'dtInit': AggregatorGroupPG.dtInit.isoformat(),
+            'alertDeleted': AggregatorParams.alertDeleted.copy(),
+            'invalidUnions': list( ChainPolygons.invalidUnions )
+        }
+
+    @staticmethod
+    def setResume(pathCheckpoint):
+        """
+        Restore the state of Checkpoint (after AggregatorGroup.init), return the total of groups created
+        """
+        r = Checkpoint.load( pathCheckpoint )
+        if not r['isOk']:
+            return r
+        state = r['state']
+        if not state['fingerprint'] == AggregatorParams.alertStore.getFingerprint():
+            msg = f"Checkpoint '{pathCheckpoint}' is from other alerts (use the snapshot of run, --from-snapshot)"
+            return { 'isOk': False, 'message': msg }
+        if not state['engine'] == AggregatorGroup.engine.value:
+            return { 'isOk': False, 'message': f"Checkpoint '{pathCheckpoint}' is from engine '{state['engine']}'" }
+        AggregatorParams.alertDeleted[:] = state['alertDeleted']
+        ChainPolygons.invalidUnions.extend( state['invalidUnions'] )
+        AggregatorGroupPG.dtInit = datetime.fromisoformat( state['dtInit'] )
+        return { 'isOk': True, 'totalNewGroup': state['totalNewGroup'] }
+
+    @staticmethod
+    def getCandidatesServer(groups, layerGroup):
+        """
+        Stage the new groups in a temporary table (COPY) and search, in DB (GiST index), the candidates
+        for merge: existing groups and staged groups (lower id_group) intersecting the buffer of new group.
+        Return { id_group: [ ( source, key, isWithinDate ) ] }
+        source: 'e' existing group (key is FID) or 'n' new group (key is id_group)
+        The temporary table (pg_temp) has a name by run, the tables of schemas are not touched.
+        """
+        name = f"{AggregatorGroupPG.tableStaging}_{uuid.uuid4().hex}"
+        args = ( ogr.wkbMultiPolygon, name, AggregatorGroupPG.getFieldsAggregated(), ['TEMPORARY=ON'] )
+        r = AggregatorGroupPG.createLayer( *args )
+        if not r['isOk']:
+            return r
+        layerStaging = r['layer']
+        writer = LayerWriter( layerStaging, lambda msg: None, useCopy=True, sizeBatch=len( groups ) + 1 ) # One COPY
+        for group in groups:
+            writer.add( group )
+        writer.close()
+
+        t = Metrics.start()
+        months = AggregatorParams.relMonth.years * 12 + AggregatorParams.relMonth.months
+        args = {
+            'staging': f'pg_temp."{name}"',
+            'table': AggregatorGroupPG.getNameSql( AggregatorGroupPG.tableAgregated ),
+            'geomStaging': layerStaging.GetGeometryColumn(),
+            'geomGroup': layerGroup.GetGeometryColumn(),
+            'fidGroup': layerGroup.GetFIDColumn(),
+            'albers': AggregatorParams.srsArea.ExportToProj4(),
+            'buffer': AggregatorParams.buffer_meter,
+            'interval': f"{months} months"
+        }
+        sql = """
+            WITH n AS (
+                SELECT id_group, ini_date::date AS ini_date, end_date::date AS end_date,
+                    ST_Transform( ST_Buffer( ST_Transform( {geomStaging}, '{albers}' ), {buffer}, 'quad_segs=30' ), '{albers}', ST_SRID( {geomStaging} ) ) AS buff
+                FROM {staging}
+            )
+            SELECT n.id_group, 'e' AS source, g.{fidGroup} AS key,
+                ( n.ini_date >= g.ini_date::date - INTERVAL '{interval}' AND n.end_date <= g.end_date::date + INTERVAL '{interval}' )::int AS within_date
+            FROM n JOIN {table} AS g ON ST_Intersects( g.{geomGroup}, n.buff )
+            UNION ALL
+            SELECT n.id_group, 'n' AS source, s.id_group AS key,
+                ( n.ini_date >= s.ini_date::date - INTERVAL '{interval}' AND n.end_date <= s.end_date::date + INTERVAL '{interval}' )::int AS within_date
+            FROM n JOIN {staging} AS s ON s.id_group < n.id_group AND ST_Intersects( s.{geomStaging}, n.buff )
+            ORDER BY id_group, source, key
+        """.format( **args )
+        try:
+            layerSql = AggregatorGroupPG.dsPG.ExecuteSQL( sql )
+        except Exception as error:
+            return { 'isOk': False, 'message': error }
+        if layerSql is None:
+            return { 'isOk': False, 'message': f"Fail get SQL for candidates: {sql}" }
+        candidates = {}
+        for feat in layerSql:
+            item = ( feat.GetField('source'), feat.GetField('key'), feat.GetField('within_date') == 1 )
+            candidates.setdefault( feat.GetField('id_group'), [] ).append( item )
+        AggregatorGroupPG.dsPG.ReleaseResultSet( layerSql )
+        AggregatorGroupPG.dsPG.DeleteLayer( layerStaging.GetName() )
+        Metrics.stop( 'candidates_server', t, len( groups ) )
+        return { 'isOk': True, 'candidates': candidates }
+
+    @staticmethod
+    def getFidsServer(idGroup, candidates, fidsSaved, fidsMerged):
+        """
+        FIDs (ascending) of table for merge with new group 'idGroup', from candidates of getCandidatesServer
+        fidsSaved: id_group -> FID, new groups saved
+        fidsMerged: FID deleted -> FID of group that merged, the candidate is the current group
+        """
+        def getFidCurrent(fid):
+            while fid in fidsMerged:
+                fid = fidsMerged[ fid ]
+            return fid
+
+        fids = set()
+        for source, key, isWithinDate in candidates.get( idGroup, [] ):
+            fid = fidsSaved[ key ] if source == 'n' else key
+            if not fid in fidsMerged and not isWithinDate and source == 'e':
+                continue # Unchanged group, dates of DB
+            fids.add( getFidCurrent( fid ) )
+        return sorted( fids )
+
+    @staticmethod
+    def updateGroups(aggGroups, printStatus, serverSide=False, workers=1):
+        """
+        serverSide: the candidates for merge are searched in DB (getCandidatesServer),
+                    only these groups are read from table
+        workers: merge by batches of independent groups in processes (AggregatorUpdate.mergeGroups)
+        The membership table (getNameMember) follows the merges (updateMembers),
+        both tables in one transaction of datasource: a failure rolls back the aggregated table too.
+        """
         def getLayerAggregate():
             layer = AggregatorGroupPG.dsPG.GetLayerByName( AggregatorGroupPG.tableAgregated )
             if layer is None:
                 return { 'isOk': False, 'message': "Missing layer '{}' in DB".format( AggregatorGroupPG.tableAgregated ) }
             return { 'isOk': True, 'layer': layer }
 
-        def setGroup(group, totalDeleteGroup):
-            def getDates(data):
-                sFormat = '%Y-%m-%d'
-                r = {}
-                for d in ('ini_date', 'end_date'):
-                    r[ d ] = datetime.strptime( data[ d ], sFormat )
-                return r
+        def getFeaturesFilter(group):
+            return AggregatorUpdate.getFeaturesFilter( layerGroup, group )
 
-            def isWithinDate(dates, datesFeat):
-                return dates['ini_date'] >= ( datesFeat['ini_date'] - AggregatorParams.relMonth ) and dates['end_date'] <= ( datesFeat['end_date'] + AggregatorParams.relMonth )
-
-            def unionGroup():
-                def addUniqueValues():
-                    keys = ('fids', 'dates_ev', 'tipos', 'estagios')
-                    for k in keys:
-                        l1 = group[ k ].split( AggregatorParams.sep_join )
-                        l2 = feat[ k ].split( AggregatorParams.sep_join )
-                        group[ k ] = AggregatorParams.sep_join.join( list( set( l1 + l2 ) ) )
-                    group['n_fids'] = len( group['fids'].split( AggregatorParams.sep_join ) )
-                    group['n_events'] = len( group['dates_ev'].split( AggregatorParams.sep_join ) )
-
-                union, msg = None, None
-                try:
-                    union = group['geometry'].Union( geomFeat )
-                except Exception as error:
-                    msg = "{}".format( error )
-                if union is None or union.IsValid() == False:
-                    msg = msg if union is None else 'Union is not Valid'
-                    iiu = ItemInvalidUnion( group['id_group'], type_fid, msg,  geomFeat )
-                    ChainPolygons.invalidUnions.append( iiu.getItem() )
-                    return
-                r = AggregatorParams.checkMultiPolygon( union )
-                if r['hasChange']:
-                    union.Destroy()
-                    union = r['geometry']
-                if r['hasInvalid']:
-                    msg = 'Missing polygon in Union'
-                    iiu = ItemInvalidUnion( group['id_group'], type_fid, msg,  geomFeat )
-                    ChainPolygons.invalidUnions.append( iiu.getItem() )
-                    return
-                group['geometry'].Destroy()
-                group['geometry'] = union
-                group['end_ha'] = AggregatorParams.getAreaHa( union )
-                if group['ini_date'] > feat['ini_date']:
-                    group['ini_date'] = feat['ini_date']
-                    group['ini_ha'] = feat['ini_ha']
-                if group['end_date'] < feat['end_date']:
-                    group['end_date'] = feat['end_date']
-                addUniqueValues() # 'fids', 'dates_ev', 'tipos', 'estagios', 'n_fids', 'n_events'
-
-            bboxBuffer = AggregatorParams.getBufferBoundBox( group['geometry'] )
-            layerGroup.SetSpatialFilter( bboxBuffer )
-            if layerGroup.GetFeatureCount() == 0:
-                layerGroup.SetSpatialFilter(None)
-                return
-            dates = getDates( group )
-            buffGeom = AggregatorParams.getBuffer( group['geometry'], True )
-            fidsLayer = []
-            type_fid = f"id_group from '{AggregatorGroupPG.tableAgregated}'." # Invalid Union
-            for feat in layerGroup:
-                datesFeat = getDates( feat )
-                if isWithinDate( dates, datesFeat ):
-                    geomFeat = feat.GetGeometryRef()
-                    if buffGeom.Intersects( geomFeat ):
-                        unionGroup()
-                        dates = getDates( group )
-                        fidsLayer.append( feat.GetFID() )
-            layerGroup.SetSpatialFilter(None)
-            total = len( fidsLayer )
-            if total > 0:
-                for fid in fidsLayer:
-                    layerGroup.DeleteFeature( fid )
-                totalDeleteGroup['value'] += total
-            
+        def getFeaturesServer(group):
+            fids = AggregatorGroupPG.getFidsServer( group['id_group'], candidates, fidsSaved, fidsMerged )
+            feats = [ layerGroup.GetFeature( fid ) for fid in fids ]
+            return [ feat for feat in feats if not feat is None ]
+
+        if serverSide and not AggregatorGroupPG.sink.isPostgres():
+            return { 'isOk': False, 'message': f"Update searching in DB needs PostGIS, not '{AggregatorGroupPG.sink.getLabel()}'" }
         r = getLayerAggregate()
         if not r['isOk']:
             return r
         layerGroup = r['layer']
         totalGroup = layerGroup.GetFeatureCount()
-        totalDeleteGroup = { 'value': 0 }
+        idGroupLast = AggregatorGroupPG.getLastIdGroup()
+        nameMember = AggregatorGroupPG.getNameMember()
+        layerMember = AggregatorGroupPG.dsPG.GetLayerByName( nameMember )
+        if layerMember is None:
+            printStatus( f"Missing '{nameMember}' (created by creation of groups), the membership is not updated", True )
+        members = {} # id_group -> ( objectids, days ), new groups
+        merges = [] # ( id_group, [ id_group merged ] )
+        totalDeleteGroup = 0
+        getFeatures = getFeaturesFilter
+        if serverSide or workers > 1:
+            aggGroups = list( aggGroups )
+            for id, item in enumerate( aggGroups, 1 ):
+                item['id_group'] = idGroupLast + id
+                members[ item['id_group'] ] = item.pop('members')
+        if serverSide:
+            args = ( len( aggGroups ), datetime.now() )
+            msg = "Searching candidates of {} groups in DB - {}...".format( *args )
+            printStatus( msg )
+            r = AggregatorGroupPG.getCandidatesServer( aggGroups, layerGroup )
+            if not r['isOk']:
+                return r
+            candidates = r['candidates']
+            fidsSaved = {} # id_group -> FID
+            fidsMerged = {} # FID deleted -> FID of group that merged
+            getFeatures = getFeaturesServer
+        type_fid = f"id_group from '{AggregatorGroupPG.tableAgregated}'." # Invalid Union
         totalNewGroup = 0
-        for item in AggregatorGroup.createGroups():
-            totalNewGroup += 1
-            if totalNewGroup % 1000 == 0:
-                args = ( totalNewGroup, item['n_fids'], datetime.now() )
-                msg = "Group {} ({} features)- {}...".format( *args )
+        ds = AggregatorGroupPG.dsPG
+        ds.StartTransaction() # Aggregated and membership tables in one transaction, a failure keeps both
+        try:
+            writer = LayerWriter( layerGroup, printStatus, useTransaction=False ) # FID of new group is used by 'serverSide'
+            if workers > 1:
+                args = ( len( aggGroups ), workers, datetime.now() )
+                msg = "Merging {} groups in {} processes - {}...".format( *args )
                 printStatus( msg )
-            item['id_group'] = totalGroup + totalNewGroup
-            setGroup( item, totalDeleteGroup )
-            layerGroup.StartTransaction()
-            AggregatorParams.saveGroupItem( layerGroup, item )
-            layerGroup.CommitTransaction()
-        AggregatorParams.dsAlert = None # Use by AggregatorGroup.createGroups()
+                AggregatorUpdate.workers = workers
+                args = ( aggGroups, layerGroup, AggregatorGroupPG.getFieldsAggregated(), type_fid )
+                for r in AggregatorUpdate.mergeGroups( *args ):
+                    for fid in r['fidsDeleted']:
+                        writer.delete( fid )
+                    for item in r['groups']:
+                        writer.add( item )
+                    totalDeleteGroup += r['totalDelete']
+                    merges.extend( r['merges'] )
+                totalNewGroup = len( aggGroups )
+                aggGroups = []
+            for item in aggGroups:
+                totalNewGroup += 1
+                if totalNewGroup % 1000 == 0:
+                    args = ( totalNewGroup, item['n_fids'], datetime.now() )
+                    msg = "Group {} ({} features)- {}...".format( *args )
+                    printStatus( msg )
+                item['id_group'] = idGroupLast + totalNewGroup
+                if not serverSide:
+                    members[ item['id_group'] ] = item.pop('members')
+                t = Metrics.start()
+                feats = getFeatures( item )
+                Metrics.stop( 'update_candidates', t, len( feats ) )
+                fids = AggregatorUpdate.mergeGroup( item, feats, writer.delete, type_fid )
+                totalDeleteGroup += len( fids )
+                if len( fids ) > 0:
+                    idsGroup = { feat.GetFID(): feat['id_group'] for feat in feats }
+                    merges.append( ( item['id_group'], [ idsGroup[ fid ] for fid in fids ] ) )
+                fid = writer.add( item )
+                if serverSide:
+                    fidsSaved[ item['id_group'] ] = fid
+                    for fidMerged in fids:
+                        fidsMerged[ fidMerged ] = fid
+            r = writer.close()
+            printStatus( r['message'], True )
+            if not layerMember is None:
+                AggregatorGroupPG.updateMembers( layerMember, members, merges, idGroupLast, printStatus )
+        except Exception as error:
+            ds.RollbackTransaction()
+            return { 'isOk': False, 'message': f"Fail update '{AggregatorGroupPG.tableAgregated}' (rollback): {error}" }
+        ds.CommitTransaction()
+        AggregatorParams.clearAlert() # Use by aggGroups
         metadata = AggregatorGroupPG.getMetadata( StatusProcess.SUCCESS)
         value = f"{metadata}\nAdded {totalNewGroup} groups"
         layerGroup.StartTransaction()
@@ -398,9 +856,9 @@ class AggregatorGroupPG():
         args = ( AggregatorGroupPG.tableAgregated, totalNewGroup, datetime.now() )
         msg = "Saving '{}' in DB ( {} groups) - {}...".format( *args )
         printStatus( msg )
-        return { 'isOk': True, 'totalNewGroup': totalNewGroup, 'totalGroup': totalGroup, 'totalDeleteGroup': totalDeleteGroup['value'] }
+        return { 'isOk': True, 'totalNewGroup': totalNewGroup, 'totalGroup': totalGroup, 'totalDeleteGroup': totalDeleteGroup }
 
-def run(quiet_status, create):
+def run(quiet_status, create, engine=EngineGroup.CHAIN, workers=1, serverUpdate=False, sizeBatch=LayerWriter.sizeBatch, snapshot=None, fromSnapshot=None, checkpoint=None, resume=False, validityCache=None, metrics=None, metricsMetadata=False, source=None, sink=None, host='10.1.25.143', db='siscom'):
     def printStatus(status, newLine=False):
         if quiet_status and not newLine:
             return
@@ -418,19 +876,27 @@ def run(quiet_status, create):
 
     ogr.RegisterAll()
     ogr.UseExceptions()
+    LayerWriter.sizeBatch = sizeBatch
+    Metrics.reset()
+    Pipeline.reset()
 
-    vars_env = ['USERPG', 'PWDPG']
-    for v in vars_env:
-        if not v in os.environ:
-            msg = f"Missing '{v}' in OS enviroment"
-            printStatus( msg, True )
-            return 1
-
-    args = ( os.environ['USERPG'], os.environ['PWDPG'], '10.1.25.143', 'siscom')
-    AggregatorGroupPG.setPostgres( *args )
-    if AggregatorGroupPG.dsPG is None:
-        msg = f"Error connection database: host={args[2]} db={args[3]} user={args[0]}"
-        printStatus( msg, True )
+    if not fromSnapshot is None:
+        source = None # Alerts from snapshot, the datasource of alerts is not opened
+    isSourcePG = source is None and fromSnapshot is None
+    if isSourcePG or sink is None: # PostGIS
+        vars_env = ['USERPG', 'PWDPG']
+        for v in vars_env:
+            if not v in os.environ:
+                msg = f"Missing '{v}' in OS enviroment"
+                printStatus( msg, True )
+                return 1
+        args = ( os.environ['USERPG'], os.environ['PWDPG'], host, db )
+        connectionPG = AggregatorSource.getConnectionPostgres( *args )
+        source = connectionPG if isSourcePG else source
+        sink = connectionPG if sink is None else sink
+    r = AggregatorGroupPG.setDataSources( source, sink )
+    if not r['isOk']:
+        printStatus( r['message'], True )
         return 1
 
     AggregatorGroupPG.dtInit = datetime.now()
@@ -438,18 +904,32 @@ def run(quiet_status, create):
     msg = f"Started ({status} '{AggregatorGroupPG.tableAgregated}'): {AggregatorGroupPG.dtInit}"
     printStatus( msg, True )
 
-    if create:
-        r = AggregatorGroupPG.setProcessParams(printStatus)
+    if not fromSnapshot is None:
+        r = AggregatorGroupPG.setProcessParamsSnapshot( printStatus, fromSnapshot, useFilterDatetime=not create )
+    elif create:
+        r = AggregatorGroupPG.setProcessParams(printStatus, pathSnapshot=snapshot, pathValidity=validityCache)
     else:
-        r = AggregatorGroupPG.setProcessParams(printStatus, useFilterDatetime=True)
+        r = AggregatorGroupPG.setProcessParams(printStatus, useFilterDatetime=True, pathSnapshot=snapshot, pathValidity=validityCache)
     if not r['isOk']:
         printStatus( r['message'], True )
         return 1
 
-    AggregatorGroup.init( AggregatorGroupPG.tableAlert )
+    AggregatorGroup.init( AggregatorGroupPG.tableAlert, engine )
+    totalNewGroup = 0
+    if resume:
+        r = AggregatorGroupPG.setResume( checkpoint )
+        if not r['isOk']:
+            printStatus( r['message'], True )
+            return 1
+        totalNewGroup = r['totalNewGroup']
+    if workers > 1 and engine == EngineGroup.COMPONENTS:
+        AggregatorParallel.workers = workers
+        aggGroups = AggregatorParallel.createGroups() # generator
+    else:
+        aggGroups = AggregatorGroup.createGroups( totalNewGroup ) # generator
+    aggGroups = Metrics.iterate( 'group', aggGroups )
     if create:
-        aggGroups = AggregatorGroup.createGroups() # generator
-        r = AggregatorGroupPG.saveGroups( aggGroups, printStatus )
+        r = AggregatorGroupPG.saveGroups( aggGroups, printStatus, checkpoint, totalNewGroup )
         if not r['isOk']:
             printStatus( r['message'] )
             return 1
@@ -459,7 +939,7 @@ def run(quiet_status, create):
         msg =  "Created '{}' in DB. Total Groups {} - {}({})".format( *args )
         printStatus( msg, True )
     else:
-        r = AggregatorGroupPG.updateGroups( printStatus )
+        r = AggregatorGroupPG.updateGroups( aggGroups, printStatus, serverUpdate, workers )
         if not r['isOk']:
             printStatus( r['message'] )
             return 1
@@ -472,22 +952,122 @@ def run(quiet_status, create):
             msg =  "Updated '{}' in DB. Groups: New {}, Delete {}, Total {} - {}({})".format( *args ) 
         printStatus( msg, True )
 
+    args = Metrics.getTotal( 'intersects' )
+    msg = "Intersects: {} ({:.1f} seconds)".format( *args )
+    printStatus( msg, True )
+
+    if AggregatorParams.hasPrecision():
+        precision = AggregatorParams.getPrecisionReport()
+        args = (
+            precision['gridMeter'], precision['simplifyMeter'],
+            precision['areaExactHa'], precision['areaReducedHa'], precision['driftPercent'],
+            precision['vertexExact'], precision['vertexReduced']
+        )
+        msg = "Precision (grid {}, simplify {}): area {:.2f} -> {:.2f} ha ({:+.4f}%), vertices {} -> {}".format( *args )
+        printStatus( msg, True )
+
+    for name, item in Pipeline.getReport().items():
+        args = ( name, item['depthMean'], item['depthMax'], item['depth'], item['putWaitSeconds'], item['getWaitSeconds'] )
+        msg = "Pipeline '{}': depth mean {:.1f} max {} of {}, stall of producer {:.1f} and consumer {:.1f} seconds".format( *args )
+        printStatus( msg, True )
+
     totalInvalidUnions = len( ChainPolygons.invalidUnions )
     if totalInvalidUnions > 0:
-        r = AggregatorGroupPG.createLayerInvalidUnion( ChainPolygons.invalidUnions )
+        r = AggregatorGroupPG.createLayerInvalidUnion( ChainPolygons.invalidUnions, printStatus )
         msg =  "Created '{}' in DB".format( r['table'] ) if r['isOk'] else r['message']
         printStatus( msg, True )
         ChainPolygons.invalidUnions.clear()
 
+    report = {
+        'process': status,
+        'table': AggregatorGroupPG.tableAgregated,
+        'started': str( AggregatorGroupPG.dtInit ),
+        'seconds': ( datetime.now() - AggregatorGroupPG.dtInit ).total_seconds(),
+        'stages': Metrics.getReport()
+    }
+    if AggregatorParams.hasPrecision():
+        report['precision'] = AggregatorParams.getPrecisionReport()
+    if Pipeline.isActive():
+        report['pipeline'] = Pipeline.getReport()
+    if not metrics is None:
+        with open( metrics, 'w' ) as f:
+            json.dump( report, f, indent=2 )
+        printStatus( f"Metrics: '{metrics}'", True )
+    if metricsMetadata:
+        r = AggregatorGroupPG.setMetadataMetrics( report )
+        msg = f"Metrics in metadata '{AggregatorGroupPG.meta_item_description}' ('{AggregatorGroupPG.labelMetrics}') of '{AggregatorGroupPG.tableAgregated}'" if r['isOk'] else r['message']
+        printStatus( msg, True )
+
     return 0
 
 def main():
     parser = argparse.ArgumentParser(description='Update/Create aggregator polygon.' )
     parser.add_argument( '-q', '--quiet', action="store_false", help='Hides the processing status' )
     parser.add_argument( '-c', '--create', action="store_false", help='Create new aggregator' )
+    engines = [ e.value for e in EngineGroup ]
+    parser.add_argument( '-e', '--engine', choices=engines, default=EngineGroup.CHAIN.value, help='Engine for create groups' )
+    parser.add_argument( '-w', '--workers', type=int, default=1, help='Total of processes: create groups (only components engine, its groups are not the same of chain engine) and update (merge of groups)' )
+    parser.add_argument( '-s', '--server', action="store_true", help='Update: search the groups for merge in DB (PostGIS index)' )
+    parser.add_argument( '-b', '--batch', type=int, default=LayerWriter.sizeBatch, help='Total of features by transaction in DB (create, update is one transaction)' )
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument( '--snapshot', metavar='DIR', help='Save the alerts loaded in snapshot directory' )
+    group.add_argument( '--from-snapshot', metavar='DIR', dest='from_snapshot', help='Load the alerts from snapshot directory (without datasource of alerts, PostGIS only if sink)' )
+    parser.add_argument( '--checkpoint', metavar='FILE', help=f"Create: save the state after each {Checkpoint.totalGroups} groups" )
+    parser.add_argument( '-r', '--resume', action="store_true", help='Create: continue from the checkpoint' )
+    parser.add_argument( '--validity-cache', metavar='FILE', dest='validity_cache', help='SQLite cache of validity and in country of alerts' )
+    parser.add_argument( '--metrics', metavar='FILE', help='JSON report with counters and times by stage' )
+    parser.add_argument( '--metrics-metadata', action="store_true", dest='metrics_metadata', help="Write the metrics in metadata of aggregated table (line 'Metrics:' of DESCRIPTION)" )
+    parser.add_argument( '--source', metavar='CONNECTION', help="Alerts: 'PG: ...', GeoPackage (.gpkg) or FlatGeobuf (.fgb or directory), default PostGIS" )
+    parser.add_argument( '--sink', metavar='CONNECTION', help="Aggregated table: 'PG: ...' or GeoPackage (.gpkg), default the source (GeoPackage) or PostGIS" )
+    parser.add_argument( '--host', default='10.1.25.143', help='Host of PostGIS (USERPG and PWDPG in OS enviroment)' )
+    parser.add_argument( '--db', default='siscom', help='Database of PostGIS' )
+    parser.add_argument( '--table-alert', dest='table_alert', default=AggregatorGroupPG.tableAlert, help='Table (layer) of alerts' )
+    parser.add_argument( '--table-aggregated', dest='table_aggregated', default=AggregatorGroupPG.tableAgregated, help='Table (layer) of aggregated alerts' )
+    parser.add_argument( '--table-country', dest='table_country', default=AggregatorGroupPG.tableCountry, help='Table (layer) of country' )
+    parser.add_argument( '--grid', type=float, metavar='METER', help='Precision grid of geometry of groups (snap to grid in metric CRS)' )
+    parser.add_argument( '--simplify', type=float, metavar='METER', help='Tolerance of simplification (preserve topology) of geometry of groups' )
+    parser.add_argument( '--pipeline', type=int, default=0, metavar='DEPTH', help='Depth of queues: read of alerts and write of groups in threads (0: sequential)' )
+    parser.add_argument( '--page-size', type=int, dest='page_size', default=AggregatorSource.sizePage, help='Alerts by page of load (keyset of objectid), 0 for one SQL' )
 
     args = parser.parse_args()
-    return run( not args.quiet, not args.create )
+    if args.workers > 1 and not args.create and not args.engine == EngineGroup.COMPONENTS.value:
+        parser.error( f"-w/--workers in create needs '-e {EngineGroup.COMPONENTS.value}'" )
+    if args.workers > 1 and args.create and args.server:
+        parser.error( "-w/--workers in update is not with '-s'" )
+    if not args.checkpoint is None and args.create:
+        parser.error( "--checkpoint needs '-c'" )
+    if args.resume and args.checkpoint is None:
+        parser.error( "-r/--resume needs '--checkpoint'" )
+    sink = args.sink
+    if sink is None and not args.source is None:
+        if AggregatorSource.getDriverName( args.source ) == AggregatorSource.FLATGEOBUF:
+            parser.error( "--source FlatGeobuf needs '--sink'" )
+        sink = args.source
+    if args.server and not sink is None and not AggregatorSource.getDriverName( sink ) == AggregatorSource.POSTGRES:
+        parser.error( "-s/--server needs PostGIS in '--sink'" )
+    for name in ( 'grid', 'simplify' ):
+        value = getattr( args, name )
+        if not value is None and not value > 0:
+            parser.error( f"--{name} needs a value greater than 0" )
+    if not args.grid is None and not AggregatorParams.hasPrecisionGrid():
+        parser.error( "--grid needs GDAL >= 3.9 or Shapely 2" )
+    AggregatorParams.grid_meter = args.grid
+    AggregatorParams.simplify_meter = args.simplify
+    if args.pipeline < 0:
+        parser.error( "--pipeline needs a value greater or equal than 0" )
+    Pipeline.depth = args.pipeline
+    if args.page_size < 0:
+        parser.error( "--page-size needs a value greater or equal than 0" )
+    AggregatorSource.sizePage = args.page_size
+    AggregatorGroupPG.tableAlert = args.table_alert
+    AggregatorGroupPG.tableAgregated = args.table_aggregated
+    AggregatorGroupPG.tableCountry = args.table_country
+    args_run = (
+        not args.quiet, not args.create, EngineGroup( args.engine ), args.workers, args.server, args.batch,
+        args.snapshot, args.from_snapshot, args.checkpoint, args.resume, args.validity_cache,
+        args.metrics, args.metrics_metadata, args.source, sink, args.host, args.db
+    )
+    return run( *args_run )
 
 if __name__ == "__main__":
     sys.exit( main() )
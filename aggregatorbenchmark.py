@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Aggregator benchmark
+Description          : Times and peak of memory of create/save/update groups with synthetic alerts
+Arguments            : Optional parameter --scenarios: 10k, 100k and/or 1M alerts (default 10k 100k)
+                       Optional parameter -e (engine): chain (default) or components
+                       Optional parameter -w (workers): total of processes, create with components engine and update
+                       Optional parameter --dir: directory of GeoPackages (alerts are generated once by seed)
+                       Optional parameter --seed: seed of synthetic alerts
+                       Optional parameter --output: JSON file with the result
+                       Optional parameter --compare: JSON file of other result (ex.: previous commit)
+                       Optional parameter --grid, --simplify: precision (meters) of geometry of groups, with drift of area
+                       Optional parameter --pipeline: depth of queues of read of alerts and write of groups (threads)
+
+                       -------------------
+Begin                : 2026-10-16
+Copyright            : (C) 2026 by IBAMA
+email                : motta dot luiz at gmail.com
+
+Update: 2026-10-16
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Each scenario runs in a new process, the memory by stage is sampled (RssSampler).
+The GeoPackage is the stand-in of PostGIS: the alerts before 'fractionCreate' of dates
+create the aggregated table (saveGroups), the others update it (updateGroups, filter of features by bbox).
+"""
+
+import os, sys, json, time, platform, resource, subprocess, threading
+from datetime import datetime, timedelta
+import argparse
+
+import numpy as np
+
+from aggregatorgroup import AggregatorParams, AggregatorGroup, EngineGroup, prep
+from aggregatorparallel import AggregatorParallel
+from aggregatormetrics import Metrics
+from aggregatorpipeline import Pipeline
+from alertsynthetic import AlertSynthetic
+from aggregator_polygons_date import AggregatorGroupPG
+
+try:
+    from osgeo import gdal, ogr
+except ImportError:
+    import gdal, ogr
+
+class RssSampler():
+    """
+    Peak of RSS (resident memory, MB) of process while a stage runs, sampled by a thread each 'interval' seconds.
+    The RSS is current (Linux, /proc/self/statm), the peak of process (ru_maxrss) only grows with the stages.
+    Without /proc, the peak of process.
+    """
+    interval = 0.01 # Seconds
+
+    def __init__(self):
+        self.startMb = RssSampler.getRssMb()
+        self.peakMb = self.startMb
+        self.stop = threading.Event()
+        self.thread = threading.Thread( target=self._run, name='rss_sampler', daemon=True )
+        self.thread.start()
+
+    @staticmethod
+    def getRssMb():
+        try:
+            with open('/proc/self/statm') as f:
+                pages = int( f.read().split()[1] )
+        except OSError:
+            return AggregatorBenchmark.getPeakRssMb()
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+
+    def _run(self):
+        while not self.stop.wait( RssSampler.interval ):
+            self.peakMb = max( self.peakMb, RssSampler.getRssMb() )
+
+    def close(self):
+        """
+        Return { 'peakRssMb', 'deltaRssMb' (peak - RSS at start of stage) }
+        """
+        self.stop.set()
+        self.thread.join()
+        self.peakMb = max( self.peakMb, RssSampler.getRssMb() )
+        return { 'peakRssMb': self.peakMb, 'deltaRssMb': self.peakMb - self.startMb }
+
+class AggregatorBenchmark():
+    fractionCreate = 0.9 # Of period of dates, alerts for create, the others for update
+    nameAggregated = 'alert_aggregated'
+
+    @staticmethod
+    def getPeakRssMb():
+        peak = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024 # macOS in bytes, Linux in KB
+
+    @staticmethod
+    def getPathAlerts(pathDir, scenario, seed):
+        return os.path.join( pathDir, f"alerts_{scenario}_seed{seed}.gpkg" )
+
+    @staticmethod
+    def getDateCut():
+        days = int( AlertSynthetic.totalDays * AggregatorBenchmark.fractionCreate )
+        return ( AlertSynthetic.dateIni + timedelta( days=days ) ).strftime('%Y/%m/%d')
+
+    @staticmethod
+    def setAlerts(pathDir, scenario, seed, printStatus):
+        path = AggregatorBenchmark.getPathAlerts( pathDir, scenario, seed )
+        if os.path.exists( path ):
+            return { 'isOk': True, 'path': path }
+        printStatus( f"Generating '{path}' - {datetime.now()}...", True )
+        os.makedirs( pathDir, exist_ok=True )
+        r = AlertSynthetic( seed ).write( f"{path}.tmp", AlertSynthetic.scenarios[ scenario ] )
+        if not r['isOk']:
+            return r
+        os.replace( f"{path}.tmp", path )
+        return { 'isOk': True, 'path': path }
+
+    @staticmethod
+    def runScenario(pathAlerts, pathAggregated, engine, workers, gridMeter=None, simplifyMeter=None, pipelineDepth=0):
+        """
+        Stages: load (alerts of create), create (groups streamed to saveGroups, as the script),
+        updateGroups (load and groups of others alerts).
+        Return { 'alerts', 'groups', 'stages': { stage: { 'seconds', 'peakRssMb', 'deltaRssMb' } }, 'metrics' }
+        and 'precision' (AggregatorParams.getPrecisionReport) with gridMeter or simplifyMeter,
+        'pipeline' (Pipeline.getReport) with pipelineDepth.
+        peakRssMb and deltaRssMb: RssSampler of stage, without the workers (processes)
+        The time of create of groups, without the write, is the stage 'group' of metrics.
+        """
+        def printStatus(status, newLine=False):
+            pass
+
+        def runStage(name, function):
+            sampler = RssSampler()
+            t = time.perf_counter()
+            try:
+                value = function()
+            finally:
+                seconds = time.perf_counter() - t
+                stages[ name ] = { 'seconds': seconds, **sampler.close() }
+            return value
+
+        def load(isCreate):
+            operator = '<' if isCreate else '>='
+            layer.SetAttributeFilter( f"{AggregatorParams.field_date} {operator} '{dateCut}'" )
+            AggregatorParams.setAlert( layer )
+            layer.SetAttributeFilter( None )
+            return len( AggregatorParams.alertStore )
+
+        def createGroups():
+            AggregatorGroup.init( AlertSynthetic.nameLayer, engine )
+            if workers > 1 and engine == EngineGroup.COMPONENTS:
+                AggregatorParallel.workers = workers
+                return AggregatorParallel.createGroups()
+            return AggregatorGroup.createGroups()
+
+        def update():
+            total = load( False )
+            r = AggregatorGroupPG.updateGroups( createGroups(), printStatus, workers=workers )
+            r['alerts'] = total
+            return r
+
+        ogr.UseExceptions()
+        Metrics.reset()
+        AggregatorParams.grid_meter = gridMeter
+        AggregatorParams.simplify_meter = simplifyMeter
+        Pipeline.depth = pipelineDepth
+        Pipeline.reset()
+        stages = {}
+        dateCut = AggregatorBenchmark.getDateCut()
+        dsAlert = ogr.Open( pathAlerts )
+        layer = dsAlert.GetLayerByName( AlertSynthetic.nameLayer )
+        AggregatorParams.setParams( layer )
+
+        if os.path.exists( pathAggregated ):
+            os.remove( pathAggregated )
+        AggregatorGroupPG.dsPG = ogr.GetDriverByName('GPKG').CreateDataSource( pathAggregated )
+        AggregatorGroupPG.tableAgregated = AggregatorBenchmark.nameAggregated
+        AggregatorGroupPG.dtInit = datetime.now()
+
+        totalCreate = runStage( 'load', lambda: load( True ) )
+        r = runStage( 'create', lambda: AggregatorGroupPG.saveGroups( Metrics.iterate( 'group', createGroups() ), printStatus ) )
+        if not r['isOk']:
+            return r
+        totalGroups = r['totalNewGroup']
+        r = runStage( 'updateGroups', update )
+        if not r['isOk']:
+            return r
+        AggregatorGroupPG.dsPG = None
+        result = {
+            'isOk': True,
+            'alerts': { 'create': totalCreate, 'update': r['alerts'] },
+            'groups': { 'create': totalGroups, 'update': r['totalNewGroup'], 'delete': r['totalDeleteGroup'] },
+            'stages': stages,
+            'metrics': Metrics.getReport()
+        }
+        if AggregatorParams.hasPrecision():
+            result['precision'] = AggregatorParams.getPrecisionReport()
+        if Pipeline.isActive():
+            result['pipeline'] = Pipeline.getReport()
+        return result
+
+    @staticmethod
+    def getEnvironment():
+        try:
+            args = [ 'git', 'rev-parse', 'HEAD' ]
+            commit = subprocess.run( args, cwd=os.path.dirname( os.path.abspath( __file__ ) ), capture_output=True, text=True ).stdout.strip()
+        except OSError:
+            commit = None
+        return {
+            'commit': commit,
+            'python': platform.python_version(),
+            'gdal': gdal.__version__,
+            'numpy': np.__version__,
+            'shapely': not prep is None,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count()
+        }
+
+    @staticmethod
+    def compare(result, other):
+        """
+        Return lines with ratio (result / other) of seconds and peak of memory by stage
+        """
+        lines = []
+        for scenario, value in result['scenarios'].items():
+            if not scenario in other['scenarios']:
+                continue
+            stagesOther = other['scenarios'][ scenario ]['stages']
+            for stage, item in value['stages'].items():
+                if not stage in stagesOther:
+                    continue
+                itemOther = stagesOther[ stage ]
+                args = (
+                    scenario, stage,
+                    itemOther['seconds'], item['seconds'], item['seconds'] / max( itemOther['seconds'], 1e-9 ),
+                    itemOther['peakRssMb'], item['peakRssMb']
+                )
+                lines.append( "{:>5} {:<13} {:9.2f}s -> {:9.2f}s (x{:.2f})  {:8.1f}MB -> {:8.1f}MB".format( *args ) )
+        return lines
+
+def runScenarioProcess():
+    """
+    Child process, argv: --run-scenario pathAlerts pathAggregated engine workers gridMeter simplifyMeter pipelineDepth pathResult
+    """
+    def getMeter(value):
+        return None if value == 'None' else float( value )
+
+    pathAlerts, pathAggregated, engine, workers, gridMeter, simplifyMeter, pipelineDepth, pathResult = sys.argv[2:10]
+    args = (
+        pathAlerts, pathAggregated, EngineGroup( engine ), int( workers ),
+        getMeter( gridMeter ), getMeter( simplifyMeter ), int( pipelineDepth )
+    )
+    r = AggregatorBenchmark.runScenario( *args )
+    with open( pathResult, 'w' ) as f:
+        json.dump( r, f )
+    return 0 if r['isOk'] else 1
+
+def run(scenarios, engine, workers, pathDir, seed, output, pathCompare=None, gridMeter=None, simplifyMeter=None, pipelineDepth=0):
+    def printStatus(status, newLine=False):
+        sys.stdout.write( "\r{}".format( status.ljust(100) + ( "\n" if newLine else "" ) ) )
+        sys.stdout.flush()
+
+    ogr.UseExceptions()
+    result = {
+        'created': str( datetime.now() ),
+        'seed': seed,
+        'engine': engine.value,
+        'workers': workers,
+        'gridMeter': gridMeter,
+        'simplifyMeter': simplifyMeter,
+        'pipelineDepth': pipelineDepth,
+        'fractionCreate': AggregatorBenchmark.fractionCreate,
+        'environment': AggregatorBenchmark.getEnvironment(),
+        'scenarios': {}
+    }
+    for scenario in scenarios:
+        r = AggregatorBenchmark.setAlerts( pathDir, scenario, seed, printStatus )
+        if not r['isOk']:
+            printStatus( r['message'], True )
+            return 1
+        printStatus( f"Scenario {scenario} - {datetime.now()}...", True )
+        pathAggregated = os.path.join( pathDir, f"aggregated_{scenario}.gpkg" )
+        pathResult = os.path.join( pathDir, f"result_{scenario}.json" )
+        args = [
+            sys.executable, os.path.abspath( __file__ ), '--run-scenario', r['path'], pathAggregated,
+            engine.value, str( workers ), str( gridMeter ), str( simplifyMeter ), str( pipelineDepth ), pathResult
+        ]
+        if not subprocess.run( args ).returncode == 0:
+            printStatus( f"Fail scenario {scenario}", True )
+            return 1
+        with open( pathResult ) as f:
+            value = json.load( f )
+        value.pop( 'isOk' )
+        result['scenarios'][ scenario ] = value
+        for stage, item in value['stages'].items():
+            args = ( scenario, stage, item['seconds'], item['peakRssMb'], item['deltaRssMb'] )
+            msg = "{:>5} {:<13} {:9.2f} seconds {:8.1f} MB (stage {:+.1f} MB)".format( *args )
+            printStatus( msg, True )
+        if 'precision' in value:
+            precision = value['precision']
+            args = ( scenario, precision['driftPercent'], precision['vertexExact'], precision['vertexReduced'] )
+            printStatus( "{:>5} precision     drift of area {:+.4f}%, vertices {} -> {}".format( *args ), True )
+        for name, item in value.get( 'pipeline', {} ).items():
+            args = ( scenario, name, item['depthMean'], item['putWaitSeconds'], item['getWaitSeconds'] )
+            printStatus( "{:>5} pipeline {:<6} depth mean {:.1f}, stall of producer {:.2f}s and consumer {:.2f}s".format( *args ), True )
+
+    with open( output, 'w' ) as f:
+        json.dump( result, f, indent=2, sort_keys=True )
+    printStatus( f"Result: '{output}'", True )
+    if not pathCompare is None:
+        with open( pathCompare ) as f:
+            other = json.load( f )
+        printStatus( f"Compare with '{pathCompare}' (commit {other['environment']['commit']}):", True )
+        for line in AggregatorBenchmark.compare( result, other ):
+            printStatus( line, True )
+    return 0
+
+def main():
+    if len( sys.argv ) > 1 and sys.argv[1] == '--run-scenario':
+        return runScenarioProcess()
+    parser = argparse.ArgumentParser(description='Benchmark of aggregator polygon with synthetic alerts.' )
+    scenarios = list( AlertSynthetic.scenarios.keys() )
+    parser.add_argument( '--scenarios', nargs='+', choices=scenarios, default=scenarios[:2], help='Total of alerts' )
+    engines = [ e.value for e in EngineGroup ]
+    parser.add_argument( '-e', '--engine', choices=engines, default=EngineGroup.CHAIN.value, help='Engine for create groups' )
+    parser.add_argument( '-w', '--workers', type=int, default=1, help='Total of processes: create groups (only components engine, its groups are not the same of chain engine) and update' )
+    parser.add_argument( '--dir', default='benchmark', help='Directory of GeoPackages and results' )
+    parser.add_argument( '--seed', type=int, default=0, help='Seed of synthetic alerts' )
+    parser.add_argument( '--output', default=None, help='JSON file with result (default: <dir>/benchmark.json)' )
+    parser.add_argument( '--compare', default=None, help='JSON file of other result' )
+    parser.add_argument( '--grid', type=float, default=None, metavar='METER', help='Precision grid of geometry of groups' )
+    parser.add_argument( '--simplify', type=float, default=None, metavar='METER', help='Tolerance of simplification of geometry of groups' )
+    parser.add_argument( '--pipeline', type=int, default=0, metavar='DEPTH', help='Depth of queues of read and write in threads (0: sequential)' )
+
+    args = parser.parse_args()
+    output = os.path.join( args.dir, 'benchmark.json' ) if args.output is None else args.output
+    if not args.grid is None and not AggregatorParams.hasPrecisionGrid():
+        parser.error( "--grid needs GDAL >= 3.9 or Shapely 2" )
+    args_run = (
+        args.scenarios, EngineGroup( args.engine ), args.workers, args.dir, args.seed, output,
+        args.compare, args.grid, args.simplify, args.pipeline
+    )
+    return run( *args_run )
+
+if __name__ == "__main__":
+    sys.exit( main() )
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Aggregator Checkpoint
+Description          : State of create run for resume
+                       -------------------
+Begin                : 2026-10-16
+Copyright            : (C) 2026 by IBAMA
+email                : motta dot luiz at gmail.com
+
+Update: 2026-10-16
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os, json
+
+import numpy as np
+
+try:
+    from osgeo import ogr
+except ImportError:
+    import ogr
+
+class Checkpoint():
+    """
+    State after 'totalNewGroup' groups committed in DB:
+     alertDeleted (alerts consumed by the groups), invalid unions,
+     fingerprint of alerts (AlertStore.getFingerprint), engine and start of run.
+    One NumPy file (.npz), written in temporary file and renamed (atomic).
+    """
+    totalGroups = 10000 # Groups between checkpoints
+
+    @staticmethod
+    def save(path, state):
+        metadata = { k: state[ k ] for k in ( 'totalNewGroup', 'fingerprint', 'engine', 'dtInit' ) }
+        invalidUnions = []
+        for item in state['invalidUnions']:
+            item = dict( item )
+            item['geometry'] = item['geometry'].ExportToWkb().hex()
+            invalidUnions.append( item )
+        pathTemp = f"{path}.tmp"
+        with open( pathTemp, 'wb' ) as f:
+            np.savez(
+                f,
+                alertDeleted=state['alertDeleted'],
+                metadata=np.array( json.dumps( metadata ) ),
+                invalidUnions=np.array( json.dumps( invalidUnions ) )
+            )
+        os.replace( pathTemp, path )
+
+    @staticmethod
+    def load(path):
+        """
+        Return { 'isOk', 'state' }, same keys of save
+        """
+        if not os.path.exists( path ):
+            return { 'isOk': False, 'message': f"Missing checkpoint '{path}'" }
+        with np.load( path ) as data:
+            state = json.loads( str( data['metadata'] ) )
+            state['alertDeleted'] = data['alertDeleted'].copy()
+            invalidUnions = json.loads( str( data['invalidUnions'] ) )
+        for item in invalidUnions:
+            item['geometry'] = ogr.CreateGeometryFromWkb( bytes.fromhex( item['geometry'] ) )
+        state['invalidUnions'] = invalidUnions
+        return { 'isOk': True, 'state': state }
+
+    @staticmethod
+    def remove(path):
+        if os.path.exists( path ):
+            os.remove( path )
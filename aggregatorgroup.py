@@ -24,16 +24,36 @@ Update: 2020-01-29
 """
 
 import os, sys
-from datetime import datetime
+from datetime import datetime, date
 from dateutil.relativedelta import relativedelta
 import argparse
 from enum import Enum
 
+from array import array
+
+import numpy as np
+
+from alertindex import STRTree
+from alertstore import AlertStore
+from aggregatormetrics import Metrics
+from aggregatorpipeline import Pipeline
+
 try:
     from osgeo import ogr, osr
 except ImportError:
     import ogr, osr
 
+try:
+    from shapely import wkb as shapelyWkb
+    from shapely.prepared import prep
+except ImportError:
+    prep = None
+
+try:
+    from shapely import set_precision # Shapely 2
+except ImportError:
+    set_precision = None
+
 class ItemInvalidUnion():
     @staticmethod
     def getFields():
@@ -60,10 +80,44 @@ class ItemInvalidUnion():
             'geometry': self.geom
         }
 
+class PreparedGeometry():
+    """
+    Geometry for many Intersects tests (ex.: buffer of seed against candidates).
+    With shapely, the geometry is prepared (GEOS index) once, otherwise use OGR Intersects.
+    The calls are counted in Metrics, stage 'intersects' by default.
+    """
+    def __init__(self, geometry, stage='intersects'):
+        self.geom = geometry
+        self.stage = stage
+        self.prepared = None if prep is None else prep( shapelyWkb.loads( bytes( geometry.ExportToWkb() ) ) )
+
+    def _intersects(self, geometry, wkb):
+        t = Metrics.start()
+        if self.prepared is None:
+            if geometry is None:
+                geometry = ogr.CreateGeometryFromWkb( wkb )
+            r = self.geom.Intersects( geometry )
+        else:
+            if wkb is None:
+                wkb = geometry.ExportToWkb()
+            r = self.prepared.intersects( shapelyWkb.loads( bytes( wkb ) ) )
+        Metrics.stop( self.stage, t )
+        return r
+
+    def intersects(self, geometry):
+        return self._intersects( geometry, None )
+
+    def intersectsWkb(self, wkb):
+        return self._intersects( None, wkb )
+
 class AggregatorParams():
     # setAlert
-    dsAlert = None # Memory
-    layerAlert = None
+    alertStore = None # AlertStore, geometries projected by ctArea (metric)
+    alertIndex = None # STRTree
+    alertIndexDate = None # STRTree with dates, by demand (getAlertIndexDate)
+    alertDeleted = None # Bitmap, alert already in a group
+    alertBufferEnvelopes = None # Envelopes with buffer_meter
+    alertWindows = None # ( ini, end ) ordinal days, window of dates ( date - relMonth, date + relMonth ) by alert
 
     field_fid = 'objectid'
     field_type = 'tipo'
@@ -72,27 +126,164 @@ class AggregatorParams():
 
     sep_join = ','
     relMonth = relativedelta(months=6)
+    windowDays = {} # Ordinal day -> ( ini, end ) of window, getWindowDay
     buffer_meter = 15
+    grid_meter = None # Precision grid of group geometry (metric CRS), reducePrecision
+    simplify_meter = None # Tolerance of simplification (preserve topology) of group geometry
 
     # setParams
     srs = None
+    srsArea = None # Albers, metric
     ctArea = None
     ctOrigin = None
 
     @staticmethod
     def setParams(layer):
-        srs = layer.GetSpatialRef()
+        AggregatorParams.setParamsSrs( layer.GetSpatialRef() )
+
+    @staticmethod
+    def setParamsWkt(wktSrs):
+        srs = osr.SpatialReference()
+        srs.ImportFromWkt( wktSrs )
+        if hasattr( osr, 'OAMS_TRADITIONAL_GIS_ORDER' ):
+            srs.SetAxisMappingStrategy( osr.OAMS_TRADITIONAL_GIS_ORDER )
+        AggregatorParams.setParamsSrs( srs )
+
+    @staticmethod
+    def setParamsSrs(srs):
         wkt7390 = 'PROJCS["Brazil / Albers Equal Area Conic (WGS84)",GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],UNIT["degree",0.01745329251994328,AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4326"]],PROJECTION["Albers_Conic_Equal_Area"],PARAMETER["longitude_of_center",-50.0],PARAMETER["standard_parallel_1",10.0],PARAMETER["standard_parallel_2",-40.0],PARAMETER["latitude_of_center",-25.0],UNIT["Meter",1.0]]'
         sr7390 = osr.SpatialReference()
         sr7390.ImportFromWkt( wkt7390 )
         AggregatorParams.srs = srs
+        AggregatorParams.srsArea = sr7390
         AggregatorParams.ctArea = osr.CreateCoordinateTransformation( srs, sr7390 )
         AggregatorParams.ctOrigin = osr.CreateCoordinateTransformation( sr7390, srs )
 
     @staticmethod
-    def setAlert(ds, layer):
-        AggregatorParams.dsAlert = ds
-        AggregatorParams.layerAlert = layer
+    def setAlert(layer, isAlertOk=None):
+        """
+        Load the alerts of layer in AlertStore (setAlertFeatures)
+        """
+        layer.ResetReading()
+        AggregatorParams.setAlertFeatures( layer, isAlertOk )
+        layer.ResetReading()
+
+    @staticmethod
+    def setAlertFeatures(features, isAlertOk=None):
+        """
+        Load the alerts (iterable of features, ex.: layer or pages) in AlertStore,
+        project the geometries one time (ctArea), the grouping works in metric CRS
+        isAlertOk( objectid, geometry ): filter of alerts (ex.: AlertValidity.isAlertOk)
+        With Pipeline, the features are fetched in a thread (queue 'alerts') while they are loaded
+        """
+        t = Metrics.start()
+        store = AlertStore()
+        for feat in Pipeline.iterate( 'alerts', features ):
+            if not isAlertOk is None and not isAlertOk( feat.GetField( AggregatorParams.field_fid ), feat.GetGeometryRef() ):
+                continue
+            geom = feat.GetGeometryRef().Clone()
+            geom.Transform( AggregatorParams.ctArea )
+            args = (
+                feat.GetField( AggregatorParams.field_fid ),
+                AggregatorParams.getDate( feat.GetField( AggregatorParams.field_date ) ),
+                feat.GetField( AggregatorParams.field_type ),
+                feat.GetField( AggregatorParams.field_stage ),
+                geom
+            )
+            store.add( *args )
+            geom.Destroy()
+        store.finish()
+        Metrics.stop( 'load_alerts', t, len( store ) )
+        AggregatorParams.setAlertStore( store )
+
+    @staticmethod
+    def setAlertStore(store):
+        AggregatorParams.alertStore = store
+        AggregatorParams.alertDeleted = np.zeros( len( store ), dtype=np.bool_ )
+        AggregatorParams.alertBufferEnvelopes = store.envelopes + AggregatorParams.buffer_meter * np.array( [ -1, 1, -1, 1 ] )
+        AggregatorParams.windowDays.clear()
+        AggregatorParams.alertWindows = AggregatorParams.getWindows( store.dates )
+        AggregatorParams.alertIndex = STRTree( store.envelopes )
+        AggregatorParams.alertIndexDate = None
+
+    @staticmethod
+    def getAlertIndexDate():
+        """
+        Spatio-temporal index, the query can be limited by window of dates
+        """
+        if AggregatorParams.alertIndexDate is None:
+            store = AggregatorParams.alertStore
+            AggregatorParams.alertIndexDate = STRTree( store.envelopes, dates=store.dates )
+        return AggregatorParams.alertIndexDate
+
+    @staticmethod
+    def clearAlert():
+        AggregatorParams.alertStore = None
+        AggregatorParams.alertIndex = None
+        AggregatorParams.alertIndexDate = None
+        AggregatorParams.alertDeleted = None
+        AggregatorParams.alertBufferEnvelopes = None
+        AggregatorParams.alertWindows = None
+
+    @staticmethod
+    def getWindowDay(day):
+        """
+        Window ( day - relMonth, day + relMonth ) in ordinal days, computed once by day
+        """
+        if not day in AggregatorParams.windowDays:
+            value = date.fromordinal( day )
+            AggregatorParams.windowDays[ day ] = (
+                ( value - AggregatorParams.relMonth ).toordinal(),
+                ( value + AggregatorParams.relMonth ).toordinal()
+            )
+        return AggregatorParams.windowDays[ day ]
+
+    @staticmethod
+    def getWindows(dates):
+        """
+        Array ( ini, end ) of window of each ordinal day of 'dates'
+        """
+        days, inverse = np.unique( dates, return_inverse=True )
+        windows = np.array( [ AggregatorParams.getWindowDay( day ) for day in days.tolist() ], dtype=np.int32 )
+        return windows.reshape( -1, 2 )[ inverse.reshape( -1 ) ]
+
+    @staticmethod
+    def getAlertWkb(idx):
+        return AggregatorParams.alertStore.getWkb( idx )
+
+    @staticmethod
+    def getAlertGeometry(idx):
+        """
+        Geometry in metric CRS
+        """
+        return AggregatorParams.alertStore.getGeometry( idx )
+
+    @staticmethod
+    def getAlertItem(idx):
+        """
+        Item with the geometry (metric CRS) and area of store
+        """
+        store = AggregatorParams.alertStore
+        return {
+            'idx': idx,
+            'fid_source': int( store.objectid[ idx ] ),
+            'date': store.getDate( idx ),
+            'type': store.getType( idx ),
+            'stage': store.getStage( idx ),
+            'areaHa': float( store.areaHa[ idx ] ),
+            'geometry': store.getGeometry( idx )
+        }
+
+    @staticmethod
+    def queryAlerts(envelope):
+        """
+        Return index of alerts, not in a group, with envelope intersecting 'envelope'
+        """
+        t = Metrics.start()
+        idxs = AggregatorParams.alertIndex.query( envelope )
+        idxs = idxs[ ~AggregatorParams.alertDeleted[ idxs ] ]
+        Metrics.stop( 'query_spatial', t, len( idxs ) )
+        return idxs
 
     @staticmethod
     def getBufferBoundBox( geometry):
@@ -134,28 +325,138 @@ class AggregatorParams():
         return geom.GetArea() / 10000
 
     @staticmethod
-    def getItemFromFeature(feature):
-        items = feature.items()
-        data_imagem = datetime.strptime( items[AggregatorParams.field_date], '%Y/%m/%d %H:%M:%S')
-        return {
-            'fid_feature': feature.GetFID(),
-            'fid_source': items[ AggregatorParams.field_fid ],
-            'date': data_imagem.date(),
-            'type': items[ AggregatorParams.field_type ],
-            'stage': items[ AggregatorParams.field_stage ],
-            'geometry': feature.GetGeometryRef().Clone()
-        }
+    def getGeometryOrigin(geometry, clone=False):
+        """
+        Geometry from metric CRS to CRS of alert
+        """
+        geom = geometry.Clone() if clone else geometry
+        geom.Transform( AggregatorParams.ctOrigin )
+        return geom
+
+    @staticmethod
+    def getDate(value):
+        return datetime.strptime( value[:19], '%Y/%m/%d %H:%M:%S').date() # Without milliseconds and time zone (GeoPackage, FlatGeobuf)
+
+    @staticmethod
+    def unionCascaded(geometries):
+        """
+        Return the cascaded union (tree reduced) of polygons in one GEOS call.
+        Return None if fail or the union is invalid, caller must isolate the invalid member.
+        """
+        multiPolygon = ogr.Geometry( ogr.wkbMultiPolygon )
+        for geom in geometries:
+            geomType = geom.GetGeometryType()
+            if geomType == ogr.wkbPolygon:
+                multiPolygon.AddGeometry( geom )
+            elif geomType == ogr.wkbMultiPolygon:
+                for id in range( geom.GetGeometryCount() ):
+                    multiPolygon.AddGeometry( geom.GetGeometryRef( id ) )
+            else:
+                return None
+        t = Metrics.start()
+        try:
+            union = multiPolygon.UnionCascaded()
+        except Exception:
+            union = None
+        Metrics.stop( 'union_cascaded', t, len( geometries ) )
+        if union is None or union.IsValid() == False:
+            return None
+        r = AggregatorParams.checkMultiPolygon( union )
+        if r['hasInvalid']:
+            return None
+        if r['hasChange']:
+            union.Destroy()
+            union = r['geometry']
+        return union
+
+    @staticmethod
+    def hasPrecision():
+        return not AggregatorParams.grid_meter is None or not AggregatorParams.simplify_meter is None
+
+    @staticmethod
+    def hasPrecisionGrid():
+        """
+        Snap to grid: OGR (GDAL >= 3.9) or Shapely 2
+        """
+        return hasattr( ogr.Geometry, 'SetPrecision' ) or not set_precision is None
 
     @staticmethod
-    def saveGroupItem(layer, item):
-        defn = layer.GetLayerDefn()
-        feat = ogr.Feature( defn )
-        feat.SetGeometry( item['geometry'] )
-        del item['geometry']
-        for k in item:
-            feat.SetField( k, item[ k ] )
-        layer.CreateFeature( feat )
-        feat = None
+    def getTotalVertex(geometry):
+        total = geometry.GetGeometryCount()
+        if total == 0:
+            return geometry.GetPointCount()
+        return sum( AggregatorParams.getTotalVertex( geometry.GetGeometryRef( id ) ) for id in range( total ) )
+
+    @staticmethod
+    def reducePrecision(geometry):
+        """
+        Simplify (preserve topology, simplify_meter) and snap to grid (grid_meter) the geometry in metric CRS.
+        Return the MultiPolygon reduced, or 'geometry' if the result is empty, invalid or not polygon.
+        The areas and vertices, exact and reduced, are added in Metrics ( 'precision_*' ), see getPrecisionReport
+        """
+        if not AggregatorParams.hasPrecision():
+            return geometry
+        t = Metrics.start()
+        geom = geometry
+        try:
+            if not AggregatorParams.simplify_meter is None:
+                geom = geom.SimplifyPreserveTopology( AggregatorParams.simplify_meter )
+            if not AggregatorParams.grid_meter is None:
+                if hasattr( geom, 'SetPrecision' ):
+                    geom = geom.SetPrecision( AggregatorParams.grid_meter )
+                else:
+                    shape = set_precision( shapelyWkb.loads( bytes( geom.ExportToWkb() ) ), AggregatorParams.grid_meter )
+                    geom = ogr.CreateGeometryFromWkb( shapelyWkb.dumps( shape ) )
+        except Exception:
+            geom = None
+        Metrics.stop( 'precision', t )
+        polygons = ( ogr.wkbPolygon, ogr.wkbMultiPolygon )
+        if geom is None or geom.IsEmpty() or not ogr.GT_Flatten( geom.GetGeometryType() ) in polygons or not geom.IsValid():
+            Metrics.addCount( 'precision_kept' )
+            return geometry
+        geom = ogr.ForceToMultiPolygon( geom )
+        Metrics.addCount( 'precision_area_exact', geometry.GetArea() )
+        Metrics.addCount( 'precision_area_reduced', geom.GetArea() )
+        Metrics.addCount( 'precision_vertex_exact', AggregatorParams.getTotalVertex( geometry ) )
+        Metrics.addCount( 'precision_vertex_reduced', AggregatorParams.getTotalVertex( geom ) )
+        return geom
+
+    @staticmethod
+    def reducePrecisionOrigin(geometry):
+        """
+        reducePrecision of geometry in CRS of alert
+        """
+        geom = geometry.Clone()
+        geom.Transform( AggregatorParams.ctArea )
+        reduced = AggregatorParams.reducePrecision( geom )
+        if reduced is geom:
+            return geometry
+        reduced.Transform( AggregatorParams.ctOrigin )
+        return reduced
+
+    @staticmethod
+    def getPrecisionReport():
+        """
+        Drift of area (reduced - exact) of reducePrecision, from Metrics (also of workers)
+        """
+        stages = Metrics.getState()
+        def getTotal(name):
+            return stages[ name ]['items'] if name in stages else 0
+
+        areaExact = getTotal( 'precision_area_exact' ) / 10000
+        areaReduced = getTotal( 'precision_area_reduced' ) / 10000
+        return {
+            'gridMeter': AggregatorParams.grid_meter,
+            'simplifyMeter': AggregatorParams.simplify_meter,
+            'geometries': Metrics.getTotal( 'precision' )[0],
+            'kept': getTotal( 'precision_kept' ),
+            'areaExactHa': areaExact,
+            'areaReducedHa': areaReduced,
+            'driftHa': areaReduced - areaExact,
+            'driftPercent': 0.0 if areaExact == 0 else ( areaReduced - areaExact ) / areaExact * 100,
+            'vertexExact': getTotal( 'precision_vertex_exact' ),
+            'vertexReduced': getTotal( 'precision_vertex_reduced' )
+        }
 
     @staticmethod
     def checkMultiPolygon(geomCheck ):
@@ -186,174 +487,427 @@ class AggregatorParams():
             return { 'hasChange': False, 'hasInvalid': True }
         return { 'hasChange': True, 'hasInvalid': False, 'geometry': multiPolygon }
 
+class GroupMembers():
+    """
+    Accumulator of members of group: FIDs (integer array), days of events (set of ordinal days),
+    tipos and estagios (bitset of categories, one bit by value).
+    The FIDs of alerts (addFid) keep their day, rows of membership table (getMembers).
+    The string columns ( 'fids', 'dates_ev', 'tipos', 'estagios' ) are created only by getValues (write)
+    and read once by addValues (group of aggregated table), the merge is linear on total of members.
+    """
+    categories = { 'tipos': {}, 'estagios': {} } # value -> bit, by process
+    values = { 'tipos': [], 'estagios': [] } # bit -> value
+
+    def __init__(self):
+        self.fids = array('q') # Alerts, by addFid
+        self.fidDays = array('i') # Ordinal day of fids
+        self.fidsTable = array('q') # From aggregated table, by addValues
+        self.days = set()
+        self.bits = { 'tipos': 0, 'estagios': 0 }
+
+    @staticmethod
+    def getBit(name, value):
+        categories = GroupMembers.categories[ name ]
+        if not value in categories:
+            categories[ value ] = len( categories )
+            GroupMembers.values[ name ].append( value )
+        return categories[ value ]
+
+    def addFid(self, fid, day):
+        self.fids.append( fid )
+        self.fidDays.append( day.toordinal() )
+
+    def addItem(self, item):
+        """
+        Date, type and stage of alert (AggregatorParams.getAlertItem)
+        """
+        self.days.add( item['date'].toordinal() )
+        self.bits['tipos'] |= 1 << GroupMembers.getBit( 'tipos', item['type'] )
+        self.bits['estagios'] |= 1 << GroupMembers.getBit( 'estagios', item['stage'] )
+
+    def addValues(self, values):
+        """
+        Members from string columns (feature or group of aggregated table)
+        """
+        sep = AggregatorParams.sep_join
+        self.fidsTable.extend( int( fid ) for fid in values['fids'].split( sep ) )
+        self.days.update( date.fromisoformat( d ).toordinal() for d in values['dates_ev'].split( sep ) )
+        for name in ( 'tipos', 'estagios' ):
+            for value in values[ name ].split( sep ):
+                self.bits[ name ] |= 1 << GroupMembers.getBit( name, value )
+
+    def getValues(self):
+        """
+        Return the string columns and the totals ( 'n_fids', 'n_events' )
+        """
+        def getCategories(name):
+            bits, values = self.bits[ name ], GroupMembers.values[ name ]
+            return sorted( values[ bit ] for bit in range( bits.bit_length() ) if bits >> bit & 1 )
+
+        sep = AggregatorParams.sep_join
+        fids = np.unique( np.concatenate( ( np.frombuffer( self.fids, dtype=np.int64 ), np.frombuffer( self.fidsTable, dtype=np.int64 ) ) ) )
+        return {
+            'n_events': len( self.days ),
+            'n_fids': len( fids ),
+            'fids': sep.join( sorted( str( fid ) for fid in fids.tolist() ) ),
+            'dates_ev': sep.join( date.fromordinal( day ).strftime("%Y-%m-%d") for day in sorted( self.days ) ),
+            'tipos': sep.join( getCategories( 'tipos' ) ),
+            'estagios': sep.join( getCategories( 'estagios' ) )
+        }
+
+    def getMembers(self):
+        """
+        Return ( objectids, days ), arrays of alerts added by addFid
+        """
+        return ( np.array( self.fids, dtype=np.int64 ), np.array( self.fidDays, dtype=np.int32 ) )
+
 class ChainPolygons():
     type_fid_invalid = None
     invalidUnions = [] # ItemInvalidUnion.getItem
 
-    def __init__(self, feature):
-        self.seed = AggregatorParams.getItemFromFeature( feature )
-        AggregatorParams.layerAlert.DeleteFeature( self.seed['fid_feature'] )
+    def __init__(self, idx):
+        self.seed = AggregatorParams.getAlertItem( idx )
+        AggregatorParams.alertDeleted[ idx ] = True
 
-        self.itemsOutDate = [] # Temporaly, delete in 'search'
+        self.itemsOutDate = [] # Index of alerts, temporaly, delete in 'search'
         self.itemsWithinDate = [] # Using for add features in Group
-        self.dateIni = self.seed['date']
-        self.dateEnd = self.seed['date']
+        self.idxIni = idx # Alert with the first date of chain
+        self.idxEnd = idx # Alert with the last date of chain
         self.branches = [] # ChainPolygons
 
-    def search(self, dateIni=None, dateEnd=None):
-        def isWithinDate(date):
-            return ( self.dateIni - AggregatorParams.relMonth ) <= date <= ( self.dateEnd + AggregatorParams.relMonth )
+    def search(self, idxIni=None, idxEnd=None):
+        def getWindow():
+            """
+            Ordinal days ( ini, end ) of dates for add in group
+            """
+            return ( windows[ self.idxIni, 0 ], windows[ self.idxEnd, 1 ] )
 
-        def setDates(date):
-            if date <  self.dateIni:
-                self.dateIni = date
-            if date >  self.dateEnd:
-                self.dateEnd = date
+        def setDates(idx):
+            if dates[ idx ] < dates[ self.idxIni ]:
+                self.idxIni = idx
+            if dates[ idx ] > dates[ self.idxEnd ]:
+                self.idxEnd = idx
 
         def checkItemsOutDate():
+            """
+            The Intersects of itemsOutDate is deferred until the alert is inside window of dates.
+            Sweep by date: the window only grows, the alerts before (descending) and after (ascending)
+            the window are added to test when the window reaches them, each alert is visited once.
+            """
             if len( self.itemsOutDate ) == 0:
                 del self.itemsOutDate
                 return
-            
-            removeFids = []
-            for id in range( len( self.itemsOutDate ) ):
-                item = self.itemsOutDate[ id ]
-                if isWithinDate( item['date'] ):
-                    self.itemsWithinDate.append( item )
-                    removeFids.append( id )
-                    setDates( item['date'] )
-                    if not AggregatorParams.layerAlert.GetFeature( item['fid_feature'] ) is None:
-                        AggregatorParams.layerAlert.DeleteFeature( item['fid_feature'] )
-                    
-            if len( removeFids ) == 0:
-                del self.itemsOutDate[:]
-                del self.itemsOutDate
-                return
-
-            removeFids.reverse()
-            for id in removeFids:
-                del self.itemsOutDate[ id ]
-            del removeFids[:]
-            checkItemsOutDate()
-
-        if not dateIni is None:
-            self.dateIni = dateIni
-        if not dateEnd is None:
-            self.dateEnd = dateEnd
-
-        bboxBuffer = AggregatorParams.getBufferBoundBox( self.seed['geometry'] )
-        AggregatorParams.layerAlert.SetSpatialFilter( bboxBuffer )
-        buffGeom = AggregatorParams.getBuffer( self.seed['geometry'], True )
-        for feat in AggregatorParams.layerAlert:
-            item = AggregatorParams.getItemFromFeature( feat )
-            if buffGeom.Intersects( item['geometry'] ):
-                if isWithinDate( item['date'] ):
-                    self.branches.append( ChainPolygons( feat ) )
-                    setDates( item['date'] )
-                else:
-                    self.itemsOutDate.append( item )
+            idxsOut = np.array( self.itemsOutDate, dtype=np.int64 )
+            datesOut = dates[ idxsOut ]
+            order = np.argsort( datesOut, kind='stable' )
+            idxsOut, datesOut = idxsOut[ order ], datesOut[ order ]
+            ( dateIni, dateEnd ) = getWindow()
+            posBefore = int( np.searchsorted( datesOut, dateIni, 'left' ) ) - 1
+            posAfter = int( np.searchsorted( datesOut, dateEnd, 'right' ) )
+            poss = list( range( posBefore + 1, posAfter ) )
+            while len( poss ) > 0:
+                for pos in sorted( poss, key=lambda pos: idxsOut[ pos ] ):
+                    idx = idxsOut[ pos ]
+                    if AggregatorParams.alertDeleted[ idx ]: # Added by other branch
+                        continue
+                    if buffGeom.intersectsWkb( AggregatorParams.getAlertWkb( idx ) ):
+                        item = AggregatorParams.getAlertItem( idx )
+                        self.itemsWithinDate.append( item )
+                        setDates( idx )
+                        AggregatorParams.alertDeleted[ idx ] = True
+                ( dateIni, dateEnd ) = getWindow()
+                poss = []
+                while posBefore >= 0 and datesOut[ posBefore ] >= dateIni:
+                    poss.append( posBefore )
+                    posBefore -= 1
+                while posAfter < len( datesOut ) and datesOut[ posAfter ] <= dateEnd:
+                    poss.append( posAfter )
+                    posAfter += 1
+            del self.itemsOutDate
+
+        dates = AggregatorParams.alertStore.dates
+        windows = AggregatorParams.alertWindows
+        if not idxIni is None:
+            self.idxIni = idxIni
+        if not idxEnd is None:
+            self.idxEnd = idxEnd
+
+        bboxBuffer = AggregatorParams.alertBufferEnvelopes[ self.seed['idx'] ]
+        buffGeom = PreparedGeometry( self.seed['geometry'].Buffer( AggregatorParams.buffer_meter ) )
+        ( dateIni, dateEnd ) = getWindow()
+        idxs = AggregatorParams.queryAlerts( bboxBuffer )
+        withinDate = ( dates[ idxs ] >= dateIni ) & ( dates[ idxs ] <= dateEnd ) # The window only grows inside loop
+        for idx, isWithinDate in zip( idxs, withinDate ):
+            if AggregatorParams.alertDeleted[ idx ]:
+                continue
+            if not isWithinDate and not dateIni <= dates[ idx ] <= dateEnd:
+                self.itemsOutDate.append( idx )
+                continue
+            if buffGeom.intersectsWkb( AggregatorParams.getAlertWkb( idx ) ):
+                branch = ChainPolygons( idx )
+                self.branches.append( branch )
+                setDates( idx )
+                ( dateIni, dateEnd ) = getWindow()
 
-        AggregatorParams.layerAlert.SetSpatialFilter( None )
         for branch in self.branches:
-            branch.search( self.dateIni, self.dateEnd )
-            self.dateIni = branch.dateIni
-            self.dateEnd = branch.dateEnd
+            branch.search( self.idxIni, self.idxEnd )
+            self.idxIni = branch.idxIni
+            self.idxEnd = branch.idxEnd
 
-        AggregatorParams.layerAlert.SetSpatialFilter( None )
         checkItemsOutDate()
 
-    def initValues(self):
-        date = self.seed['date']
+    @staticmethod
+    def getInitValues(seed, dateIni, dateEnd):
+        members = GroupMembers()
+        members.addFid( seed['fid_source'], seed['date'] )
+        members.addItem( seed )
         return {
-            'areaHa': AggregatorParams.getAreaHa( self.seed['geometry'] ),
-            'fids': [ self.seed['fid_source'] ],
-            'dates': { 'ini': self.dateIni, 'end': self.dateEnd },
-            'dates_ev': [ date ],
-            'tipos': [ self.seed['type'] ],
-            'estagios': [ self.seed['stage'] ],
-            'union': self.seed['geometry']
+            'areaHa': seed['areaHa'],
+            'dates': { 'ini': dateIni, 'end': dateEnd },
+            'members': members,
+            'union': seed['geometry']
         }
 
-    def groupValues(self, value, branches):
-        def addUniqueValues(item, value):
-            items_values = [
-                { 'item': 'date', 'value': 'dates_ev' },
-                { 'item': 'type', 'value': 'tipos' },
-                { 'item': 'stage', 'value': 'estagios' }
-            ]
-            for iv in items_values:
-                if not item[ iv['item'] ] in value[ iv['value'] ]:
-                    value[ iv['value'] ].append( item[ iv['item'] ] )
-
-        def addUnion(item, value):
-            union, msg = None, None
-            try:
-                union = value['union'].Union( item['geometry'] )
-            except Exception as error:
-                msg = "{}".format( error )
-            if union is None or union.IsValid() == False:
-                msg = msg if union is None else 'Union is not Valid'
-                iiu = ItemInvalidUnion( item['fid_source'], self.type_fid_invalid, msg, item['geometry'] )
-                self.invalidUnions.append( iiu.getItem() )
-                return
-            r = AggregatorParams.checkMultiPolygon( union )
-            if r['hasChange']:
-                union.Destroy()
-                union = r['geometry']
-            if r['hasInvalid']:
-                msg = 'Missing polygon in Union'
-                iiu = ItemInvalidUnion( item['fid_source'], self.type_fid_invalid, msg, item['geometry'] )
-                self.invalidUnions.append(  iiu.getItem() )
-                return
-            value['union'].Destroy()
-            value['union'] = union
+    def initValues(self):
+        store = AggregatorParams.alertStore
+        return self.getInitValues( self.seed, store.getDate( self.idxIni ), store.getDate( self.idxEnd ) )
+
+    @staticmethod
+    def addInvalidUnion(item, msg):
+        geom = AggregatorParams.getGeometryOrigin( item['geometry'], True )
+        iiu = ItemInvalidUnion( item['fid_source'], ChainPolygons.type_fid_invalid, msg, geom )
+        ChainPolygons.invalidUnions.append( iiu.getItem() )
+        Metrics.addCount( 'invalid_union' )
+
+    @staticmethod
+    def addUnion(item, value):
+        union, msg = None, None
+        t = Metrics.start()
+        try:
+            union = value['union'].Union( item['geometry'] )
+        except Exception as error:
+            msg = "{}".format( error )
+        Metrics.stop( 'union', t )
+        if union is None or union.IsValid() == False:
+            msg = msg if union is None else 'Union is not Valid'
+            ChainPolygons.addInvalidUnion( item, msg )
+            return
+        r = AggregatorParams.checkMultiPolygon( union )
+        if r['hasChange']:
+            union.Destroy()
+            union = r['geometry']
+        if r['hasInvalid']:
+            msg = 'Missing polygon in Union'
+            ChainPolygons.addInvalidUnion( item, msg )
+            return
+        value['union'].Destroy()
+        value['union'] = union
+
+    @staticmethod
+    def setUnion(value, items):
+        """
+        Set value['union'] with the cascaded union of items.
+        If the cascaded union fails, add one by one, for isolate the invalid items.
+        """
+        if len( items ) == 0:
+            return
+        geometries = [ value['union'] ] + [ item['geometry'] for item in items ]
+        union = AggregatorParams.unionCascaded( geometries )
+        if union is None:
+            for item in items:
+                ChainPolygons.addUnion( item, value )
+            return
+        value['union'].Destroy()
+        value['union'] = union
+
+    def groupValues(self, value, branches, items=None):
+        """
+        Add values of branches, the geometries are added in 'items' for union later (setUnion)
+        """
+        if items is None:
+            items = []
+            self.groupValues( value, branches, items )
+            self.setUnion( value, items )
+            return
 
         for branch in branches:
-            value['fids'].append( branch.seed['fid_source'] )
-            addUniqueValues( branch.seed, value )
-            addUnion( branch.seed, value )
+            value['members'].addFid( branch.seed['fid_source'], branch.seed['date'] )
+            value['members'].addItem( branch.seed )
+            items.append( branch.seed )
         
         for branch in branches:
-            self.groupValues( value, branch.branches )
+            branch.groupValues( value, branch.branches, items ) # Items within date of branch
 
         if len( self.itemsWithinDate ) > 0:
             for item in self.itemsWithinDate:
-                addUniqueValues( item, value )
-                addUnion( item, value )
+                value['members'].addFid( item['fid_source'], item['date'] )
+                value['members'].addItem( item )
+                items.append( item )
+
+class UnionFind():
+    """
+    Disjoint sets of alert index, array-backed (union by rank and path halving)
+    """
+    def __init__(self, size):
+        self.parent = np.arange( size, dtype=np.int64 )
+        self.rank = np.zeros( size, dtype=np.int8 )
+
+    def find(self, idx):
+        parent = self.parent
+        while parent[ idx ] != idx:
+            parent[ idx ] = parent[ parent[ idx ] ]
+            idx = parent[ idx ]
+        return idx
+
+    def union(self, idx1, idx2):
+        root1, root2 = self.find( idx1 ), self.find( idx2 )
+        if root1 == root2:
+            return False
+        if self.rank[ root1 ] < self.rank[ root2 ]:
+            root1, root2 = root2, root1
+        self.parent[ root2 ] = root1
+        if self.rank[ root1 ] == self.rank[ root2 ]:
+            self.rank[ root1 ] += 1
+        return True
+
+    def components(self):
+        """
+        Return the members (ascending) of each set, sets ordered by first member
+        """
+        if len( self.parent ) == 0:
+            return []
+        roots = self.parent.copy()
+        while True:
+            rootsParent = roots[ roots ]
+            if np.array_equal( rootsParent, roots ):
+                break
+            roots = rootsParent
+        order = np.lexsort( ( np.arange( len( roots ) ), roots ) )
+        bounds = np.flatnonzero( np.diff( roots[ order ] ) ) + 1
+        components = np.split( order, bounds )
+        components.sort( key=lambda members: members[0] )
+        return components
+
+class ComponentPolygons():
+    """
+    Groups are the connected components of the neighbour graph.
+    Two alerts are neighbours when the buffer of one intersects the other
+    and their dates are within 'relMonth'.
+    The graph is computed once, without recursion.
+    Difference of chain engine (ChainPolygons), the window of dates:
+     - components: window of each pair of alerts ( date - relMonth, date + relMonth ).
+     - chain: window of group ( first date - relMonth, last date + relMonth ), it grows with the members,
+       an alert can be added by a member outside of its window. Alerts added when the window reaches them
+       (itemsWithinDate) don't search their neighbours.
+    Ex.: A (January) and B (June) neighbours, C (September) neighbour only of A:
+     chain { A, B, C }, components { A, B } and { C }.
+    When all dates are inside one window, the groups are the same (test_aggregatorgroup.py).
+    """
+    @staticmethod
+    def getNeighbours(idx):
+        """
+        Index of alerts, greater than 'idx', inside buffer envelope and window of dates
+        """
+        ( dateIni, dateEnd ) = AggregatorParams.alertWindows[ idx ]
+        t = Metrics.start()
+        idxs = AggregatorParams.getAlertIndexDate().query( AggregatorParams.alertBufferEnvelopes[ idx ], dateIni, dateEnd )
+        idxs = idxs[ idxs > idx ]
+        Metrics.stop( 'query_spatial', t, len( idxs ) )
+        return idxs
+
+    @staticmethod
+    def getPairs():
+        for idx in range( len( AggregatorParams.alertStore ) ):
+            idxs = ComponentPolygons.getNeighbours( idx )
+            if len( idxs ) == 0:
+                continue
+            buffGeom = PreparedGeometry( AggregatorParams.getAlertGeometry( idx ).Buffer( AggregatorParams.buffer_meter ) )
+            for idxNeighbour in idxs:
+                if buffGeom.intersectsWkb( AggregatorParams.getAlertWkb( idxNeighbour ) ):
+                    yield idx, idxNeighbour
+
+    @staticmethod
+    def getValues(items):
+        """
+        Values of group from items of members, the first is the seed
+        """
+        dates = [ item['date'] for item in items ]
+        value = ChainPolygons.getInitValues( items[0], min( dates ), max( dates ) )
+        for item in items[1:]:
+            value['members'].addFid( item['fid_source'], item['date'] )
+            value['members'].addItem( item )
+        ChainPolygons.setUnion( value, items[1:] )
+        return value
+
+class EngineGroup(Enum):
+    CHAIN = 'chain'
+    COMPONENTS = 'components'
 
 class AggregatorGroup():
+    engine = EngineGroup.CHAIN
+
     @staticmethod
-    def init(tableAlert):
+    def init(tableAlert, engine=EngineGroup.CHAIN):
         ChainPolygons.type_fid_invalid = f"{AggregatorParams.field_fid} from '{tableAlert}'"
         ChainPolygons.invalidUnions.clear()
+        AggregatorGroup.engine = engine
+
+    @staticmethod
+    def getGroup(idGroup, value):
+        """
+        Group with geometry in CRS of alert, value['union'] in metric CRS (reducePrecision).
+        'members': ( objectids, days ) for membership table, it is not a field of aggregated table
+        """
+        members = value['members'].getValues()
+        union = AggregatorParams.reducePrecision( value['union'] )
+        return {
+            'id_group': idGroup,
+            'n_events': members['n_events'],
+            'ini_date': value['dates']['ini'].strftime("%Y-%m-%d"),
+            'end_date': value['dates']['end'].strftime("%Y-%m-%d"),
+            'ini_ha': value['areaHa'],
+            'end_ha': union.GetArea() / 10000,
+            'n_fids': members['n_fids'],
+            'fids': members['fids'],
+            'dates_ev': members['dates_ev'],
+            'tipos': members['tipos'],
+            'estagios': members['estagios'],
+            'members': value['members'].getMembers(),
+            'geometry': AggregatorParams.getGeometryOrigin( union )
+        }
+
+    @staticmethod
+    def createGroups(totalNewGroup=0):
+        """
+        Resume: 'totalNewGroup' groups already created, their alerts in AggregatorParams.alertDeleted
+        """
+        if AggregatorGroup.engine == EngineGroup.COMPONENTS:
+            return AggregatorGroup.createGroupsComponents()
+        return AggregatorGroup.createGroupsChain( totalNewGroup )
 
     @staticmethod
-    def createGroups():
-        def createGroup(idGroup, chainPolygons):
+    def createGroupsChain(totalNewGroup=0):
+        for idx in range( len( AggregatorParams.alertStore ) ):
+            if AggregatorParams.alertDeleted[ idx ]:
+                continue
+            chainPolygons = ChainPolygons( idx )
+            chainPolygons.search()
+            totalNewGroup += 1
             value = chainPolygons.initValues()
             chainPolygons.groupValues( value, chainPolygons.branches )
-            return {
-                'id_group': idGroup,
-                'n_events': len( value['dates_ev'] ),
-                'ini_date': value['dates']['ini'].strftime("%Y-%m-%d"),
-                'end_date': value['dates']['end'].strftime("%Y-%m-%d"),
-                'ini_ha': value['areaHa'],
-                'end_ha': AggregatorParams.getAreaHa( value['union'] ),
-                'n_fids': len( value['fids'] ),
-                'fids': AggregatorParams.sep_join.join( sorted( [ str(fid) for fid in  value['fids']  ] ) ),
-                'dates_ev': AggregatorParams.sep_join.join( sorted( [ d.strftime("%Y-%m-%d") for d in value['dates_ev'] ] ) ),
-                'tipos': AggregatorParams.sep_join.join( sorted( value['tipos'] ) ),
-                'estagios': AggregatorParams.sep_join.join( sorted( value['estagios'] ) ),
-                'geometry': value['union']
-            }
+            yield AggregatorGroup.getGroup( totalNewGroup, value )
 
+    @staticmethod
+    def createGroupsComponents():
+        unionFind = UnionFind( len( AggregatorParams.alertStore ) )
+        for idx1, idx2 in ComponentPolygons.getPairs():
+            unionFind.union( idx1, idx2 )
         totalNewGroup = 0
-        while(1):
-            feat = AggregatorParams.layerAlert.GetNextFeature()
-            if feat is None:
-                break
-            chainPolygons = ChainPolygons( feat )
-            chainPolygons.search()
+        for members in unionFind.components():
             totalNewGroup += 1
-            group = createGroup( totalNewGroup, chainPolygons )
-            yield group
+            if AggregatorParams.alertDeleted[ members[0] ]: # Resume
+                continue
+            AggregatorParams.alertDeleted[ members ] = True
+            items = [ AggregatorParams.getAlertItem( idx ) for idx in members ]
+            value = ComponentPolygons.getValues( items )
+            yield AggregatorGroup.getGroup( totalNewGroup, value )
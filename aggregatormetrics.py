@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Aggregator Metrics
+Description          : Counters and times by stage of run
+                       -------------------
+Begin                : 2026-10-16
+Copyright            : (C) 2026 by IBAMA
+email                : motta dot luiz at gmail.com
+
+Update: 2026-10-16
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import time, random, threading
+
+import numpy as np
+
+class Metrics():
+    """
+    By stage: total of calls, total of items, cumulative seconds and
+    a sample (reservoir) of seconds by call for percentiles.
+    Stages: see 'stages' keys, the workers (AggregatorParallel) send their state for merge.
+    The threads of AggregatorPipeline add in the same stages (lock).
+    """
+    stages = {} # name -> { 'count', 'items', 'seconds', 'max', 'samples' }
+    sizeSample = 10000
+    percentiles = ( 50, 90, 99 )
+    _random = random.Random( 0 )
+    _lock = threading.Lock()
+
+    @staticmethod
+    def reset():
+        Metrics.stages = {}
+        Metrics._random.seed( 0 )
+
+    @staticmethod
+    def _getStage(name):
+        if not name in Metrics.stages:
+            Metrics.stages[ name ] = { 'count': 0, 'items': 0, 'seconds': 0.0, 'max': 0.0, 'samples': [] }
+        return Metrics.stages[ name ]
+
+    @staticmethod
+    def add(name, seconds, items=1):
+        with Metrics._lock:
+            Metrics._add( name, seconds, items )
+
+    @staticmethod
+    def _add(name, seconds, items):
+        stage = Metrics._getStage( name )
+        stage['count'] += 1
+        stage['items'] += items
+        stage['seconds'] += seconds
+        stage['max'] = max( stage['max'], seconds )
+        samples = stage['samples']
+        if len( samples ) < Metrics.sizeSample:
+            samples.append( seconds )
+            return
+        id = Metrics._random.randrange( stage['count'] )
+        if id < Metrics.sizeSample:
+            samples[ id ] = seconds
+
+    @staticmethod
+    def addCount(name, items=1):
+        """
+        Counter without time (ex.: invalid unions)
+        """
+        with Metrics._lock:
+            stage = Metrics._getStage( name )
+            stage['items'] += items
+
+    @staticmethod
+    def start():
+        return time.perf_counter()
+
+    @staticmethod
+    def stop(name, timeStart, items=1):
+        Metrics.add( name, time.perf_counter() - timeStart, items )
+
+    @staticmethod
+    def iterate(name, iterable):
+        """
+        Yield the items of iterable, the time for produce each item is added in 'name'
+        """
+        iterator = iter( iterable )
+        while True:
+            t = Metrics.start()
+            try:
+                item = next( iterator )
+            except StopIteration:
+                return
+            Metrics.stop( name, t )
+            yield item
+
+    @staticmethod
+    def getState():
+        return Metrics.stages
+
+    @staticmethod
+    def merge(state):
+        with Metrics._lock:
+            Metrics._merge( state )
+
+    @staticmethod
+    def _merge(state):
+        for name, other in state.items():
+            stage = Metrics._getStage( name )
+            for k in ( 'count', 'items', 'seconds' ):
+                stage[ k ] += other[ k ]
+            stage['max'] = max( stage['max'], other['max'] )
+            samples = stage['samples'] + other['samples']
+            if len( samples ) > Metrics.sizeSample:
+                samples = Metrics._random.sample( samples, Metrics.sizeSample )
+            stage['samples'] = samples
+
+    @staticmethod
+    def getTotal(name):
+        stage = Metrics.stages.get( name )
+        return ( 0, 0.0 ) if stage is None else ( stage['count'], stage['seconds'] )
+
+    @staticmethod
+    def getReport():
+        """
+        Return { stage: { 'count', 'items', 'seconds', 'p50', 'p90', 'p99', 'max' } }, seconds by call in percentiles
+        """
+        report = {}
+        for name in sorted( Metrics.stages ):
+            stage = Metrics.stages[ name ]
+            value = { k: stage[ k ] for k in ( 'count', 'items', 'seconds', 'max' ) }
+            if len( stage['samples'] ) > 0:
+                samples = np.array( stage['samples'] )
+                for p in Metrics.percentiles:
+                    value[ f"p{p}" ] = float( np.percentile( samples, p ) )
+            report[ name ] = value
+        return report
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Aggregator Parallel
+Description          : Aggregate neighbour polygon in process pool, partitioned by spatial tiles
+                       -------------------
+Begin                : 2026-10-16
+Copyright            : (C) 2026 by IBAMA
+email                : motta dot luiz at gmail.com
+
+Update: 2026-10-16
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Implementation: same groups of the components engine (EngineGroup.COMPONENTS),
+not of the chain engine (default), see ComponentPolygons
+ 1) Tiles: the alerts are partitioned in tiles (Sort-Tile-Recursive), the halo
+    of tile is the extent of buffer(buffer_meter) of alerts of tile.
+    The geometries are in metric CRS (AggregatorParams.setAlert).
+ 2) Pairs: each worker computes the neighbour pairs of the alerts of one tile,
+    the neighbours can be in halo.
+ 3) Merge: the pairs of all tiles are merged by union-find (groups crossing tiles).
+ 4) Groups: each worker creates the values and union of a batch of groups.
+The workers are forked after the load of alerts: they read the AlertStore (and indexes) of parent,
+the tasks are only index of alerts. The tasks are submitted by demand ('tasksByWorker' by worker).
+"""
+
+import math
+from collections import deque
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from alertindex import STRTree
+from aggregatormetrics import Metrics
+from aggregatorgroup import PreparedGeometry, AggregatorParams, ChainPolygons, UnionFind, ComponentPolygons, AggregatorGroup
+
+try:
+    from osgeo import ogr
+except ImportError:
+    import ogr
+
+class AggregatorParallel():
+    workers = 1
+    tilesByWorker = 4
+    sizeBatch = 64 # Groups by task
+    tasksByWorker = 2 # Tasks submitted and not read, by worker (AggregatorParallel.map)
+
+    @staticmethod
+    def initWorker(wktSrs, buffer_meter, grid_meter, simplify_meter, relMonth, type_fid_invalid):
+        ogr.UseExceptions()
+        AggregatorParams.setParamsWkt( wktSrs )
+        AggregatorParams.buffer_meter = buffer_meter
+        AggregatorParams.grid_meter = grid_meter
+        AggregatorParams.simplify_meter = simplify_meter
+        AggregatorParams.relMonth = relMonth
+        AggregatorParams.windowDays.clear()
+        ChainPolygons.type_fid_invalid = type_fid_invalid
+        ChainPolygons.invalidUnions.clear()
+
+    @staticmethod
+    def getTiles(envelopes, totalTiles):
+        """
+        Return the index of alerts (ascending) by tile, about the same total of alerts by tile
+        """
+        total = len( envelopes )
+        if total == 0:
+            return []
+        centerX = ( envelopes[:, 0] + envelopes[:, 1] ) / 2
+        centerY = ( envelopes[:, 2] + envelopes[:, 3] ) / 2
+        totalSlices = math.ceil( math.sqrt( totalTiles ) )
+        sizeTile = math.ceil( total / ( totalSlices * totalSlices ) )
+        sizeSlice = sizeTile * totalSlices
+        order = np.argsort( centerX, kind='stable' )
+        idSlice = np.arange( total ) // sizeSlice
+        order = order[ np.lexsort( ( centerY[ order ], idSlice ) ) ]
+        return [ np.sort( order[ id : id + sizeTile ] ) for id in range( 0, total, sizeTile ) ]
+
+    @staticmethod
+    def getPairsTile(tile):
+        """
+        Worker: neighbour pairs ( idx1, idx2 ), idx1 < idx2 and idx1 in tile
+        Same rules of ComponentPolygons.getPairs
+        """
+        Metrics.reset()
+        store = AggregatorParams.alertStore
+        tileBuffer = AggregatorParams.alertBufferEnvelopes[ tile ]
+        halo = ( tileBuffer[:, 0].min(), tileBuffer[:, 1].max(), tileBuffer[:, 2].min(), tileBuffer[:, 3].max() )
+        idxs = AggregatorParams.alertIndex.query( halo )
+        tree = STRTree( store.envelopes[ idxs ], dates=store.dates[ idxs ] )
+        pairs = []
+        for idx, bufferEnvelope in zip( tile, tileBuffer ):
+            ( dateIni, dateEnd ) = AggregatorParams.alertWindows[ idx ]
+            t = Metrics.start()
+            idxsNeighbour = idxs[ tree.query( bufferEnvelope, dateIni, dateEnd ) ]
+            idxsNeighbour = idxsNeighbour[ idxsNeighbour > idx ]
+            Metrics.stop( 'query_spatial', t, len( idxsNeighbour ) )
+            if len( idxsNeighbour ) == 0:
+                continue
+            buffGeom = PreparedGeometry( AggregatorParams.getAlertGeometry( idx ).Buffer( AggregatorParams.buffer_meter ) )
+            for idxNeighbour in idxsNeighbour:
+                if buffGeom.intersectsWkb( AggregatorParams.getAlertWkb( idxNeighbour ) ):
+                    pairs.append( ( int( idx ), int( idxNeighbour ) ) )
+        return { 'pairs': pairs, 'metrics': Metrics.getState() }
+
+    @staticmethod
+    def getGroupsBatch(batch):
+        """
+        Worker: groups and invalid unions, geometries in WKB
+        batch: [ ( id_group, index of alerts ) ]
+        """
+        Metrics.reset()
+        groups = []
+        for idGroup, members in batch:
+            items = [ AggregatorParams.getAlertItem( idx ) for idx in members ]
+            value = ComponentPolygons.getValues( items )
+            group = AggregatorGroup.getGroup( idGroup, value )
+            group['geometry'] = group['geometry'].ExportToWkb()
+            groups.append( group )
+        invalidUnions = []
+        for item in ChainPolygons.invalidUnions:
+            item = dict( item )
+            item['geometry'] = item['geometry'].ExportToWkb()
+            invalidUnions.append( item )
+        ChainPolygons.invalidUnions.clear()
+        return { 'groups': groups, 'invalidUnions': invalidUnions, 'metrics': Metrics.getState() }
+
+    @staticmethod
+    def getTasksGroup(components):
+        batch = []
+        for idGroup, members in enumerate( components, 1 ):
+            if AggregatorParams.alertDeleted[ members[0] ]: # Resume
+                continue
+            batch.append( ( idGroup, members ) )
+            if len( batch ) == AggregatorParallel.sizeBatch:
+                yield batch
+                batch = []
+        if len( batch ) > 0:
+            yield batch
+
+    @staticmethod
+    def map(executor, function, tasks, workers=None):
+        """
+        Yield function( task ) in order of tasks, like executor.map,
+        but only 'tasksByWorker' tasks by worker are submitted (tasks and results in memory)
+        workers: processes of executor, default AggregatorParallel.workers
+        """
+        workers = AggregatorParallel.workers if workers is None else workers
+        futures = deque()
+        for task in tasks:
+            futures.append( executor.submit( function, task ) )
+            if len( futures ) >= workers * AggregatorParallel.tasksByWorker:
+                yield futures.popleft().result()
+        while len( futures ) > 0:
+            yield futures.popleft().result()
+
+    @staticmethod
+    def createGroups():
+        """
+        Generator of groups, same groups and id_group of AggregatorGroup.createGroups (EngineGroup.COMPONENTS)
+        """
+        args = (
+            AggregatorParams.srs.ExportToWkt(),
+            AggregatorParams.buffer_meter,
+            AggregatorParams.grid_meter,
+            AggregatorParams.simplify_meter,
+            AggregatorParams.relMonth,
+            ChainPolygons.type_fid_invalid
+        )
+        mpContext = get_context('fork') # Workers with the alerts of parent
+        with ProcessPoolExecutor( AggregatorParallel.workers, mp_context=mpContext, initializer=AggregatorParallel.initWorker, initargs=args ) as executor:
+            unionFind = UnionFind( len( AggregatorParams.alertStore ) )
+            totalTiles = AggregatorParallel.workers * AggregatorParallel.tilesByWorker
+            tiles = AggregatorParallel.getTiles( AggregatorParams.alertStore.envelopes, totalTiles )
+            for r in AggregatorParallel.map( executor, AggregatorParallel.getPairsTile, tiles ):
+                Metrics.merge( r['metrics'] )
+                for idx1, idx2 in r['pairs']:
+                    unionFind.union( idx1, idx2 )
+            components = unionFind.components()
+            tasks = AggregatorParallel.getTasksGroup( components )
+            for r in AggregatorParallel.map( executor, AggregatorParallel.getGroupsBatch, tasks ):
+                Metrics.merge( r['metrics'] )
+                for item in r['invalidUnions']:
+                    item['geometry'] = ogr.CreateGeometryFromWkb( item['geometry'] )
+                    ChainPolygons.invalidUnions.append( item )
+                for group in r['groups']:
+                    group['geometry'] = ogr.CreateGeometryFromWkb( group['geometry'] )
+                    AggregatorParams.alertDeleted[ components[ group['id_group'] - 1 ] ] = True
+                    yield group
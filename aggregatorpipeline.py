@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Aggregator Pipeline
+Description          : Stages in threads with bounded queues (read of alerts, write of groups)
+                       -------------------
+Begin                : 2026-10-16
+Copyright            : (C) 2026 by IBAMA
+email                : motta dot luiz at gmail.com
+
+Update: 2026-10-16
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Stages of create:
+ reader thread (fetch of alerts from datasource, pages of 'sizePage' features)
+  -> queue 'alerts' -> load in AlertStore (projection, validity) -> create groups (GEOS)
+  -> queue 'groups' -> writer thread (COPY of groups and members, checkpoint)
+The grouping needs all alerts (spatial index), the read overlaps the load and the create overlaps the write.
+The GDAL calls release the GIL, the DB and the CPU work at the same time.
+"""
+
+import queue, threading
+
+from aggregatormetrics import Metrics
+
+class PipelineQueue():
+    """
+    Bounded queue between two threads: depth at each put and the wait (stall) of producer (full)
+    and of consumer (empty), in Metrics ( 'pipeline_<name>_put_wait' and 'pipeline_<name>_get_wait' )
+    """
+    timeout = 0.5 # Seconds, check of stop between waits
+
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.queue = queue.Queue( depth )
+        self.stop = threading.Event()
+        self.totalPut = 0
+        self.totalDepth = 0
+        self.maxDepth = 0
+
+    def put(self, item):
+        """
+        Return False if the consumer stopped
+        """
+        t = Metrics.start()
+        while not self.stop.is_set():
+            try:
+                self.queue.put( item, timeout=PipelineQueue.timeout )
+            except queue.Full:
+                continue
+            Metrics.stop( f"pipeline_{self.name}_put_wait", t )
+            depth = self.queue.qsize()
+            self.totalPut += 1
+            self.totalDepth += depth
+            self.maxDepth = max( self.maxDepth, depth )
+            return True
+        return False
+
+    def get(self):
+        t = Metrics.start()
+        item = self.queue.get()
+        Metrics.stop( f"pipeline_{self.name}_get_wait", t )
+        return item
+
+    def getReport(self):
+        secondsPut = Metrics.getTotal( f"pipeline_{self.name}_put_wait" )[1]
+        secondsGet = Metrics.getTotal( f"pipeline_{self.name}_get_wait" )[1]
+        return {
+            'depth': self.depth,
+            'items': self.totalPut,
+            'depthMean': self.totalDepth / self.totalPut if self.totalPut > 0 else 0.0,
+            'depthMax': self.maxDepth,
+            'putWaitSeconds': secondsPut,
+            'getWaitSeconds': secondsGet
+        }
+
+class PipelineConsumer():
+    """
+    Thread calling function( item ) for each item of put, in order.
+    The error of function is raised by put or close (producer thread).
+    The thread starts with the first item, after the fork of processes of producer (AggregatorParallel).
+    """
+    def __init__(self, name, function):
+        self.name = name
+        self.function = function
+        self.error = None
+        self.queueItems = Pipeline.getQueue( name )
+        self.thread = None
+
+    def _run(self):
+        while True:
+            item = self.queueItems.get()
+            if item is Pipeline.END:
+                return
+            t = Metrics.start()
+            try:
+                self.function( item )
+            except Exception as error:
+                self.error = error
+                self.queueItems.stop.set() # Release the producer
+                return
+            Metrics.stop( f"pipeline_{self.name}_work", t )
+
+    def _raise(self):
+        if not self.error is None:
+            raise self.error
+
+    def put(self, item):
+        if self.thread is None:
+            self.thread = threading.Thread( target=self._run, name=f"pipeline_{self.name}", daemon=True )
+            self.thread.start()
+        if not self.queueItems.put( item ):
+            self._raise()
+
+    def close(self):
+        """
+        Wait the items of queue
+        """
+        if self.thread is None:
+            return
+        if self.queueItems.put( Pipeline.END ):
+            self.thread.join()
+        self._raise()
+
+class PipelineSerial():
+    """
+    Same interface of PipelineConsumer, without thread (Pipeline.depth = 0)
+    """
+    def __init__(self, function):
+        self.function = function
+
+    def put(self, item):
+        self.function( item )
+
+    def close(self):
+        pass
+
+class Pipeline():
+    depth = 0 # Items by queue, 0 is sequential (without threads)
+    sizePage = 1000 # Items by page of 'iterate'
+    queues = {} # name -> PipelineQueue, for getReport
+    END = object()
+
+    @staticmethod
+    def isActive():
+        return Pipeline.depth > 0
+
+    @staticmethod
+    def reset():
+        Pipeline.queues = {}
+
+    @staticmethod
+    def getQueue(name):
+        """
+        New queue, the totals of previous queue with same name continue (ex.: alerts of create and of update)
+        """
+        queueItems = PipelineQueue( name, Pipeline.depth )
+        if name in Pipeline.queues:
+            previous = Pipeline.queues[ name ]
+            queueItems.totalPut, queueItems.totalDepth, queueItems.maxDepth = previous.totalPut, previous.totalDepth, previous.maxDepth
+        Pipeline.queues[ name ] = queueItems
+        return queueItems
+
+    @staticmethod
+    def iterate(name, iterable):
+        """
+        Yield the items of iterable, produced in a thread by pages of 'sizePage' items.
+        Time of producer in Metrics 'pipeline_<name>_work'.
+        """
+        def produce():
+            page = []
+            try:
+                t = Metrics.start()
+                for item in iterable:
+                    page.append( item )
+                    if len( page ) < Pipeline.sizePage:
+                        continue
+                    Metrics.stop( f"pipeline_{name}_work", t, len( page ) )
+                    if not queueItems.put( page ):
+                        return
+                    page = []
+                    t = Metrics.start()
+                if len( page ) > 0:
+                    Metrics.stop( f"pipeline_{name}_work", t, len( page ) )
+                    queueItems.put( page )
+            except Exception as error:
+                errors.append( error )
+            queueItems.put( Pipeline.END )
+
+        if not Pipeline.isActive():
+            yield from iterable
+            return
+        queueItems = Pipeline.getQueue( name )
+        errors = []
+        thread = threading.Thread( target=produce, name=f"pipeline_{name}", daemon=True )
+        thread.start()
+        try:
+            while True:
+                page = queueItems.get()
+                if page is Pipeline.END:
+                    break
+                yield from page
+        finally:
+            queueItems.stop.set() # Consumer closed before the end
+            thread.join()
+        if len( errors ) > 0:
+            raise errors[0]
+
+    @staticmethod
+    def getConsumer(name, function):
+        """
+        Return the object with put( item ) and close(), function( item ) runs in a thread
+        """
+        if not Pipeline.isActive():
+            return PipelineSerial( function )
+        return PipelineConsumer( name, function )
+
+    @staticmethod
+    def getReport():
+        """
+        Return { queue: { 'depth', 'items', 'depthMean', 'depthMax', 'putWaitSeconds', 'getWaitSeconds' } }
+        """
+        return { name: item.getReport() for name, item in Pipeline.queues.items() }
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Aggregator Source
+Description          : Datasource of alerts and of aggregated table (PostGIS, GeoPackage, FlatGeobuf)
+                       -------------------
+Begin                : 2026-10-16
+Copyright            : (C) 2026 by IBAMA
+email                : motta dot luiz at gmail.com
+
+Update: 2026-10-16
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+
+from aggregatormetrics import Metrics
+
+try:
+    from osgeo import ogr
+except ImportError:
+    import ogr
+
+class AggregatorSource():
+    """
+    OGR datasource by connection:
+     'PG: ...' PostGIS, the filters of alerts and the test with country are SQL (server)
+     '*.gpkg' GeoPackage, '*.fgb' or directory FlatGeobuf: the filters of alerts are attribute filter,
+     the validity and the test with country are done in Python (AlertValidity)
+    The aggregated table (sink) needs update of features and metadata: PostGIS or GeoPackage.
+    The alerts are read by pages of 'sizePage' features (getPagesAlert).
+    """
+    POSTGRES = 'PostgreSQL'
+    GEOPACKAGE = 'GPKG'
+    FLATGEOBUF = 'FlatGeobuf'
+    extensions = { '.gpkg': GEOPACKAGE, '.fgb': FLATGEOBUF }
+    drivers = ( POSTGRES, GEOPACKAGE, FLATGEOBUF )
+    driversSink = ( POSTGRES, GEOPACKAGE )
+    sizePage = 50000 # Alerts by page, 0 for one page (one SQL)
+
+    @staticmethod
+    def getConnectionPostgres(user, password, host, db):
+        return f"PG: host={host} dbname={db} user={user} password={password}"
+
+    @staticmethod
+    def getDriverName(connection):
+        """
+        Return the OGR driver from connection, None if unknown
+        """
+        if connection.upper().startswith('PG:'):
+            return AggregatorSource.POSTGRES
+        ext = os.path.splitext( connection )[1].lower()
+        if ext in AggregatorSource.extensions:
+            return AggregatorSource.extensions[ ext ]
+        if os.path.isdir( connection ):
+            return AggregatorSource.FLATGEOBUF # Directory of '.fgb'
+        return None
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.driverName = AggregatorSource.getDriverName( connection )
+        self.ds = None
+
+    def getLabel(self):
+        """
+        Connection without password
+        """
+        if not self.isPostgres():
+            return self.connection
+        items = [ v for v in self.connection[3:].split() if not v.startswith('password=') ]
+        return f"PG: {' '.join( items )}"
+
+    def isPostgres(self):
+        return self.driverName == AggregatorSource.POSTGRES
+
+    def open(self, update=False):
+        """
+        update: sink of aggregated table, the GeoPackage is created if not exists
+        """
+        if self.driverName is None:
+            return { 'isOk': False, 'message': f"Unknown datasource '{self.connection}', expected 'PG: ...', '.gpkg' or '.fgb'" }
+        if update and not self.driverName in AggregatorSource.driversSink:
+            return { 'isOk': False, 'message': f"The aggregated table needs PostGIS or GeoPackage, not '{self.connection}'" }
+        if update and self.driverName == AggregatorSource.GEOPACKAGE and not os.path.exists( self.connection ):
+            self.ds = ogr.GetDriverByName( self.driverName ).CreateDataSource( self.connection )
+        else:
+            try:
+                self.ds = ogr.Open( self.connection, update=1 if update else 0 )
+            except Exception as error:
+                return { 'isOk': False, 'message': f"Error open '{self.getLabel()}': {error}" }
+        if self.ds is None:
+            return { 'isOk': False, 'message': f"Error open '{self.getLabel()}'" }
+        return { 'isOk': True }
+
+    def close(self):
+        self.ds = None
+
+    def getLayer(self, name):
+        """
+        FlatGeobuf file has only one layer (name of file)
+        """
+        if self.driverName == AggregatorSource.FLATGEOBUF and not os.path.isdir( self.connection ):
+            return self.ds.GetLayer( 0 )
+        return self.ds.GetLayerByName( name )
+
+    def getLayerAlert(self, name, sql, attributeFilter):
+        """
+        PostGIS: layer of SQL, others: layer 'name' with attribute filter.
+        Use releaseLayer after read.
+        """
+        if self.isPostgres():
+            try:
+                layer = self.ds.ExecuteSQL( sql )
+            except Exception as error:
+                return { 'isOk': False, 'message': error }
+            if layer is None:
+                return { 'isOk': False, 'message': f"Fail get SQL for Alert: {sql}" }
+            return { 'isOk': True, 'layer': layer }
+        layer = self.getLayer( name )
+        if layer is None:
+            return { 'isOk': False, 'message': f"Missing layer '{name}' in '{self.connection}'" }
+        try:
+            layer.SetAttributeFilter( attributeFilter )
+        except Exception as error:
+            return { 'isOk': False, 'message': f"Fail filter '{attributeFilter}' of '{name}': {error}" }
+        return { 'isOk': True, 'layer': layer }
+
+    def getPagesAlert(self, name, sql, attributeFilter, fieldFid):
+        """
+        Generator of pages (list of features) of alerts, 'sizePage' features by page.
+        PostGIS: keyset pagination by 'fieldFid', one SQL by page ( ... AND a.<fid> > <last> ORDER BY a.<fid> LIMIT <sizePage> ),
+        the result is released after the read of page, the memory of DB and of client is bounded by page.
+        Others: the features of layer (getLayerAlert) by page.
+        Raise RuntimeError if the SQL or the filter fails.
+        """
+        def getLayer(sqlPage):
+            t = Metrics.start()
+            r = self.getLayerAlert( name, sqlPage, attributeFilter )
+            if not r['isOk']:
+                raise RuntimeError( r['message'] )
+            Metrics.stop( 'sql_alerts', t )
+            return r['layer']
+
+        size = AggregatorSource.sizePage
+        if not self.isPostgres() or size == 0:
+            layer = getLayer( sql )
+            page = []
+            for feat in layer:
+                page.append( feat )
+                if len( page ) == size:
+                    yield page
+                    page = []
+            self.releaseLayer( layer )
+            if len( page ) > 0:
+                yield page
+            return
+        last = None
+        while True:
+            where = '' if last is None else f" AND a.{fieldFid} > {last}"
+            layer = getLayer( f"{sql}{where} ORDER BY a.{fieldFid} LIMIT {size}" )
+            t = Metrics.start()
+            page = [ feat for feat in layer ]
+            self.releaseLayer( layer )
+            Metrics.stop( 'fetch_alerts', t, len( page ) )
+            if len( page ) > 0:
+                yield page
+            if len( page ) < size:
+                return
+            last = page[-1].GetField( fieldFid )
+
+    def releaseLayer(self, layer):
+        if self.isPostgres():
+            self.ds.ReleaseResultSet( layer )
+            return
+        layer.SetAttributeFilter( None )
+
+    def getCountry(self, name):
+        """
+        Return { 'isOk', 'geometry' }, union of polygons of 'name'.
+        Without PostGIS the layer is optional (ex.: FlatGeobuf file), geometry is None if missing.
+        """
+        if self.isPostgres():
+            sql = f"SELECT ST_Union( geom ) AS geom FROM {name}"
+            try:
+                layer = self.ds.ExecuteSQL( sql )
+            except Exception as error:
+                return { 'isOk': False, 'message': error }
+            feat = None if layer is None else layer.GetNextFeature()
+            if feat is None or feat.GetGeometryRef() is None:
+                return { 'isOk': False, 'message': f"Fail get geometry of '{name}'" }
+            geom = feat.GetGeometryRef().Clone()
+            self.ds.ReleaseResultSet( layer )
+            return { 'isOk': True, 'geometry': geom }
+        layer = None
+        if not self.driverName == AggregatorSource.FLATGEOBUF or os.path.isdir( self.connection ):
+            layer = self.ds.GetLayerByName( name )
+        if layer is None:
+            return { 'isOk': True, 'geometry': None }
+        multiPolygon = ogr.Geometry( ogr.wkbMultiPolygon )
+        for feat in layer:
+            geom = feat.GetGeometryRef()
+            if geom is None:
+                continue
+            if geom.GetGeometryType() == ogr.wkbMultiPolygon:
+                for i in range( geom.GetGeometryCount() ):
+                    multiPolygon.AddGeometry( geom.GetGeometryRef( i ) )
+            else:
+                multiPolygon.AddGeometry( geom )
+        layer.ResetReading()
+        if multiPolygon.GetGeometryCount() == 0:
+            return { 'isOk': False, 'message': f"Fail get geometry of '{name}'" }
+        return { 'isOk': True, 'geometry': multiPolygon.UnionCascaded() }
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Aggregator Update
+Description          : Merge of new groups with the groups of aggregated table
+                       -------------------
+Begin                : 2026-10-16
+Copyright            : (C) 2026 by IBAMA
+email                : motta dot luiz at gmail.com
+
+Update: 2026-10-16
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Implementation: parallel update (AggregatorUpdate.mergeGroups)
+ 1) Footprint of new group: envelope of bbox of buffer (spatial filter of table) and of the candidates (groups of table).
+    The merged group is inside the footprint, the new groups with disjoint footprints are independent.
+ 2) Batches: the new groups are partitioned by union-find of intersecting footprints (STRTree),
+    two new groups with the same candidate are in the same batch.
+ 3) Merge: each worker merges the groups of batch, in order of id_group (same result of serial),
+    against a copy of the candidates, the new groups merged by later groups are removed.
+ 4) Write: the parent deletes the merged groups of table and adds the new groups (one writer),
+    the merges of batches update the membership table (AggregatorGroupPG.updateMembers).
+The candidates of all groups are read before the first task, the tasks are submitted by demand
+(AggregatorParallel.map), the processes are forked as AggregatorParallel.createGroups.
+"""
+
+from datetime import date
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from alertindex import STRTree
+from aggregatormetrics import Metrics
+from aggregatorgroup import ItemInvalidUnion, PreparedGeometry, AggregatorParams, ChainPolygons, UnionFind, GroupMembers
+from aggregatorparallel import AggregatorParallel
+
+try:
+    from osgeo import ogr
+except ImportError:
+    import ogr
+
+class AggregatorUpdate():
+    workers = 1
+    sizeBatch = 64 # Groups by task
+
+    @staticmethod
+    def getFeaturesFilter(layer, group):
+        bboxBuffer = AggregatorParams.getBufferBoundBox( group['geometry'] )
+        layer.SetSpatialFilter( bboxBuffer )
+        feats = [ feat for feat in layer ]
+        layer.SetSpatialFilter(None)
+        return feats
+
+    @staticmethod
+    def mergeGroup(group, feats, deleteFeature, type_fid):
+        """
+        Merge the group with the features (candidates) within dates and buffer,
+        the merged features are deleted by deleteFeature( fid ).
+        Return the FIDs of merged features.
+        """
+        def getDates(data):
+            """
+            Ordinal days of 'ini_date' and 'end_date' ( YYYY-MM-DD )
+            """
+            return { d: date.fromisoformat( data[ d ] ).toordinal() for d in ('ini_date', 'end_date') }
+
+        def isWithinDate(dates, datesFeat):
+            dateIni = AggregatorParams.getWindowDay( datesFeat['ini_date'] )[0]
+            dateEnd = AggregatorParams.getWindowDay( datesFeat['end_date'] )[1]
+            return dates['ini_date'] >= dateIni and dates['end_date'] <= dateEnd
+
+        def addFeatValues(feat):
+            if group['ini_date'] > feat['ini_date']:
+                group['ini_date'] = feat['ini_date']
+                group['ini_ha'] = feat['ini_ha']
+            if group['end_date'] < feat['end_date']:
+                group['end_date'] = feat['end_date']
+            members.addValues( feat ) # 'fids', 'dates_ev', 'tipos', 'estagios'
+
+        def unionGroup(feat):
+            geomFeat = feat.GetGeometryRef()
+            union, msg = None, None
+            t = Metrics.start()
+            try:
+                union = group['geometry'].Union( geomFeat )
+            except Exception as error:
+                msg = "{}".format( error )
+            Metrics.stop( 'union', t )
+            if union is None or union.IsValid() == False:
+                msg = msg if union is None else 'Union is not Valid'
+                iiu = ItemInvalidUnion( group['id_group'], type_fid, msg,  geomFeat )
+                ChainPolygons.invalidUnions.append( iiu.getItem() )
+                Metrics.addCount( 'invalid_union' )
+                return
+            r = AggregatorParams.checkMultiPolygon( union )
+            if r['hasChange']:
+                union.Destroy()
+                union = r['geometry']
+            if r['hasInvalid']:
+                msg = 'Missing polygon in Union'
+                iiu = ItemInvalidUnion( group['id_group'], type_fid, msg,  geomFeat )
+                ChainPolygons.invalidUnions.append( iiu.getItem() )
+                Metrics.addCount( 'invalid_union' )
+                return
+            group['geometry'].Destroy()
+            group['geometry'] = union
+            group['end_ha'] = AggregatorParams.getAreaHa( union )
+            addFeatValues( feat )
+
+        if len( feats ) == 0:
+            return []
+        dates = getDates( group )
+        buffGeom = PreparedGeometry( AggregatorParams.getBuffer( group['geometry'], True ) )
+        featsCandidate, feats = feats, []
+        for feat in featsCandidate:
+            datesFeat = getDates( feat )
+            if isWithinDate( dates, datesFeat ):
+                if buffGeom.intersects( feat.GetGeometryRef() ):
+                    feats.append( feat )
+                    dates['ini_date'] = min( dates['ini_date'], datesFeat['ini_date'] )
+                    dates['end_date'] = max( dates['end_date'], datesFeat['end_date'] )
+        total = len( feats )
+        if total == 0:
+            return []
+        members = GroupMembers()
+        members.addValues( group )
+        geometries = [ group['geometry'] ] + [ feat.GetGeometryRef() for feat in feats ]
+        union = AggregatorParams.unionCascaded( geometries )
+        if union is None: # Isolate invalid
+            for feat in feats:
+                unionGroup( feat )
+        else:
+            group['geometry'].Destroy()
+            group['geometry'] = union
+            group['end_ha'] = AggregatorParams.getAreaHa( union )
+            for feat in feats:
+                addFeatValues( feat )
+        if AggregatorParams.hasPrecision():
+            group['geometry'] = AggregatorParams.reducePrecisionOrigin( group['geometry'] )
+            group['end_ha'] = AggregatorParams.getAreaHa( group['geometry'] )
+        group.update( members.getValues() ) # 'n_fids', 'n_events' and the string columns
+        fids = [ feat.GetFID() for feat in feats ]
+        for fid in fids:
+            deleteFeature( fid )
+        Metrics.addCount( 'update_delete', total )
+        return fids
+
+    @staticmethod
+    def createFeature(defn, values, geometry, fid):
+        feat = ogr.Feature( defn )
+        for k, v in values.items():
+            if k == 'geometry' or v is None:
+                continue
+            feat.SetField( k, v )
+        feat.SetGeometry( geometry )
+        feat.SetFID( fid )
+        return feat
+
+    @staticmethod
+    def mergeBatch(task):
+        """
+        Worker: merge the groups of task (id_group order) against the candidates of table.
+        The new group 'pos' has FID -( pos + 1 ), after all candidates in order of search.
+        Return the new groups not merged (geometry in WKB), the FIDs of table deleted, total of deletes
+        and the merges ( id_group, [ id_group merged ] ) for membership table.
+        """
+        def getOrder(fid):
+            return ( 1, -fid ) if fid < 0 else ( 0, fid )
+
+        Metrics.reset()
+        defn = ogr.FeatureDefn()
+        for item in task['fields']:
+            defn.AddFieldDefn( ogr.FieldDefn( item['name'], item['type'] ) )
+        current = {} # FID -> feature
+        for fid, values, wkb in task['features']:
+            current[ fid ] = AggregatorUpdate.createFeature( defn, values, ogr.CreateGeometryFromWkb( wkb ), fid )
+        groups, fidsDeleted, totalDelete, merges = {}, [], 0, []
+        for pos, group in enumerate( task['groups'] ):
+            group['geometry'] = ogr.CreateGeometryFromWkb( group['geometry'] )
+            ( minX, maxX, minY, maxY ) = AggregatorParams.getBufferBoundBox( group['geometry'] ).GetEnvelope()
+            feats = []
+            for fid in sorted( current, key=getOrder ): # Same of spatial filter (bbox) of layer
+                ( fMinX, fMaxX, fMinY, fMaxY ) = current[ fid ].GetGeometryRef().GetEnvelope()
+                if fMinX <= maxX and fMaxX >= minX and fMinY <= maxY and fMaxY >= minY:
+                    feats.append( current[ fid ] )
+            fids = AggregatorUpdate.mergeGroup( group, feats, lambda fid: None, task['type_fid'] )
+            if len( fids ) > 0:
+                merges.append( ( group['id_group'], [ current[ fid ]['id_group'] for fid in fids ] ) )
+            for fid in fids:
+                del current[ fid ]
+                if fid < 0:
+                    del groups[ fid ]
+                else:
+                    fidsDeleted.append( fid )
+            totalDelete += len( fids )
+            fid = -( pos + 1 )
+            current[ fid ] = AggregatorUpdate.createFeature( defn, group, group['geometry'], fid )
+            groups[ fid ] = group
+        groups = [ groups[ fid ] for fid in sorted( groups, key=getOrder ) ]
+        for group in groups:
+            group['geometry'] = group['geometry'].ExportToWkb()
+        invalidUnions = []
+        for item in ChainPolygons.invalidUnions:
+            item = dict( item )
+            item['geometry'] = item['geometry'].ExportToWkb()
+            invalidUnions.append( item )
+        ChainPolygons.invalidUnions.clear()
+        return {
+            'groups': groups,
+            'fidsDeleted': fidsDeleted,
+            'totalDelete': totalDelete,
+            'merges': merges,
+            'invalidUnions': invalidUnions,
+            'metrics': Metrics.getState()
+        }
+
+    @staticmethod
+    def getTasks(groups, layer, fields, type_fid):
+        """
+        Read the candidates of each group (spatial filter of layer) and partition the groups
+        in independent batches (union-find of footprints)
+        """
+        names = [ item['name'] for item in fields ]
+        features = {} # FID -> ( values, WKB )
+        candidates = []
+        footprints = np.empty( ( len( groups ), 4 ) )
+        for pos, group in enumerate( groups ):
+            bboxBuffer = AggregatorParams.getBufferBoundBox( group['geometry'] )
+            ( minX, maxX, minY, maxY ) = bboxBuffer.GetEnvelope()
+            t = Metrics.start()
+            layer.SetSpatialFilter( bboxBuffer )
+            fids = []
+            for feat in layer:
+                fid = feat.GetFID()
+                geom = feat.GetGeometryRef()
+                if not fid in features:
+                    features[ fid ] = ( { k: feat.GetField( k ) for k in names }, geom.ExportToWkb() )
+                ( fMinX, fMaxX, fMinY, fMaxY ) = geom.GetEnvelope()
+                minX, maxX, minY, maxY = min( minX, fMinX ), max( maxX, fMaxX ), min( minY, fMinY ), max( maxY, fMaxY )
+                fids.append( fid )
+            layer.SetSpatialFilter( None )
+            Metrics.stop( 'update_candidates', t, len( fids ) )
+            candidates.append( fids )
+            footprints[ pos ] = ( minX, maxX, minY, maxY )
+
+        unionFind = UnionFind( len( groups ) )
+        if len( groups ) > 0:
+            tree = STRTree( footprints )
+            for pos in range( len( groups ) ):
+                for other in tree.query( footprints[ pos ] ):
+                    unionFind.union( pos, int( other ) )
+        batch = []
+        for members in unionFind.components():
+            batch.extend( members.tolist() )
+            if len( batch ) < AggregatorUpdate.sizeBatch:
+                continue
+            yield AggregatorUpdate.getTask( sorted( batch ), groups, candidates, features, fields, type_fid )
+            batch = []
+        if len( batch ) > 0:
+            yield AggregatorUpdate.getTask( sorted( batch ), groups, candidates, features, fields, type_fid )
+
+    @staticmethod
+    def getTask(batch, groups, candidates, features, fields, type_fid):
+        fids = sorted( { fid for pos in batch for fid in candidates[ pos ] } )
+        tasksGroup = []
+        for pos in batch:
+            group = dict( groups[ pos ] )
+            group['geometry'] = group['geometry'].ExportToWkb()
+            tasksGroup.append( group )
+        return {
+            'groups': tasksGroup,
+            'features': [ ( fid, *features[ fid ] ) for fid in fids ],
+            'fields': fields,
+            'type_fid': type_fid
+        }
+
+    @staticmethod
+    def mergeGroups(groups, layer, fields, type_fid):
+        """
+        Generator of merges by batch (order of batches): { 'groups', 'fidsDeleted', 'totalDelete', 'merges' }
+        groups: new groups with 'id_group'
+        """
+        args = (
+            AggregatorParams.srs.ExportToWkt(),
+            AggregatorParams.buffer_meter,
+            AggregatorParams.grid_meter,
+            AggregatorParams.simplify_meter,
+            AggregatorParams.relMonth,
+            ChainPolygons.type_fid_invalid
+        )
+        mpContext = get_context('fork') # Same of AggregatorParallel.createGroups
+        with ProcessPoolExecutor( AggregatorUpdate.workers, mp_context=mpContext, initializer=AggregatorParallel.initWorker, initargs=args ) as executor:
+            tasks = AggregatorUpdate.getTasks( groups, layer, fields, type_fid )
+            for r in AggregatorParallel.map( executor, AggregatorUpdate.mergeBatch, tasks, AggregatorUpdate.workers ):
+                Metrics.merge( r['metrics'] )
+                for item in r['invalidUnions']:
+                    item['geometry'] = ogr.CreateGeometryFromWkb( item['geometry'] )
+                    ChainPolygons.invalidUnions.append( item )
+                for group in r['groups']:
+                    group['geometry'] = ogr.CreateGeometryFromWkb( group['geometry'] )
+                yield r
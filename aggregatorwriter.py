@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Aggregator Writer
+Description          : Write features in batches (one transaction by batch)
+                       -------------------
+Begin                : 2026-10-16
+Copyright            : (C) 2026 by IBAMA
+email                : motta dot luiz at gmail.com
+
+Update: 2026-10-16
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import time
+from datetime import date
+
+from aggregatormetrics import Metrics
+
+try:
+    from osgeo import gdal, ogr
+except ImportError:
+    import gdal, ogr
+
+class LayerWriter():
+    """
+    Buffer the writes (create and delete) of layer and commit by batch of 'sizeBatch' operations.
+    useCopy: PostgreSQL COPY (PG_USE_COPY), the FID of created feature is unknown.
+    useTransaction: False when the caller has the transaction of datasource, the batches are not committed.
+    """
+    sizeBatch = 5000
+
+    @staticmethod
+    def setCopy(useCopy):
+        """
+        Return the previous value of PG_USE_COPY
+        """
+        previous = gdal.GetConfigOption('PG_USE_COPY')
+        gdal.SetConfigOption('PG_USE_COPY', 'YES' if useCopy else 'NO' )
+        return previous
+
+    def __init__(self, layer, printStatus, useCopy=False, sizeBatch=None, useTransaction=True):
+        self.layer = layer
+        self.printStatus = printStatus
+        self.useCopy = useCopy
+        self.useTransaction = useTransaction
+        self.sizeBatch = LayerWriter.sizeBatch if sizeBatch is None else sizeBatch
+        self.name = layer.GetName()
+        self.defn = layer.GetLayerDefn()
+        self.batches = [] # ( total operations, seconds )
+        self.totalBatch = 0
+        self.timeBatch = None
+        self.copyPrevious = None
+
+    def _begin(self):
+        if not self.timeBatch is None:
+            return
+        if self.useCopy:
+            self.copyPrevious = LayerWriter.setCopy( True )
+        if self.useTransaction:
+            self.layer.StartTransaction()
+        self.timeBatch = time.perf_counter()
+
+    def _added(self):
+        self.totalBatch += 1
+        if self.totalBatch >= self.sizeBatch:
+            self.flush()
+
+    def add(self, item):
+        """
+        Create feature from item (field: value, 'geometry'), return the FID (-1 with COPY)
+        """
+        self._begin()
+        feat = ogr.Feature( self.defn )
+        for k in item:
+            if k == 'geometry':
+                feat.SetGeometry( item['geometry'] )
+                continue
+            feat.SetField( k, item[ k ] )
+        self.layer.CreateFeature( feat )
+        fid = feat.GetFID()
+        feat = None
+        self._added()
+        return fid
+
+    def delete(self, fid):
+        self._begin()
+        self.layer.DeleteFeature( fid )
+        self._added()
+
+    def flush(self):
+        if self.timeBatch is None:
+            return
+        if self.useTransaction:
+            self.layer.CommitTransaction()
+        if self.useCopy:
+            gdal.SetConfigOption('PG_USE_COPY', self.copyPrevious )
+        seconds = time.perf_counter() - self.timeBatch
+        self.batches.append( ( self.totalBatch, seconds ) )
+        Metrics.add( 'write_batch', seconds, self.totalBatch )
+        args = ( self.name, len( self.batches ), self.totalBatch, seconds )
+        msg = "Writing '{}': batch {} ({} features) {:.2f} seconds".format( *args )
+        self.printStatus( msg )
+        self.totalBatch = 0
+        self.timeBatch = None
+
+    def close(self):
+        """
+        Commit the last batch and return the summary
+        """
+        self.flush()
+        total = sum( b[0] for b in self.batches )
+        seconds = sum( b[1] for b in self.batches )
+        return {
+            'batches': len( self.batches ),
+            'total': total,
+            'seconds': seconds,
+            'message': "Wrote '{}': {} features in {} batches, {:.2f} seconds".format( self.name, total, len( self.batches ), seconds )
+        }
+
+class MemberWriter():
+    """
+    Rows of membership table ( id_group, objectid, date ) of groups.
+    The rows are buffered (arrays by group) and written by batch of 'sizeBatch' rows.
+    The datasource has one transaction: the open batch of 'writerGroup' (aggregated table) is committed before.
+    """
+    def __init__(self, layer, printStatus, writerGroup=None, useTransaction=True):
+        self.writer = LayerWriter( layer, printStatus, useCopy=True, useTransaction=useTransaction )
+        self.writerGroup = writerGroup
+        self.rows = [] # ( id_group, objectids, days )
+        self.totalRows = 0
+
+    @staticmethod
+    def getFields():
+        return [
+            { 'name': 'id_group', 'type': ogr.OFTInteger },
+            { 'name': 'objectid', 'type': ogr.OFTInteger64 },
+            { 'name': 'date', 'type': ogr.OFTDate }
+        ]
+
+    def add(self, idGroup, members):
+        """
+        members: ( objectids, ordinal days ), GroupMembers.getMembers
+        """
+        self.rows.append( ( idGroup, *members ) )
+        self.totalRows += len( members[0] )
+        if self.totalRows >= self.writer.sizeBatch:
+            self.flush()
+
+    def flush(self):
+        if len( self.rows ) == 0:
+            return
+        if not self.writerGroup is None:
+            self.writerGroup.flush()
+        for idGroup, objectids, days in self.rows:
+            for objectid, day in zip( objectids.tolist(), days.tolist() ):
+                item = { 'id_group': idGroup, 'objectid': objectid, 'date': date.fromordinal( day ).strftime("%Y-%m-%d") }
+                self.writer.add( item )
+        self.rows = []
+        self.totalRows = 0
+        self.writer.flush()
+
+    def close(self):
+        self.flush()
+        return self.writer.close()
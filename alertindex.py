@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Alert Index
+Description          : Packed STR-tree spatial index for alerts
+                       -------------------
+Begin                : 2026-10-16
+Copyright            : (C) 2026 by IBAMA
+email                : motta dot luiz at gmail.com
+
+Update: 2026-10-16
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import math
+
+import numpy as np
+
+class STRTree():
+    """
+    Sort-Tile-Recursive R-tree, bulk loaded once and never modified.
+    Envelopes follow the OGR order ( minX, maxX, minY, maxY ).
+    Each level is a NumPy array of boxes, level 0 is the leaves.
+    Node 'i' of a level has the children [ i * nodeCapacity, (i+1) * nodeCapacity ) of the level below.
+    With 'dates' (ordinal days), the tiles are also by date and each node has the range of dates (levelsDate),
+    the query can be limited by a window of dates.
+    """
+    def __init__(self, envelopes, nodeCapacity=16, dates=None):
+        boxes = np.asarray( envelopes, dtype=np.float64 ).reshape( -1, 4 )
+        self.nodeCapacity = nodeCapacity
+        centers = [ ( boxes[:, 0] + boxes[:, 1] ) / 2, ( boxes[:, 2] + boxes[:, 3] ) / 2 ]
+        if not dates is None:
+            dates = np.asarray( dates, dtype=np.float64 )
+            centers.append( dates )
+        self.order = self._sortTileRecursive( centers ) # Leaf position -> item
+        self.levels = [ boxes[ self.order ] ]
+        self.levelsDate = None if dates is None else [ np.column_stack( ( dates[ self.order ], dates[ self.order ] ) ) ]
+        while len( self.levels[-1] ) > nodeCapacity:
+            self.levels.append( self._packLevel( self.levels[-1] ) )
+            if not self.levelsDate is None:
+                self.levelsDate.append( self._packLevel( self.levelsDate[-1] ) )
+
+    def __len__(self):
+        return len( self.order )
+
+    def _sortTileRecursive(self, centers):
+        """
+        Sort by first center, cut in slices, sort each slice by next center, ...
+        """
+        total = len( centers[0] )
+        if total == 0:
+            return np.zeros( 0, dtype=np.int64 )
+        totalLeaves = math.ceil( total / self.nodeCapacity )
+        totalSlices = math.ceil( totalLeaves ** ( 1 / len( centers ) ) - 1e-9 )
+        order = np.argsort( centers[0], kind='stable' )
+        for id in range( 1, len( centers ) ):
+            sizeSlice = totalSlices ** ( len( centers ) - id ) * self.nodeCapacity
+            idSlice = np.arange( total ) // sizeSlice
+            order = order[ np.lexsort( ( centers[ id ][ order ], idSlice ) ) ]
+        return order
+
+    def _packLevel(self, boxes):
+        """
+        Boxes of parents, columns ( min, max, ... )
+        """
+        starts = np.arange( 0, len( boxes ), self.nodeCapacity )
+        columns = []
+        for id in range( 0, boxes.shape[1], 2 ):
+            columns.append( np.minimum.reduceat( boxes[:, id ], starts ) )
+            columns.append( np.maximum.reduceat( boxes[:, id + 1 ], starts ) )
+        return np.column_stack( columns )
+
+    @staticmethod
+    def _intersects(boxes, envelope):
+        ( minX, maxX, minY, maxY ) = envelope
+        return ( boxes[:, 0] <= maxX ) & ( boxes[:, 1] >= minX ) & ( boxes[:, 2] <= maxY ) & ( boxes[:, 3] >= minY )
+
+    def query(self, envelope, dateIni=None, dateEnd=None):
+        """
+        Return the items (ascending) with envelope intersecting 'envelope',
+        and with date inside [ dateIni, dateEnd ] if the tree has dates
+        """
+        level = len( self.levels ) - 1
+        nodes = np.arange( len( self.levels[ level ] ) )
+        children = np.arange( self.nodeCapacity )
+        hasDate = not self.levelsDate is None and not dateIni is None
+        while True:
+            isHit = self._intersects( self.levels[ level ][ nodes ], envelope )
+            if hasDate:
+                boxesDate = self.levelsDate[ level ][ nodes ]
+                isHit &= ( boxesDate[:, 0] <= dateEnd ) & ( boxesDate[:, 1] >= dateIni )
+            nodes = nodes[ isHit ]
+            if level == 0 or len( nodes ) == 0:
+                break
+            level -= 1
+            nodes = ( nodes[:, None] * self.nodeCapacity + children ).ravel()
+            nodes = nodes[ nodes < len( self.levels[ level ] ) ]
+        return np.sort( self.order[ nodes ] )
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Alert Store
+Description          : Columnar store of alerts (NumPy arrays and WKB buffer)
+                       -------------------
+Begin                : 2026-10-16
+Copyright            : (C) 2026 by IBAMA
+email                : motta dot luiz at gmail.com
+
+Update: 2026-10-16
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os, json, hashlib
+from array import array
+from datetime import date
+
+import numpy as np
+
+try:
+    from osgeo import ogr
+except ImportError:
+    import ogr
+
+class AlertStore():
+    """
+    Alerts by index position ('idx'), one NumPy array by attribute:
+     objectid, dates (ordinal days), typeCodes/stageCodes (index of types/stages),
+     areaHa, envelopes ( minX, maxX, minY, maxY ).
+    Geometries (WKB) in one contiguous buffer, geometry 'idx' is wkb[ wkbOffsets[idx] : wkbOffsets[idx+1] ].
+    The OGR geometry is created only by demand (getGeometry).
+    Load: add() by alert, then finish().
+    Snapshot: save() and open() with the arrays memory-mapped (read only).
+    """
+    arrays = ( 'objectid', 'dates', 'typeCodes', 'stageCodes', 'areaHa', 'envelopes', 'wkb', 'wkbOffsets' )
+    fileMetadata = 'metadata.json'
+
+    def __init__(self):
+        self.objectid = None
+        self.dates = None
+        self.typeCodes = None
+        self.stageCodes = None
+        self.areaHa = None
+        self.envelopes = None
+        self.wkb = None
+        self.wkbOffsets = None
+        self.types, self.stages = [], [] # Categories, code -> value
+        self._codes = { 'type': {}, 'stage': {} } # value -> code
+        self._load = {
+            'objectid': array('q'),
+            'dates': array('i'),
+            'typeCodes': array('h'),
+            'stageCodes': array('h'),
+            'areaHa': array('d'),
+            'envelopes': array('d'),
+            'wkb': bytearray(),
+            'wkbOffsets': array('q', [ 0 ] )
+        }
+
+    def __len__(self):
+        return 0 if self.objectid is None else len( self.objectid )
+
+    def _getCode(self, name, categories, value):
+        codes = self._codes[ name ]
+        if not value in codes:
+            codes[ value ] = len( categories )
+            categories.append( value )
+        return codes[ value ]
+
+    def add(self, objectid, dateAlert, typeAlert, stage, geometry):
+        """
+        geometry: OGR geometry already in metric CRS
+        """
+        load = self._load
+        wkb = geometry.ExportToWkb()
+        load['objectid'].append( objectid )
+        load['dates'].append( dateAlert.toordinal() )
+        load['typeCodes'].append( self._getCode( 'type', self.types, typeAlert ) )
+        load['stageCodes'].append( self._getCode( 'stage', self.stages, stage ) )
+        load['areaHa'].append( geometry.GetArea() / 10000 )
+        load['envelopes'].extend( geometry.GetEnvelope() )
+        load['wkb'].extend( wkb )
+        load['wkbOffsets'].append( len( load['wkb'] ) )
+
+    def finish(self):
+        """
+        Arrays from loaded alerts (zero copy of load buffers)
+        """
+        load = self._load
+        self.objectid = np.frombuffer( load['objectid'], dtype=np.int64 )
+        self.dates = np.frombuffer( load['dates'], dtype=np.int32 )
+        self.typeCodes = np.frombuffer( load['typeCodes'], dtype=np.int16 )
+        self.stageCodes = np.frombuffer( load['stageCodes'], dtype=np.int16 )
+        self.areaHa = np.frombuffer( load['areaHa'], dtype=np.float64 )
+        self.envelopes = np.frombuffer( load['envelopes'], dtype=np.float64 ).reshape( -1, 4 )
+        self.wkb = np.frombuffer( load['wkb'], dtype=np.uint8 )
+        self.wkbOffsets = np.frombuffer( load['wkbOffsets'], dtype=np.int64 )
+        self._load = None
+
+    def getFingerprint(self):
+        """
+        Hash of objectid, dates and size of geometries, identify the alerts of a run
+        """
+        h = hashlib.sha1()
+        for name in ( 'objectid', 'dates', 'wkbOffsets' ):
+            h.update( np.ascontiguousarray( getattr( self, name ) ).tobytes() )
+        return h.hexdigest()
+
+    def getWkb(self, idx):
+        return self.wkb[ self.wkbOffsets[ idx ] : self.wkbOffsets[ idx + 1 ] ].tobytes()
+
+    def getGeometry(self, idx):
+        return ogr.CreateGeometryFromWkb( self.getWkb( idx ) )
+
+    def getDate(self, idx):
+        return date.fromordinal( int( self.dates[ idx ] ) )
+
+    def getType(self, idx):
+        return self.types[ self.typeCodes[ idx ] ]
+
+    def getStage(self, idx):
+        return self.stages[ self.stageCodes[ idx ] ]
+
+    def save(self, path, metadata):
+        """
+        Snapshot in directory 'path', one '.npy' file by array.
+        The metadata file is written last, a snapshot without it is incomplete.
+        """
+        os.makedirs( path, exist_ok=True )
+        fileMetadata = os.path.join( path, AlertStore.fileMetadata )
+        if os.path.exists( fileMetadata ):
+            os.remove( fileMetadata )
+        for name in AlertStore.arrays:
+            np.save( os.path.join( path, f"{name}.npy" ), getattr( self, name ) )
+        values = dict( metadata )
+        values.update( { 'total': len( self ), 'types': self.types, 'stages': self.stages } )
+        with open( fileMetadata, 'w' ) as f:
+            json.dump( values, f )
+
+    @staticmethod
+    def open(path):
+        """
+        Return { 'isOk', 'store', 'metadata' } from snapshot in directory 'path'
+        """
+        fileMetadata = os.path.join( path, AlertStore.fileMetadata )
+        if not os.path.exists( fileMetadata ):
+            return { 'isOk': False, 'message': f"Missing (or incomplete) snapshot '{path}'" }
+        with open( fileMetadata ) as f:
+            metadata = json.load( f )
+        store = AlertStore()
+        for name in AlertStore.arrays:
+            setattr( store, name, np.load( os.path.join( path, f"{name}.npy" ), mmap_mode='r' ) )
+        store.types, store.stages = metadata['types'], metadata['stages']
+        store._codes = None
+        store._load = None
+        if not len( store ) == metadata['total']:
+            return { 'isOk': False, 'message': f"Snapshot '{path}' has {len( store )} alerts, expected {metadata['total']}" }
+        return { 'isOk': True, 'store': store, 'metadata': metadata }
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Alert Synthetic
+Description          : Synthetic alerts (clusters of polygons by date) for benchmark
+                       -------------------
+Begin                : 2026-10-16
+Copyright            : (C) 2026 by IBAMA
+email                : motta dot luiz at gmail.com
+
+Update: 2026-10-16
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import struct
+from datetime import date, timedelta
+
+import numpy as np
+
+try:
+    from osgeo import ogr, osr
+except ImportError:
+    import ogr, osr
+
+class AlertSynthetic():
+    """
+    Alerts with the fields of 'ibama.alerta' used by aggregator (AggregatorParams.field_*).
+    Clusters of polygons (random walk of neighbours from a center) with a sequence of dates:
+     gaps exponential (mean 'meanGapDays') and, with probability 'probJump',
+     a jump greater than window of AggregatorParams.relMonth (new group in same place).
+    Polygon: star shaped (simple), area lognormal with median 'medianHa'.
+    Same seed, same alerts.
+    """
+    scenarios = { '10k': 10000, '100k': 100000, '1M': 1000000 }
+    extent = ( -63.0, -50.0, -12.0, -2.0 ) # minX, maxX, minY, maxY (Legal Amazon)
+    epsg = 4674 # SIRGAS 2000
+    dateIni = date( 2016, 1, 1 )
+    totalDays = 5 * 365
+    meanCluster = 8 # Alerts by cluster
+    spreadMeter = 1500 # Standard deviation of scattered alerts around center of cluster
+    probScatter = 0.2
+    medianHa = 3.0
+    sigmaHa = 1.0
+    meanGapDays = 45
+    probJump = 0.1
+    totalVertex = 12
+    types = ( ( 'DESMATAMENTO', 0.7 ), ( 'DEGRADACAO', 0.3 ) )
+    stages = ( ( 'CR', 0.45 ), ( 'CS', 0.25 ), ( 'DG', 0.15 ), ( 'MI', 0.1 ), ( 'CICATRIZ', 0.05 ) )
+    metersDegree = 111320.0
+    nameLayer = 'alerta'
+    sizeBatch = 10000 # Features by transaction
+
+    def __init__(self, seed=0):
+        self.rng = np.random.default_rng( seed )
+
+    @staticmethod
+    def getSrs():
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG( AlertSynthetic.epsg )
+        if hasattr( osr, 'OAMS_TRADITIONAL_GIS_ORDER' ):
+            srs.SetAxisMappingStrategy( osr.OAMS_TRADITIONAL_GIS_ORDER )
+        return srs
+
+    def _choice(self, items, size):
+        values = [ v for v, p in items ]
+        probs = np.array( [ p for v, p in items ] )
+        return [ values[ i ] for i in self.rng.choice( len( values ), size=size, p=probs / probs.sum() ) ]
+
+    def _getDays(self, size):
+        """
+        Ordinal days of alerts of one cluster, sorted
+        """
+        gaps = self.rng.exponential( AlertSynthetic.meanGapDays, size )
+        jumps = self.rng.random( size ) < AlertSynthetic.probJump
+        gaps[ jumps ] += self.rng.integers( 200, 400, jumps.sum() )
+        gaps[0] = 0
+        days = np.minimum( np.cumsum( gaps ).astype( np.int64 ), AlertSynthetic.totalDays - 1 )
+        start = self.rng.integers( 0, AlertSynthetic.totalDays - days[-1] )
+        return AlertSynthetic.dateIni.toordinal() + start + days
+
+    def _getCenters(self, center, areaHa):
+        """
+        Random walk from center of cluster, step near of radius of alerts (neighbours),
+        with probability 'probScatter' the alert is scattered around center
+        """
+        size = len( areaHa )
+        radius = np.sqrt( areaHa * 10000 / np.pi )
+        angles = self.rng.uniform( 0, 2 * np.pi, size )
+        steps = radius * self.rng.uniform( 0.8, 2.0, size )
+        steps[0] = 0
+        walk = np.cumsum( np.column_stack( ( steps * np.cos( angles ), steps * np.sin( angles ) ) ), axis=0 )
+        scatter = self.rng.random( size ) < AlertSynthetic.probScatter
+        walk[ scatter ] = self.rng.normal( 0, AlertSynthetic.spreadMeter, ( scatter.sum(), 2 ) )
+        scaleY = 1.0 / AlertSynthetic.metersDegree
+        scaleX = scaleY / np.cos( np.radians( center[1] ) )
+        return np.column_stack( ( center[0] + walk[:, 0] * scaleX, center[1] + walk[:, 1] * scaleY ) )
+
+    def _getWkbPolygons(self, centers, areaHa):
+        """
+        centers: (n, 2) in degrees, areaHa: (n,)
+        Return list of WKB (Polygon, little endian)
+        """
+        n, k = len( centers ), AlertSynthetic.totalVertex
+        radius = np.sqrt( areaHa * 10000 / np.pi ) # Meters
+        angles = ( np.arange( k ) + self.rng.uniform( -0.3, 0.3, ( n, k ) ) ) * ( 2 * np.pi / k )
+        radii = radius[:, None] * self.rng.uniform( 0.6, 1.3, ( n, k ) )
+        scaleY = 1.0 / AlertSynthetic.metersDegree
+        scaleX = scaleY / np.cos( np.radians( centers[:, 1] ) )
+        coords = np.empty( ( n, k + 1, 2 ) )
+        coords[:, :k, 0] = centers[:, 0, None] + radii * np.cos( angles ) * scaleX[:, None]
+        coords[:, :k, 1] = centers[:, 1, None] + radii * np.sin( angles ) * scaleY
+        coords[:, k] = coords[:, 0] # Close ring
+        header = struct.pack( '<BIII', 1, ogr.wkbPolygon, 1, k + 1 )
+        return [ header + coords[ i ].astype('<f8').tobytes() for i in range( n ) ]
+
+    def getAlerts(self, total):
+        """
+        Yield { 'objectid', 'tipo', 'estagio', 'data_imagem', 'wkb' }, sorted by cluster
+        """
+        minX, maxX, minY, maxY = AlertSynthetic.extent
+        objectid = 0
+        while objectid < total:
+            size = min( int( self.rng.geometric( 1.0 / AlertSynthetic.meanCluster ) ), total - objectid )
+            center = ( self.rng.uniform( minX, maxX ), self.rng.uniform( minY, maxY ) )
+            areaHa = self.rng.lognormal( np.log( AlertSynthetic.medianHa ), AlertSynthetic.sigmaHa, size )
+            centers = self._getCenters( center, areaHa )
+            days = self._getDays( size )
+            wkbs = self._getWkbPolygons( centers, areaHa )
+            types = self._choice( AlertSynthetic.types, size )
+            stages = self._choice( AlertSynthetic.stages, size )
+            seconds = self.rng.integers( 36000, 57600, size ) # Time of image, 10h - 16h
+            for i in range( size ):
+                objectid += 1
+                dt = date.fromordinal( int( days[ i ] ) )
+                time = timedelta( seconds=int( seconds[ i ] ) )
+                yield {
+                    'objectid': objectid,
+                    'tipo': types[ i ],
+                    'estagio': stages[ i ],
+                    'data_imagem': "{} {}".format( dt.strftime('%Y/%m/%d'), str( time ).zfill( 8 ) ),
+                    'wkb': wkbs[ i ]
+                }
+
+    def write(self, path, total, driverName='GPKG'):
+        """
+        Write 'total' alerts in layer 'nameLayer' of new datasource 'path'.
+        data_imagem is string 'YYYY/MM/DD HH:MM:SS' (AggregatorParams.getDate), without time zone of driver.
+        Return { 'isOk', 'total' }
+        """
+        driver = ogr.GetDriverByName( driverName )
+        if driver is None:
+            return { 'isOk': False, 'message': f"Missing driver '{driverName}'" }
+        ds = driver.CreateDataSource( path )
+        if ds is None:
+            return { 'isOk': False, 'message': f"The datasource '{path}' not be created" }
+        layer = ds.CreateLayer( AlertSynthetic.nameLayer, srs=AlertSynthetic.getSrs(), geom_type=ogr.wkbPolygon )
+        fields = (
+            ( 'objectid', ogr.OFTInteger64, None ),
+            ( 'tipo', ogr.OFTString, 50 ),
+            ( 'estagio', ogr.OFTString, 50 ),
+            ( 'data_imagem', ogr.OFTString, 19 )
+        )
+        for name, fieldType, width in fields:
+            f = ogr.FieldDefn( name, fieldType )
+            if not width is None:
+                f.SetWidth( width )
+            layer.CreateField( f )
+        defn = layer.GetLayerDefn()
+        totalBatch = 0
+        layer.StartTransaction()
+        for item in self.getAlerts( total ):
+            feat = ogr.Feature( defn )
+            for name, fieldType, width in fields:
+                feat.SetField( name, item[ name ] )
+            feat.SetGeometry( ogr.CreateGeometryFromWkb( item['wkb'] ) )
+            layer.CreateFeature( feat )
+            feat = None
+            totalBatch += 1
+            if totalBatch % AlertSynthetic.sizeBatch == 0:
+                layer.CommitTransaction()
+                layer.StartTransaction()
+        layer.CommitTransaction()
+        layer = None
+        ds = None
+        return { 'isOk': True, 'total': totalBatch }
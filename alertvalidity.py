@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Alert Validity
+Description          : Cache of validity and in country of alerts (SQLite)
+                       -------------------
+Begin                : 2026-10-16
+Copyright            : (C) 2026 by IBAMA
+email                : motta dot luiz at gmail.com
+
+Update: 2026-10-16
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import sqlite3, hashlib
+
+from aggregatormetrics import Metrics
+from aggregatorgroup import PreparedGeometry
+
+class AlertValidity():
+    """
+    Same predicates of SQL of alerts, ST_IsValid( a.geom ) and ST_Intersects( a.geom, country ),
+    cached by objectid in SQLite file.
+    The value of cache is used only if the geometry (hash of WKB) not changed,
+    otherwise the predicates are evaluated (GEOS) and the cache is updated.
+    """
+    sizeBatch = 10000 # Rows by commit
+
+    def __init__(self, path, country):
+        """
+        country: geometry of country (same CRS of alerts), None for only validity
+        """
+        self.conn = sqlite3.connect( path )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS alert_validity ( objectid INTEGER PRIMARY KEY, geom_hash TEXT, is_valid INTEGER, in_country INTEGER )"
+        )
+        self.country = None if country is None else PreparedGeometry( country, 'intersects_country' )
+        self.rows = [] # Not saved
+        self.totalCache = 0
+        self.totalEvaluated = 0
+
+    def isAlertOk(self, objectid, geometry):
+        """
+        Return True if the alert is valid and in country
+        """
+        if geometry is None: # NULL geometry, as ST_IsValid( NULL ) in SQL
+            return False
+        geomHash = hashlib.sha1( geometry.ExportToWkb() ).hexdigest()
+        sql = "SELECT geom_hash, is_valid, in_country FROM alert_validity WHERE objectid = ?"
+        row = self.conn.execute( sql, ( objectid, ) ).fetchone()
+        if not row is None and row[0] == geomHash:
+            self.totalCache += 1
+            return bool( row[1] ) and bool( row[2] )
+        self.totalEvaluated += 1
+        isValid = geometry.IsValid()
+        inCountry = isValid and ( self.country is None or self.country.intersects( geometry ) )
+        self.rows.append( ( objectid, geomHash, int( isValid ), int( inCountry ) ) )
+        if len( self.rows ) >= AlertValidity.sizeBatch:
+            self.flush()
+        return isValid and inCountry
+
+    def flush(self):
+        if len( self.rows ) == 0:
+            return
+        sql = "INSERT OR REPLACE INTO alert_validity VALUES ( ?, ?, ?, ? )"
+        self.conn.executemany( sql, self.rows )
+        self.conn.commit()
+        self.rows = []
+
+    def close(self):
+        """
+        Save the evaluated alerts and return the summary
+        """
+        self.flush()
+        self.conn.close()
+        Metrics.addCount( 'validity_cache', self.totalCache )
+        Metrics.addCount( 'validity_evaluated', self.totalEvaluated )
+        args = ( self.totalCache, self.totalEvaluated )
+        return { 'message': "Validity of alerts: {} from cache, {} evaluated".format( *args ) }
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Test Aggregator Polygons Date
+Description          : Candidates of update in server (AggregatorGroupPG)
+                       -------------------
+Begin                : 2026-10-17
+Copyright            : (C) 2026 by IBAMA
+email                : motta dot luiz at gmail.com
+
+Update: 2026-10-17
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Run: python -m pytest test_aggregator_polygons_date.py
+"""
+
+import pytest
+
+pytest.importorskip('osgeo')
+
+from aggregator_polygons_date import AggregatorGroupPG
+
+def test_fids_server_dates():
+    """
+    Existing group outside dates is candidate only if changed (merged)
+    """
+    candidates = { 101: [ ( 'e', 10, False ), ( 'e', 11, True ) ] }
+    assert AggregatorGroupPG.getFidsServer( 101, candidates, {}, {} ) == [ 11 ]
+    assert AggregatorGroupPG.getFidsServer( 101, candidates, {}, { 10: 20 } ) == [ 11, 20 ]
+    assert AggregatorGroupPG.getFidsServer( 102, candidates, {}, {} ) == []
+
+def test_fids_server_merged():
+    """
+    The merged groups are redirected to the current group (chain of merges), without repetition
+    """
+    candidates = {
+        103: [ ( 'e', 10, True ), ( 'e', 11, True ), ( 'n', 101, True ), ( 'n', 102, False ) ]
+    }
+    fidsSaved = { 101: 20, 102: 21 } # New groups 101 and 102
+    fidsMerged = { 10: 20, 20: 21 } # 101 merged 10, 102 merged 101
+    assert AggregatorGroupPG.getFidsServer( 103, candidates, fidsSaved, fidsMerged ) == [ 11, 21 ]
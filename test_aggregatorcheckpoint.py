@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Test Aggregator Checkpoint
+Description          : Resume of create from checkpoint against an uninterrupted run
+                       -------------------
+Begin                : 2026-10-17
+Copyright            : (C) 2026 by IBAMA
+email                : motta dot luiz at gmail.com
+
+Update: 2026-10-17
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Run: python -m pytest test_aggregatorcheckpoint.py
+The checkpoint is saved after 'totalCheckpoint' groups (AggregatorGroupPG.getCheckpointState),
+the resume (AggregatorGroupPG.setResume) starts with new alerts in memory, as a new process.
+"""
+
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('osgeo')
+
+from osgeo import ogr
+
+from alertstore import AlertStore
+from alertsynthetic import AlertSynthetic
+from aggregatorcheckpoint import Checkpoint
+from aggregatorgroup import ItemInvalidUnion, AggregatorParams, AggregatorGroup, EngineGroup, ChainPolygons
+from aggregator_polygons_date import AggregatorGroupPG
+
+totalAlerts = 400
+seed = 2
+totalCheckpoint = 50
+
+def setStore(total=totalAlerts):
+    AggregatorParams.setParamsSrs( AlertSynthetic.getSrs() )
+    store = AlertStore()
+    for item in AlertSynthetic( seed ).getAlerts( total ):
+        geom = ogr.CreateGeometryFromWkb( item['wkb'] )
+        geom.Transform( AggregatorParams.ctArea )
+        store.add( item['objectid'], AggregatorParams.getDate( item['data_imagem'] ), item['tipo'], item['estagio'], geom )
+    store.finish()
+    AggregatorParams.setAlertStore( store )
+
+def getValues(group):
+    objectids, days = group.pop('members')
+    group['members'] = sorted( zip( objectids.tolist(), days.tolist() ) )
+    group['geometry'] = group['geometry'].ExportToWkt()
+    return group
+
+def saveCheckpoint(path, engine):
+    """
+    Create 'totalCheckpoint' groups and save the checkpoint, the others groups are not created (crash)
+    """
+    setStore()
+    AggregatorGroup.init( AlertSynthetic.nameLayer, engine )
+    groups = AggregatorGroup.createGroups()
+    for totalNewGroup in range( 1, totalCheckpoint + 1 ):
+        next( groups )
+    Checkpoint.save( path, AggregatorGroupPG.getCheckpointState( totalNewGroup ) )
+
+@pytest.fixture(autouse=True)
+def restoreParams(monkeypatch):
+    monkeypatch.setattr( AggregatorGroupPG, 'dtInit', datetime( 2026, 1, 1 ) )
+    yield
+    AggregatorParams.clearAlert()
+    ChainPolygons.invalidUnions.clear()
+
+@pytest.mark.parametrize( 'engine', list( EngineGroup ) )
+def test_resume_same_groups(tmp_path, engine):
+    path = str( tmp_path / 'checkpoint.npz' )
+    setStore()
+    AggregatorGroup.init( AlertSynthetic.nameLayer, engine )
+    groupsFull = [ getValues( g ) for g in AggregatorGroup.createGroups() ]
+    assert len( groupsFull ) > totalCheckpoint
+
+    saveCheckpoint( path, engine )
+    setStore() # New process
+    AggregatorGroup.init( AlertSynthetic.nameLayer, engine )
+    r = AggregatorGroupPG.setResume( path )
+    assert r['isOk'], r.get('message')
+    assert r['totalNewGroup'] == totalCheckpoint
+    groupsResume = [ getValues( g ) for g in AggregatorGroup.createGroups( r['totalNewGroup'] ) ]
+    assert groupsResume == groupsFull[ totalCheckpoint: ]
+
+def test_resume_other_engine(tmp_path):
+    path = str( tmp_path / 'checkpoint.npz' )
+    saveCheckpoint( path, EngineGroup.COMPONENTS )
+    setStore()
+    AggregatorGroup.init( AlertSynthetic.nameLayer, EngineGroup.CHAIN )
+    r = AggregatorGroupPG.setResume( path )
+    assert not r['isOk']
+    assert 'engine' in r['message']
+
+def test_resume_other_alerts(tmp_path):
+    path = str( tmp_path / 'checkpoint.npz' )
+    saveCheckpoint( path, EngineGroup.CHAIN )
+    setStore( totalAlerts - 1 )
+    AggregatorGroup.init( AlertSynthetic.nameLayer, EngineGroup.CHAIN )
+    r = AggregatorGroupPG.setResume( path )
+    assert not r['isOk']
+    assert 'other alerts' in r['message']
+
+def test_resume_missing(tmp_path):
+    r = AggregatorGroupPG.setResume( str( tmp_path / 'missing.npz' ) )
+    assert not r['isOk']
+
+def test_checkpoint_invalid_unions(tmp_path):
+    path = str( tmp_path / 'checkpoint.npz' )
+    setStore()
+    AggregatorParams.alertDeleted[:10] = True
+    geom = ogr.CreateGeometryFromWkt( 'POLYGON ((0 0, 1 0, 1 1, 0 1, 0 0))' )
+    ChainPolygons.invalidUnions.append( ItemInvalidUnion( 1, 'objectid', 'Union is not Valid', geom ).getItem() )
+    state = AggregatorGroupPG.getCheckpointState( 1 )
+    Checkpoint.save( path, state )
+    r = Checkpoint.load( path )
+    assert r['isOk']
+    stateLoad = r['state']
+    assert ( stateLoad['alertDeleted'] == state['alertDeleted'] ).all()
+    for k in ( 'totalNewGroup', 'fingerprint', 'engine', 'dtInit' ):
+        assert stateLoad[ k ] == state[ k ]
+    item = stateLoad['invalidUnions'][0]
+    assert { k: v for k, v in item.items() if k != 'geometry' } == { k: v for k, v in state['invalidUnions'][0].items() if k != 'geometry' }
+    assert item['geometry'].GetArea() == pytest.approx( 1.0 )
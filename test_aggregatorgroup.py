@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Test Aggregator Group
+Description          : Parity of engines of groups (chain and components)
+                       -------------------
+Begin                : 2026-10-16
+Copyright            : (C) 2026 by IBAMA
+email                : motta dot luiz at gmail.com
+
+Update: 2026-10-16
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Run: python -m pytest test_aggregatorgroup.py
+The engines differ by window of dates (ComponentPolygons):
+ - without limit of window, same groups;
+ - with window (relMonth), the chain engine (default) grows the window with the group.
+The parallel create (AggregatorParallel, --workers) has the groups of components engine,
+not of chain engine.
+"""
+
+from datetime import date
+from dateutil.relativedelta import relativedelta
+
+import pytest
+
+pytest.importorskip('osgeo')
+
+from osgeo import ogr
+
+from alertstore import AlertStore
+from alertsynthetic import AlertSynthetic
+from aggregatorgroup import AggregatorParams, AggregatorGroup, EngineGroup
+from aggregatorparallel import AggregatorParallel
+
+totalAlerts = 400
+seed = 1
+
+def setStore(alerts):
+    """
+    alerts: { 'objectid', 'tipo', 'estagio', 'data_imagem', 'wkb' } in CRS of AlertSynthetic
+    """
+    AggregatorParams.setParamsSrs( AlertSynthetic.getSrs() )
+    store = AlertStore()
+    for item in alerts:
+        geom = ogr.CreateGeometryFromWkb( item['wkb'] )
+        geom.Transform( AggregatorParams.ctArea )
+        store.add( item['objectid'], AggregatorParams.getDate( item['data_imagem'] ), item['tipo'], item['estagio'], geom )
+    store.finish()
+    AggregatorParams.setAlertStore( store )
+
+def getGroups(engine, workers=1):
+    """
+    Groups of all alerts, the geometry by its area
+    """
+    AggregatorParams.setAlertStore( AggregatorParams.alertStore ) # Alerts not in group
+    AggregatorGroup.init( AlertSynthetic.nameLayer, engine )
+    if workers > 1:
+        AggregatorParallel.workers = workers
+        groups = AggregatorParallel.createGroups()
+    else:
+        groups = AggregatorGroup.createGroups()
+    items = []
+    for group in groups:
+        objectids, days = group.pop('members')
+        group['members'] = sorted( zip( objectids.tolist(), days.tolist() ) )
+        group['geometry'] = group['geometry'].GetArea()
+        items.append( group )
+    return items
+
+def assertSameGroups(groups, other):
+    def getValues(group):
+        return { k: v for k, v in group.items() if not k in ( 'end_ha', 'geometry' ) }
+
+    assert [ getValues( g ) for g in groups ] == [ getValues( g ) for g in other ]
+    for name in ( 'end_ha', 'geometry' ):
+        assert [ g[ name ] for g in groups ] == pytest.approx( [ g[ name ] for g in other ], rel=1e-6 )
+
+def getSquare(objectid, day, minX):
+    """
+    Alert of 100 x 100 meters (metric CRS of AggregatorParams)
+    """
+    ring = ogr.Geometry( ogr.wkbLinearRing )
+    for x, y in ( ( minX, 0 ), ( minX + 100, 0 ), ( minX + 100, 100 ), ( minX, 100 ), ( minX, 0 ) ):
+        ring.AddPoint_2D( x, y )
+    geom = ogr.Geometry( ogr.wkbPolygon )
+    geom.AddGeometry( ring )
+    geom.Transform( AggregatorParams.ctOrigin )
+    return {
+        'objectid': objectid,
+        'tipo': 'DESMATAMENTO',
+        'estagio': 'CR',
+        'data_imagem': day.strftime('%Y/%m/%d 12:00:00'),
+        'wkb': geom.ExportToWkb()
+    }
+
+@pytest.fixture(autouse=True)
+def restoreParams(monkeypatch):
+    monkeypatch.setattr( AggregatorParams, 'relMonth', AggregatorParams.relMonth )
+    monkeypatch.setattr( AggregatorParallel, 'workers', AggregatorParallel.workers )
+    yield
+    AggregatorParams.clearAlert()
+
+def test_same_groups_without_window():
+    AggregatorParams.relMonth = relativedelta( years=100 )
+    setStore( AlertSynthetic( seed ).getAlerts( totalAlerts ) )
+    groupsChain = getGroups( EngineGroup.CHAIN )
+    groupsComponents = getGroups( EngineGroup.COMPONENTS )
+    assert len( groupsChain ) < totalAlerts
+    assertSameGroups( groupsChain, groupsComponents )
+
+def test_members_with_window():
+    """
+    Each alert is member of one group, in both engines
+    """
+    setStore( AlertSynthetic( seed ).getAlerts( totalAlerts ) )
+    for engine in EngineGroup:
+        groups = getGroups( engine )
+        objectids = sorted( objectid for g in groups for objectid, day in g['members'] )
+        assert objectids == list( range( 1, totalAlerts + 1 ) )
+        assert sum( g['n_fids'] for g in groups ) == totalAlerts
+
+def test_window_of_group():
+    """
+    A (January) and B (June) neighbours, C (September) neighbour only of A (8 months)
+    """
+    AggregatorParams.setParamsSrs( AlertSynthetic.getSrs() )
+    alerts = [
+        getSquare( 1, date( 2020, 1, 1 ), 0 ),
+        getSquare( 2, date( 2020, 6, 1 ), 100 ),
+        getSquare( 3, date( 2020, 9, 1 ), -100 )
+    ]
+    setStore( alerts )
+    groupsChain = getGroups( EngineGroup.CHAIN )
+    assert [ g['fids'] for g in groupsChain ] == [ '1,2,3' ]
+    groupsComponents = getGroups( EngineGroup.COMPONENTS )
+    assert [ g['fids'] for g in groupsComponents ] == [ '1,2', '3' ]
+
+def test_parallel_components():
+    setStore( AlertSynthetic( seed ).getAlerts( totalAlerts ) )
+    groupsComponents = getGroups( EngineGroup.COMPONENTS )
+    groupsParallel = getGroups( EngineGroup.COMPONENTS, workers=2 )
+    assertSameGroups( groupsComponents, groupsParallel )
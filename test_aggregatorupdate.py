@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Test Aggregator Update
+Description          : Parallel update (batches of independent groups) against serial update
+                       -------------------
+Begin                : 2026-10-17
+Copyright            : (C) 2026 by IBAMA
+email                : motta dot luiz at gmail.com
+
+Update: 2026-10-17
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Run: python -m pytest test_aggregatorupdate.py
+The alerts with odd objectid are the groups of table, with even objectid are the new groups,
+in the same clusters and dates (overlapping groups).
+"""
+
+import pytest
+
+pytest.importorskip('osgeo')
+
+from osgeo import ogr
+
+from alertstore import AlertStore
+from alertsynthetic import AlertSynthetic
+from aggregatorgroup import AggregatorParams, AggregatorGroup, EngineGroup
+from aggregatorupdate import AggregatorUpdate
+from aggregator_polygons_date import AggregatorGroupPG
+
+totalAlerts = 600
+seed = 3
+typeFid = 'id_group from test.'
+
+def setStore(alerts):
+    AggregatorParams.setParamsSrs( AlertSynthetic.getSrs() )
+    store = AlertStore()
+    for item in alerts:
+        geom = ogr.CreateGeometryFromWkb( item['wkb'] )
+        geom.Transform( AggregatorParams.ctArea )
+        store.add( item['objectid'], AggregatorParams.getDate( item['data_imagem'] ), item['tipo'], item['estagio'], geom )
+    store.finish()
+    AggregatorParams.setAlertStore( store )
+
+def getAlerts(isTable):
+    for item in AlertSynthetic( seed ).getAlerts( totalAlerts ):
+        if ( item['objectid'] % 2 == 1 ) == isTable:
+            yield item
+
+def getGroups(isTable, idGroupLast=0):
+    setStore( getAlerts( isTable ) )
+    AggregatorGroup.init( AlertSynthetic.nameLayer, EngineGroup.CHAIN )
+    groups = []
+    for id, group in enumerate( AggregatorGroup.createGroups(), 1 ):
+        group.pop('members')
+        group['id_group'] = idGroupLast + id
+        groups.append( group )
+    return groups
+
+def addGroup(layer, group):
+    feat = AggregatorUpdate.createFeature( layer.GetLayerDefn(), group, group['geometry'], -1 )
+    layer.CreateFeature( feat )
+
+def getLayer():
+    """
+    Aggregated table (memory) with the groups of alerts with odd objectid
+    """
+    ds = ogr.GetDriverByName('Memory').CreateDataSource('aggregated')
+    layer = ds.CreateLayer( 'aggregated', srs=AlertSynthetic.getSrs(), geom_type=ogr.wkbMultiPolygon )
+    for item in AggregatorGroupPG.getFieldsAggregated():
+        layer.CreateField( ogr.FieldDefn( item['name'], item['type'] ) )
+    groups = getGroups( True )
+    for group in groups:
+        addGroup( layer, group )
+    return ds, layer, len( groups )
+
+def getFeatures(layer):
+    """
+    Groups of table by id_group, the geometry by its area
+    """
+    items = []
+    for feat in layer:
+        values = { item['name']: feat.GetField( item['name'] ) for item in AggregatorGroupPG.getFieldsAggregated() }
+        values['area'] = feat.GetGeometryRef().GetArea()
+        items.append( values )
+    layer.ResetReading()
+    return sorted( items, key=lambda item: item['id_group'] )
+
+def getMerges(merges):
+    return sorted( ( idGroup, sorted( idsMerged ) ) for idGroup, idsMerged in merges )
+
+def updateSerial():
+    """
+    Same of AggregatorGroupPG.updateGroups (workers 1, spatial filter)
+    """
+    ds, layer, totalGroup = getLayer()
+    totalDelete, merges = 0, []
+    for group in getGroups( False, totalGroup ):
+        feats = AggregatorUpdate.getFeaturesFilter( layer, group )
+        fids = AggregatorUpdate.mergeGroup( group, feats, layer.DeleteFeature, typeFid )
+        totalDelete += len( fids )
+        if len( fids ) > 0:
+            idsGroup = { feat.GetFID(): feat['id_group'] for feat in feats }
+            merges.append( ( group['id_group'], [ idsGroup[ fid ] for fid in fids ] ) )
+        addGroup( layer, group )
+    return getFeatures( layer ), totalDelete, getMerges( merges )
+
+def updateParallel():
+    """
+    Same of AggregatorGroupPG.updateGroups (workers > 1)
+    """
+    ds, layer, totalGroup = getLayer()
+    totalDelete, merges = 0, []
+    groups = getGroups( False, totalGroup )
+    for r in AggregatorUpdate.mergeGroups( groups, layer, AggregatorGroupPG.getFieldsAggregated(), typeFid ):
+        for fid in r['fidsDeleted']:
+            layer.DeleteFeature( fid )
+        for group in r['groups']:
+            addGroup( layer, group )
+        totalDelete += r['totalDelete']
+        merges.extend( r['merges'] )
+    return getFeatures( layer ), totalDelete, getMerges( merges )
+
+@pytest.fixture(autouse=True)
+def restoreParams(monkeypatch):
+    monkeypatch.setattr( AggregatorUpdate, 'workers', 2 )
+    monkeypatch.setattr( AggregatorUpdate, 'sizeBatch', 4 ) # Many batches
+    yield
+    AggregatorParams.clearAlert()
+
+def test_parallel_same_of_serial():
+    ( featsSerial, totalDeleteSerial, mergesSerial ) = updateSerial()
+    ( featsParallel, totalDeleteParallel, mergesParallel ) = updateParallel()
+    assert totalDeleteSerial > 0 and len( mergesSerial ) > 0 # Overlapping new groups
+    assert totalDeleteParallel == totalDeleteSerial
+    assert mergesParallel == mergesSerial
+
+    def getValues(feat):
+        return { k: v for k, v in feat.items() if not k in ( 'end_ha', 'area' ) }
+
+    assert [ getValues( f ) for f in featsParallel ] == [ getValues( f ) for f in featsSerial ]
+    for name in ( 'end_ha', 'area' ):
+        assert [ f[ name ] for f in featsParallel ] == pytest.approx( [ f[ name ] for f in featsSerial ], rel=1e-6 )